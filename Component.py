@@ -1,8 +1,8 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
-import numpy as np
-from GraphBasedSegment import *
+from array import array
+
+from GraphBasedSegment import Pixel
 
 '''
 Preserve pixel, ids of the component.
@@ -121,6 +121,13 @@ class MergedComponent:
   def get_pixel_list(self):
     return self.pixel_list
 
+  '''
+  Get elements of pixels.
+  @return list((int, int)) : (row, col) of pixels
+  '''
+  def get_elem_list(self):
+    return [pixel.get_elem() for pixel in self.pixel_list]
+
   '''
   Get pixel number size.
   @return int : size
@@ -185,3 +192,160 @@ class MergedComponentList:
     for k, v in self.mc_dict.items():
       print("{0} : {1}".format(k, v))
     print("--- list of components ---")
+
+
+'''
+View of a merged component in CompactMergedComponentList.
+Created on access, values are kept in the typed arrays of the list.
+'''
+class CompactMergedComponent:
+  __slots__ = ('mcl', 'id')
+
+  '''
+  Initialize with the list and component id.
+  @param mcl : CompactMergedComponentList
+  @param id  : component id
+  '''
+  def __init__(self, mcl, id):
+    self.mcl = mcl
+    self.id = id
+
+  '''
+  Get internal difference of the merged component.
+  Internal difference is defined as 
+  Max Value - Min Value
+  @return int : Internal difference
+  '''
+  def get_internal_diff(self):
+    return self.mcl.pixel_max[self.id] - self.mcl.pixel_min[self.id]
+
+  '''
+  Get max value pixel.
+  @return int : max value pixel
+  '''
+  def get_max(self):
+    return self.mcl.pixel_max[self.id]
+
+  '''
+  Get min value pixel.
+  @return int : min value pixel
+  '''
+  def get_min(self):
+    return self.mcl.pixel_min[self.id]
+
+  '''
+  Get pixel number size.
+  @return int : size
+  '''
+  def get_size(self):
+    return self.mcl.size[self.id]
+
+  '''
+  Get ids of pixels.
+  @return list(int) : pixel ids (img_col * row + col)
+  '''
+  def get_pixel_ids(self):
+    return self.mcl.get_pixel_ids(self.id)
+
+  '''
+  Get elements of pixels.
+  @return list((int, int)) : (row, col) of pixels
+  '''
+  def get_elem_list(self):
+    return [divmod(pixel_id, self.mcl.img_col) for pixel_id in self.get_pixel_ids()]
+
+
+'''
+Merged component list in compact mode.
+Size, max and min of components are kept in typed arrays indexed by component id,
+and pixels of a component are a linked list in a typed array (next pixel id of each pixel),
+so a merge is O(1) and no Pixel, Component or MergedComponent object is kept.
+Component id must be less than the size of the list.
+'''
+class CompactMergedComponentList:
+
+  '''
+  Initialize with empty components.
+  @param size    : number of pixels (row * col)
+  @param img_col : number of columns of the image
+  '''
+  def __init__(self, size, img_col):
+    self.img_col = img_col
+    self.size = array('q', [0]) * size
+    self.pixel_max = array('d', [0.0]) * size
+    self.pixel_min = array('d', [0.0]) * size
+    self.head = array('q', [-1]) * size
+    self.tail = array('q', [-1]) * size
+    self.next = array('q', [-1]) * size
+
+  '''
+  Add a pixel as new component.
+  @param id       : component id
+  @param pixel_id : id of the pixel
+  @param value    : value (luminance) of the pixel
+  '''
+  def add_pixel_id(self, id, pixel_id, value):
+    self.size[id] = 1
+    self.pixel_max[id] = value
+    self.pixel_min[id] = value
+    self.head[id] = pixel_id
+    self.tail[id] = pixel_id
+    self.next[pixel_id] = -1
+
+  '''
+  Get all merged components.
+  @return dict(int, CompactMergedComponent) : all merged component dict
+  '''
+  def get_mc_dict(self):
+    return dict((id, CompactMergedComponent(self, id)) for id in range(len(self.size)) if self.size[id] > 0)
+
+  '''
+  Merge pixels of from_id to pixels of to_id
+  @param from_id : Edge of this id will be changed to to_id
+  @param to_id   : Edge of from_id will be changed to this id
+  '''
+  def merge(self, from_id, to_id):
+    # Link pixels in O(1)
+    self.next[self.tail[to_id]] = self.head[from_id]
+    self.tail[to_id] = self.tail[from_id]
+    self.size[to_id] += self.size[from_id]
+    self.size[from_id] = 0
+    # update max
+    if self.pixel_max[to_id] < self.pixel_max[from_id]:
+      self.pixel_max[to_id] = self.pixel_max[from_id]
+    # update min
+    if self.pixel_min[to_id] > self.pixel_min[from_id]:
+      self.pixel_min[to_id] = self.pixel_min[from_id]
+
+  '''
+  Get the specified merged component
+  @param search_id : id of the component to search
+  @return CompactMergedComponent : specified merged component
+          None if id of the component does not exist
+  '''
+  def get_merged_component(self, search_id):
+    if 0 <= search_id < len(self.size) and self.size[search_id] > 0:
+      return CompactMergedComponent(self, search_id)
+    return None
+
+  '''
+  Get ids of pixels of a component.
+  @param id : component id
+  @return list(int) : pixel ids
+  '''
+  def get_pixel_ids(self, id):
+    ids = list()
+    pixel_id = self.head[id] if self.size[id] > 0 else -1
+    while pixel_id >= 0:
+      ids.append(pixel_id)
+      pixel_id = self.next[pixel_id]
+    return ids
+
+  '''
+  Print list of components
+  '''
+  def print_list(self):
+    print("--- list of components ---")
+    for k, v in self.get_mc_dict().items():
+      print("{0} : {1}".format(k, v.get_pixel_ids()))
+    print("--- list of components ---")
@@ -1,8 +1,8 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
 import numpy as np
 import MakeColor as mcolor
+import ResultFormat as rfmt
 
 '''
 Make monocolor segmented image
@@ -19,13 +19,13 @@ def create_monocolor_result(img, mcl, name):
   for seg_id, mc in mc_dict.items():
     print("segment : {0}".format(iter))
     mono_value = iter * 255 / mcl_len
-    for pixel in mc.get_pixel_list():
-      elem = pixel.get_elem()
+    for elem in mc.get_elem_list():
       segmented_image[elem[0], elem[1]] = mono_value
       print("{0}, {1}".format(elem[0], elem[1]))
     print("=============================")
     iter += 1
 
+  from PIL import Image
   img_raw = Image.fromarray(segmented_image, 'L')
   img_raw.save(name)
 
@@ -34,28 +34,36 @@ Make rgb color segmented image with top n area segment.
 @param img  : source image
 @param mcl  : merged component list
 @param n    : colorize top n are segment
-@param name : result image file name
+@param name : result image file name (None not to save)
+@param result_format  : rgb, palette or npy (see ResultFormat)
+@param compress_level : zlib level of PNG (None for PIL default)
+@return numpy.ndarray : segmented image (row, col, 3), palette index image or label map (row, col)
 '''
-def create_colorized_result(img, mcl, n, name):
-  segmented_image = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
+def create_colorized_result(img, mcl, n, name, result_format='rgb', compress_level=None):
+  rfmt.check_result_format(result_format, n)
+  # Colors are shared by results with the same n
+  palette = mcolor.get_palette(n)
+  index_image = rfmt.create_index_image(img.shape[:2], n)
+  label_image = np.zeros(img.shape[:2], dtype=np.int32) if result_format == 'npy' else None
   mc_dict = mcl.get_mc_dict()
   # n can not be over size of mc_dict
   mcl_len = len(mc_dict)
   n = min(n, mcl_len)
   # Get top n of sorted dict 
   sorted_mc_dict = sorted(mc_dict.items(), key=lambda x:x[1].get_size(), reverse=True)[:n]
-  # Create n colors
-  colors = mcolor.create_random_colors(n)
   # Apply a color to each component
-  for mc_item, color in zip(sorted_mc_dict, colors):
-    seg_id = mc_item[0]
+  for color_index, mc_item in enumerate(sorted_mc_dict, 1):
     mc = mc_item[1]
-    print("Size : {0}, color : {1}".format(mc.get_size(), color))
-    for pixel in mc.get_pixel_list():
-      elem = pixel.get_elem()
-      segmented_image[elem[0], elem[1], 0] = color[0]
-      segmented_image[elem[0], elem[1], 1] = color[1]
-      segmented_image[elem[0], elem[1], 2] = color[2]
+    print("Size : {0}, color : {1}".format(mc.get_size(), tuple(palette[color_index].tolist())))
+    for elem in mc.get_elem_list():
+      index_image[elem[0], elem[1]] = color_index
+  # Label all components
+  if label_image is not None:
+    for seg_id, mc in mc_dict.items():
+      for elem in mc.get_elem_list():
+        label_image[elem[0], elem[1]] = seg_id
 
-  img_raw = Image.fromarray(segmented_image)
-  img_raw.save(name)
+  segmented_image = rfmt.convert_result(index_image, label_image, palette, result_format)
+  if name is not None:
+    rfmt.save_result(segmented_image, name, result_format, palette, compress_level)
+  return segmented_image
@@ -0,0 +1,676 @@
+# -*- coding:utf-8 -*-
+
+import collections
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+import zlib
+
+from ImageLoader import load_image
+from ParameterExceptions import InvalidParameterException
+from PipelineRunner import StageStats, END_OF_JOBS
+import ResultFormat as rfmt
+
+'''
+Batch segmentation over several hosts with a shared work queue.
+Workers claim one job at a time with a lease, renew the lease while segmenting,
+and commit the job after its result is in place.
+  FileWorkQueue : queue directory on a shared filesystem
+                    jobs.json       : list of (source path, destination path)
+                    leases/N.lease  : created exclusively by the claiming worker, renewed by its mtime
+                    done/N.json     : commit of job N
+  TCPWorkQueue  : client of WorkQueueServer run by the coordinator
+A lease not renewed for lease_seconds is expired and taken over by another worker,
+so jobs of crashed workers are done again. Results are written to a temporary file
+and renamed to the destination, so a job committed twice (by a worker whose lease
+expired) leaves one complete result.
+Workers of FileWorkQueue start scanning at different jobs and go on to the jobs
+of others when theirs are done, so idle workers take remaining work.
+'''
+
+'''
+Seconds without renewal to expire a lease
+'''
+LEASE_SECONDS = 60.0
+
+'''
+Seconds to wait for leased jobs before claiming again
+'''
+POLL_SECONDS = 0.5
+
+'''
+Returned by claim when remaining jobs are leased by other workers
+'''
+WAIT_FOR_LEASES = 'wait'
+
+'''
+Get default worker name.
+@return str : host name and process id
+'''
+def get_worker_name():
+  return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+'''
+Write json file atomically with a temporary file of the writer.
+@param file   : file path
+@param value  : json value
+@param worker : worker name
+'''
+def write_json(file, value, worker):
+  temp = '{0}.{1}.tmp'.format(file, worker)
+  with open(temp, 'w') as f:
+    json.dump(value, f)
+  os.replace(temp, file)
+
+'''
+Get temporary path of a result keeping its extension, which selects the format to save.
+@param dst    : destination path
+@param worker : worker name
+@return str : temporary path in the same directory
+'''
+def get_temporary_path(dst, worker):
+  root, ext = os.path.splitext(dst)
+  return '{0}.part-{1}{2}'.format(root, worker, ext)
+
+
+'''
+Create a queue directory on a shared filesystem.
+Creating it again with the same jobs keeps the progress.
+@param path : queue directory
+@param jobs : list of (source path, destination path)
+@param lease_seconds : seconds without renewal to expire a lease
+@return FileWorkQueue : queue
+'''
+def create_file_queue(path, jobs, lease_seconds=LEASE_SECONDS):
+  jobs = [list(job) for job in jobs]
+  os.makedirs(os.path.join(path, 'leases'), exist_ok=True)
+  os.makedirs(os.path.join(path, 'done'), exist_ok=True)
+  file = os.path.join(path, 'jobs.json')
+  if os.path.exists(file):
+    with open(file) as f:
+      if json.load(f) != jobs:
+        raise InvalidParameterException()
+  else:
+    write_json(file, jobs, get_worker_name())
+  return FileWorkQueue(path, lease_seconds)
+
+'''
+Work queue in a directory on a shared filesystem.
+'''
+class FileWorkQueue:
+
+  '''
+  Open a queue created by create_file_queue.
+  @param path          : queue directory
+  @param lease_seconds : seconds without renewal to expire a lease
+  '''
+  def __init__(self, path, lease_seconds=LEASE_SECONDS):
+    file = os.path.join(path, 'jobs.json')
+    if not os.path.exists(file):
+      raise InvalidParameterException()
+    with open(file) as f:
+      self.jobs = [tuple(job) for job in json.load(f)]
+    self.path = path
+    self.lease_seconds = lease_seconds
+    # Done jobs are never leased again
+    self.finished = set()
+    self.cursor = None
+
+  '''
+  Get lease file of a job.
+  @param number : job number
+  @return str : path
+  '''
+  def get_lease_file(self, number):
+    return os.path.join(self.path, 'leases', '{0}.lease'.format(number))
+
+  '''
+  Get commit file of a job.
+  @param number : job number
+  @return str : path
+  '''
+  def get_done_file(self, number):
+    return os.path.join(self.path, 'done', '{0}.json'.format(number))
+
+  '''
+  Get seconds without renewal to expire a lease.
+  @return float : seconds
+  '''
+  def get_lease_seconds(self):
+    return self.lease_seconds
+
+  '''
+  Get if a lease is expired.
+  @param lease : lease file
+  @return bool : True if not renewed for lease_seconds
+  '''
+  def is_expired(self, lease):
+    try:
+      return os.stat(lease).st_mtime < time.time() - self.lease_seconds
+    except FileNotFoundError:
+      return False
+
+  '''
+  Create the lease of a job, taking over an expired one.
+  Taking over is a check then a rename, not atomic: a worker may see a lease expired,
+  another worker takes it over and creates a new lease, and the first worker renames
+  the new lease away and creates its own. Both workers then run the same job.
+  It is harmless only because results are written to a temporary file and renamed
+  to the destination, and committing a job again is harmless.
+  @param number : job number
+  @param worker : worker name
+  @return bool : True if leased
+  '''
+  def acquire_lease(self, number, worker):
+    lease = self.get_lease_file(number)
+    try:
+      fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+      if not self.is_expired(lease):
+        return False
+      # Only one worker succeeds to rename an expired lease
+      stale = '{0}.{1}.stale'.format(lease, worker)
+      try:
+        os.rename(lease, stale)
+      except FileNotFoundError:
+        return False
+      os.remove(stale)
+      try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+      except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+      f.write(worker)
+    return True
+
+  '''
+  Get owner of a lease.
+  @param number : job number
+  @return str : worker name, None if not leased
+  '''
+  def get_owner(self, number):
+    try:
+      with open(self.get_lease_file(number)) as f:
+        return f.read()
+    except FileNotFoundError:
+      return None
+
+  '''
+  Claim a job.
+  @param worker : worker name
+  @return (int, (str, str)) : job number and (source path, destination path),
+                              WAIT_FOR_LEASES if the other jobs are leased, END_OF_JOBS if all are done
+  '''
+  def claim(self, worker):
+    total = len(self.jobs)
+    if self.cursor is None:
+      # Workers start at different jobs to avoid contention
+      self.cursor = zlib.crc32(worker.encode()) % max(total, 1)
+    waiting = False
+    for step in range(total):
+      number = (self.cursor + step) % total
+      if number in self.finished:
+        continue
+      if os.path.exists(self.get_done_file(number)):
+        self.finished.add(number)
+        continue
+      if not self.acquire_lease(number, worker):
+        waiting = True
+        continue
+      # Committed by another worker after the check
+      if os.path.exists(self.get_done_file(number)):
+        self.finished.add(number)
+        self.release(number, worker)
+        continue
+      self.cursor = number + 1
+      return (number, self.jobs[number])
+    return WAIT_FOR_LEASES if waiting else END_OF_JOBS
+
+  '''
+  Renew the lease of a claimed job.
+  @param number : job number
+  @param worker : worker name
+  @return bool : False if the lease was taken over
+  '''
+  def renew(self, number, worker):
+    if self.get_owner(number) != worker:
+      return False
+    try:
+      os.utime(self.get_lease_file(number))
+    except FileNotFoundError:
+      return False
+    return True
+
+  '''
+  Remove the lease of a job if owned.
+  @param number : job number
+  @param worker : worker name
+  '''
+  def release(self, number, worker):
+    if self.get_owner(number) == worker:
+      try:
+        os.remove(self.get_lease_file(number))
+      except FileNotFoundError:
+        pass
+
+  '''
+  Commit a job, committing again is harmless.
+  @param number : job number
+  @param worker : worker name
+  @param error  : error message of a failed job (None for success), failed jobs are not retried
+  '''
+  def commit(self, number, worker, error=None):
+    write_json(self.get_done_file(number), {'worker': worker, 'error': error}, worker)
+    self.finished.add(number)
+    self.release(number, worker)
+
+  '''
+  Get progress of all workers.
+  @return (int, int) : committed jobs and all jobs
+  '''
+  def get_progress(self):
+    done = sum(1 for name in os.listdir(os.path.join(self.path, 'done')) if name.endswith('.json'))
+    return done, len(self.jobs)
+
+  '''
+  Get errors of failed jobs.
+  @return list((int, str)) : job number and error message
+  '''
+  def get_errors(self):
+    errors = list()
+    for number in range(len(self.jobs)):
+      file = self.get_done_file(number)
+      if os.path.exists(file):
+        with open(file) as f:
+          error = json.load(f)['error']
+        if error is not None:
+          errors.append((number, error))
+    return errors
+
+  '''
+  Close the queue.
+  '''
+  def close(self):
+    pass
+
+
+'''
+Handler of a connection to WorkQueueServer, one json request per line.
+'''
+class WorkQueueHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    for line in self.rfile:
+      response = self.server.work_queue.handle(json.loads(line))
+      self.wfile.write(json.dumps(response).encode() + b'\n')
+      self.wfile.flush()
+
+'''
+Coordinator of TCPWorkQueue workers.
+Leases and commits are kept in memory, expired leases go back to the front of the queue.
+'''
+class WorkQueueServer:
+
+  '''
+  Initialize with jobs.
+  @param jobs          : list of (source path, destination path)
+  @param host          : address to listen
+  @param port          : port to listen (0 for a free port)
+  @param lease_seconds : seconds without renewal to expire a lease
+  '''
+  def __init__(self, jobs, host='127.0.0.1', port=0, lease_seconds=LEASE_SECONDS):
+    self.jobs = [list(job) for job in jobs]
+    self.lease_seconds = lease_seconds
+    self.pending = collections.deque(range(len(self.jobs)))
+    self.leases = dict()
+    self.done = dict()
+    self.lock = threading.Lock()
+    self.server = socketserver.ThreadingTCPServer((host, port), WorkQueueHandler, bind_and_activate=False)
+    self.server.daemon_threads = True
+    self.server.allow_reuse_address = True
+    self.server.server_bind()
+    self.server.server_activate()
+    self.server.work_queue = self
+    self.thread = None
+
+  '''
+  Start serving in a background thread.
+  @return WorkQueueServer : self
+  '''
+  def start(self):
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    return self
+
+  '''
+  Get address for workers.
+  @return str : host:port
+  '''
+  def get_address(self):
+    host, port = self.server.server_address[:2]
+    return '{0}:{1}'.format(host, port)
+
+  '''
+  Handle a request.
+  @param request : dict with op and its arguments
+  @return dict : response
+  '''
+  def handle(self, request):
+    op = request.get('op')
+    with self.lock:
+      if op == 'info':
+        return {'lease_seconds': self.lease_seconds, 'total': len(self.jobs)}
+      if op == 'claim':
+        return self.claim(request['worker'])
+      if op == 'renew':
+        return {'ok': self.renew(request['job'], request['worker'])}
+      if op == 'commit':
+        self.commit(request['job'], request['worker'], request.get('error'))
+        return {'ok': True}
+      if op == 'progress':
+        return {'done': len(self.done), 'total': len(self.jobs)}
+    return {'error': 'unknown op'}
+
+  '''
+  Lease the next job.
+  @param worker : worker name
+  @return dict : job number and spec, or no job with wait flag
+  '''
+  def claim(self, worker):
+    now = time.time()
+    for number, lease in list(self.leases.items()):
+      if lease[1] < now:
+        # Jobs of crashed workers are done first
+        del self.leases[number]
+        self.pending.appendleft(number)
+    while len(self.pending) > 0:
+      number = self.pending.popleft()
+      if number in self.done:
+        continue
+      self.leases[number] = (worker, now + self.lease_seconds)
+      return {'job': number, 'spec': self.jobs[number]}
+    return {'job': None, 'wait': len(self.leases) > 0}
+
+  '''
+  Renew a lease.
+  @param number : job number
+  @param worker : worker name
+  @return bool : False if the lease was taken over
+  '''
+  def renew(self, number, worker):
+    lease = self.leases.get(number)
+    if lease is None or lease[0] != worker:
+      return False
+    self.leases[number] = (worker, time.time() + self.lease_seconds)
+    return True
+
+  '''
+  Commit a job, committing again is harmless.
+  @param number : job number
+  @param worker : worker name
+  @param error  : error message of a failed job (None for success)
+  '''
+  def commit(self, number, worker, error=None):
+    self.done.setdefault(number, (worker, error))
+    lease = self.leases.get(number)
+    if lease is not None and lease[0] == worker:
+      del self.leases[number]
+
+  '''
+  Get progress of all workers.
+  @return (int, int) : committed jobs and all jobs
+  '''
+  def get_progress(self):
+    with self.lock:
+      return len(self.done), len(self.jobs)
+
+  '''
+  Get errors of failed jobs.
+  @return list((int, str)) : job number and error message
+  '''
+  def get_errors(self):
+    with self.lock:
+      return sorted((number, done[1]) for number, done in self.done.items() if done[1] is not None)
+
+  '''
+  Wait until all jobs are committed.
+  @param poll : seconds between checks
+  '''
+  def wait(self, poll=POLL_SECONDS):
+    while self.get_progress()[0] < len(self.jobs):
+      time.sleep(poll)
+
+  '''
+  Stop serving.
+  '''
+  def shutdown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+'''
+Work queue served by WorkQueueServer.
+'''
+class TCPWorkQueue:
+
+  '''
+  Connect to a server.
+  @param address : host:port
+  '''
+  def __init__(self, address):
+    host, port = address.rsplit(':', 1)
+    self.sock = socket.create_connection((host, int(port)))
+    self.stream = self.sock.makefile('rwb')
+    # The lease keeper renews from another thread
+    self.lock = threading.Lock()
+    info = self.request({'op': 'info'})
+    self.lease_seconds = info['lease_seconds']
+
+  '''
+  Send a request and receive its response.
+  @param request : dict with op and its arguments
+  @return dict : response
+  '''
+  def request(self, request):
+    with self.lock:
+      self.stream.write(json.dumps(request).encode() + b'\n')
+      self.stream.flush()
+      return json.loads(self.stream.readline())
+
+  '''
+  Get seconds without renewal to expire a lease.
+  @return float : seconds
+  '''
+  def get_lease_seconds(self):
+    return self.lease_seconds
+
+  '''
+  Claim a job.
+  @param worker : worker name
+  @return (int, (str, str)) : job number and (source path, destination path),
+                              WAIT_FOR_LEASES if the other jobs are leased, END_OF_JOBS if all are done
+  '''
+  def claim(self, worker):
+    response = self.request({'op': 'claim', 'worker': worker})
+    if response['job'] is None:
+      return WAIT_FOR_LEASES if response['wait'] else END_OF_JOBS
+    return (response['job'], tuple(response['spec']))
+
+  '''
+  Renew the lease of a claimed job.
+  @param number : job number
+  @param worker : worker name
+  @return bool : False if the lease was taken over
+  '''
+  def renew(self, number, worker):
+    return self.request({'op': 'renew', 'job': number, 'worker': worker})['ok']
+
+  '''
+  Commit a job, committing again is harmless.
+  @param number : job number
+  @param worker : worker name
+  @param error  : error message of a failed job (None for success)
+  '''
+  def commit(self, number, worker, error=None):
+    self.request({'op': 'commit', 'job': number, 'worker': worker, 'error': error})
+
+  '''
+  Get progress of all workers.
+  @return (int, int) : committed jobs and all jobs
+  '''
+  def get_progress(self):
+    response = self.request({'op': 'progress'})
+    return response['done'], response['total']
+
+  '''
+  Close the connection.
+  '''
+  def close(self):
+    self.stream.close()
+    self.sock.close()
+
+'''
+Open a work queue.
+@param address : queue directory or host:port of WorkQueueServer
+@param lease_seconds : seconds without renewal to expire a lease (queue directory only)
+@return FileWorkQueue or TCPWorkQueue : queue
+'''
+def open_work_queue(address, lease_seconds=LEASE_SECONDS):
+  if os.path.isdir(address):
+    return FileWorkQueue(address, lease_seconds)
+  return TCPWorkQueue(address)
+
+
+'''
+Thread renewing the lease of the current job.
+'''
+class LeaseKeeper(threading.Thread):
+
+  '''
+  Initialize with a claimed job.
+  @param work_queue : FileWorkQueue or TCPWorkQueue
+  @param number     : job number
+  @param worker     : worker name
+  '''
+  def __init__(self, work_queue, number, worker):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.work_queue = work_queue
+    self.number = number
+    self.worker = worker
+    self.stop = threading.Event()
+
+  def run(self):
+    while not self.stop.wait(self.work_queue.get_lease_seconds() / 3):
+      if not self.work_queue.renew(self.number, self.worker):
+        # Taken over, the result is committed again harmlessly
+        break
+
+  '''
+  Stop renewing.
+  '''
+  def close(self):
+    self.stop.set()
+    self.join()
+
+'''
+Segment jobs claimed from a work queue until all are done.
+@param work_queue     : FileWorkQueue or TCPWorkQueue
+@param create_process : function(img) returning a process created with dst_img None
+@param worker         : worker name (None for host name and process id)
+@param train_options  : keyword arguments of train
+@param max_pixels     : pixel budget to decode sources (None for full resolution)
+@param result_format  : rgb, palette or npy (see ResultFormat)
+@param compress_level : zlib level of PNG (None for PIL default)
+@param poll           : seconds to wait when the other jobs are leased
+@return StageStats : busy time and processed jobs of this worker
+'''
+def run_worker(work_queue, create_process, worker=None, train_options=None, max_pixels=None,
+               result_format='rgb', compress_level=None, poll=POLL_SECONDS):
+  worker = worker or get_worker_name()
+  stats = StageStats(worker, 1)
+  while True:
+    claimed = work_queue.claim(worker)
+    if claimed is END_OF_JOBS:
+      break
+    if claimed == WAIT_FOR_LEASES:
+      time.sleep(poll)
+      continue
+    number, (src, dst) = claimed
+    keeper = LeaseKeeper(work_queue, number, worker)
+    keeper.start()
+    begin = time.time()
+    error = None
+    try:
+      process = create_process(load_image(src, max_pixels).get_array())
+      process.set_result_format(result_format)
+      process.train(**(train_options or dict()))
+      temp = get_temporary_path(dst, worker)
+      rfmt.save_result(process.get_result_image(), temp, result_format, process.get_result_palette(), compress_level)
+      # Result is complete before it appears
+      os.replace(temp, dst)
+    except Exception as e:
+      error = repr(e)
+    keeper.close()
+    work_queue.commit(number, worker, error)
+    stats.add(time.time() - begin)
+  return stats
+
+'''
+Open a work queue and run a worker on it, target of worker processes.
+@param address        : queue directory or host:port
+@param create_process : function(img) returning a process
+@param lease_seconds  : seconds without renewal to expire a lease (queue directory only)
+@param options        : keyword arguments of run_worker
+@return StageStats : busy time and processed jobs of this worker
+'''
+def run_worker_at(address, create_process, lease_seconds=LEASE_SECONDS, **options):
+  work_queue = open_work_queue(address, lease_seconds)
+  try:
+    return run_worker(work_queue, create_process, **options)
+  finally:
+    work_queue.close()
+
+'''
+Run worker processes on this host and wait for them.
+create_process must be picklable where processes are spawned (not on Linux, which forks).
+@param address        : queue directory or host:port
+@param create_process : function(img) returning a process
+@param workers        : number of worker processes
+@param options        : keyword arguments of run_worker_at
+@return list(int) : exit codes of the processes
+'''
+def run_local_workers(address, create_process, workers, **options):
+  processes = [multiprocessing.Process(target=run_worker_at, args=(address, create_process), kwargs=options)
+               for i in range(workers)]
+  for process in processes:
+    process.start()
+  for process in processes:
+    process.join()
+  return [process.exitcode for process in processes]
+
+'''
+Create a grid graph process of UFSegmentationProcess, used by workers started from the command line.
+@param img   : source image
+@param top_n : color segmentations having top n area
+@param tau_k : merging super parameter
+@return GridGraphSegmentation : process
+'''
+def create_grid_process(img, top_n=40, tau_k=125.0):
+  from UFSegmentationProcess import GridGraphSegmentation
+  return GridGraphSegmentation(img, None, top_n, tau_k)
+
+if __name__ == '__main__':
+  # python DistributedRunner.py <queue directory or host:port> [tau_k] [top_n]
+  import functools
+  import sys
+  tau_k = float(sys.argv[2]) if len(sys.argv) > 2 else 125.0
+  top_n = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+  stats = run_worker_at(sys.argv[1], functools.partial(create_grid_process, top_n=top_n, tau_k=tau_k),
+    train_options={'backend': 'auto'})
+  print("{0} : items {1}, busy {2:.3f} sec".format(stats.get_name(), stats.get_items(), stats.get_busy()))
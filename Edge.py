@@ -1,8 +1,6 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
-import numpy as np
-from math import *
+from array import array
 import sys
 
 '''
@@ -117,6 +115,7 @@ This class is used to edge key of dictionary.
 DO NOT CHANGE IDS IN THIS OBJECT.
 '''
 class EdgeIdSet(object):
+  __slots__ = ('id1', 'id2')
 
   '''
   Intialize with two ids.
@@ -305,3 +304,326 @@ class MergedEdgeList:
   '''
   def create_sorted_mc(self):
     return sorted(self.edge_dict.items(), key=lambda item:item[1].get_min_edge().get_difference())
+
+
+'''
+Sorted edges of CompactMergedEdgeList.
+Sequence of (EdgeIdSet, minimum difference) created on access.
+'''
+class CompactSortedEdges:
+
+  '''
+  Initialize with sorted keys.
+  @param keys     : sorted edge keys (id1 * key_base + id2)
+  @param values   : minimum differences of the keys
+  @param key_base : base of the keys
+  '''
+  def __init__(self, keys, values, key_base):
+    self.keys = keys
+    self.values = values
+    self.key_base = key_base
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __getitem__(self, index):
+    id1, id2 = divmod(int(self.keys[index]), self.key_base)
+    return (EdgeIdSet(id1, id2), float(self.values[index]))
+
+  def __iter__(self):
+    for index in range(len(self.keys)):
+      yield self[index]
+
+
+'''
+Merged edge list in compact mode.
+A merged edge is only its minimum difference, no Edge or MergedEdge object is kept.
+Edges are kept in an open addressing hash table of typed arrays:
+  keys   : id1 * key_base + id2 (id1 < id2), EMPTY or DELETED
+  values : minimum difference of the edge
+  seq    : added order of the edge, to sort edges of the same difference like MergedEdgeList
+Edges of each component are linked through int32 typed arrays, so merge visits only them.
+Link 2 * slot is the edge in the list of id1 and 2 * slot + 1 in the list of id2:
+  head      : first link of each component, -1 for no edge
+  next_link : next link in the list of the component, -1 for the last
+  prev_link : previous link in the list of the component, -1 for the first
+'''
+class CompactMergedEdgeList:
+
+  '''
+  Empty and deleted slots of the table
+  '''
+  EMPTY = -1
+  DELETED = -2
+
+  '''
+  Initialize with an empty table.
+  @param size     : number of components, ids must be less than it
+  @param edge_len : expected number of edges to reserve the table
+  '''
+  def __init__(self, size, edge_len=0):
+    self.key_base = size
+    self.head = array('i', [-1]) * size
+    self.seq_count = 0
+    self.live = 0
+    self.used = 0
+    # Max load factor is 3/4
+    self.create_table(edge_len * 4 // 3 + 2)
+
+  '''
+  Create empty table.
+  @param capacity : number of slots
+  '''
+  def create_table(self, capacity):
+    self.keys = array('q', [self.EMPTY]) * capacity
+    self.values = array('d', [0.0]) * capacity
+    self.seq = array('q', [0]) * capacity
+    self.next_link = array('i', [-1]) * (2 * capacity)
+    self.prev_link = array('i', [-1]) * (2 * capacity)
+    self.used = 0
+
+  '''
+  Reserve the table for edges, before adding edges.
+  @param edge_len : expected number of edges
+  '''
+  def reserve(self, edge_len):
+    if self.live == 0:
+      self.create_table(edge_len * 4 // 3 + 2)
+
+  '''
+  Get first slot of a key.
+  @param key : edge key
+  @return int : slot
+  '''
+  def hash_slot(self, key):
+    return (((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % len(self.keys)
+
+  '''
+  Find slot of a key.
+  @param key : edge key
+  @return int : slot, -1 if not found
+  '''
+  def find_slot(self, key):
+    keys = self.keys
+    capacity = len(keys)
+    slot = self.hash_slot(key)
+    while True:
+      slot_key = keys[slot]
+      if slot_key == key:
+        return slot
+      if slot_key == self.EMPTY:
+        return -1
+      slot += 1
+      if slot == capacity:
+        slot = 0
+
+  '''
+  Put a key to the table, keep the smaller difference if the key exists.
+  @param key   : edge key
+  @param value : difference
+  @return bool : True if the key is new
+  '''
+  def put(self, key, value):
+    keys = self.keys
+    capacity = len(keys)
+    slot = self.hash_slot(key)
+    deleted = -1
+    while True:
+      slot_key = keys[slot]
+      if slot_key == key:
+        if self.values[slot] > value:
+          self.values[slot] = value
+        return False
+      if slot_key == self.EMPTY:
+        break
+      if slot_key == self.DELETED and deleted < 0:
+        deleted = slot
+      slot += 1
+      if slot == capacity:
+        slot = 0
+    if deleted >= 0:
+      slot = deleted
+    else:
+      self.used += 1
+    keys[slot] = key
+    self.values[slot] = value
+    self.seq[slot] = self.seq_count
+    self.seq_count += 1
+    self.live += 1
+    self.link_slot(slot)
+    if self.used * 4 >= capacity * 3:
+      self.rehash()
+    return True
+
+  '''
+  Delete a slot.
+  @param slot : slot to delete
+  '''
+  def delete(self, slot):
+    self.unlink_slot(slot)
+    self.keys[slot] = self.DELETED
+    self.live -= 1
+
+  '''
+  Rebuild the table without deleted slots, grow it if more than half is alive.
+  '''
+  def rehash(self):
+    keys, values, seq = self.keys, self.values, self.seq
+    capacity = len(keys) if self.live * 2 <= len(keys) else self.live * 2 + 1
+    self.create_table(capacity)
+    self.head = array('i', [-1]) * self.key_base
+    for slot in range(len(keys)):
+      if keys[slot] < 0:
+        continue
+      new_slot = self.hash_slot(keys[slot])
+      while self.keys[new_slot] != self.EMPTY:
+        new_slot = (new_slot + 1) % capacity
+      self.keys[new_slot] = keys[slot]
+      self.values[new_slot] = values[slot]
+      self.seq[new_slot] = seq[slot]
+      self.used += 1
+      self.link_slot(new_slot)
+
+  '''
+  Create edge key.
+  @param id1 : id of a component
+  @param id2 : id of another component
+  @return int : key
+  '''
+  def create_key(self, id1, id2):
+    if id1 > id2:
+      id1, id2 = id2, id1
+    return id1 * self.key_base + id2
+
+  '''
+  Add the edge of a slot to the lists of its ids.
+  @param slot : slot of the edge
+  '''
+  def link_slot(self, slot):
+    head, next_link, prev_link = self.head, self.next_link, self.prev_link
+    for link, id in zip((2 * slot, 2 * slot + 1), divmod(self.keys[slot], self.key_base)):
+      first = head[id]
+      next_link[link] = first
+      prev_link[link] = -1
+      if first >= 0:
+        prev_link[first] = link
+      head[id] = link
+
+  '''
+  Remove the edge of a slot from the lists of its ids.
+  @param slot : slot of the edge
+  '''
+  def unlink_slot(self, slot):
+    head, next_link, prev_link = self.head, self.next_link, self.prev_link
+    for link, id in zip((2 * slot, 2 * slot + 1), divmod(self.keys[slot], self.key_base)):
+      prev = prev_link[link]
+      following = next_link[link]
+      if prev >= 0:
+        next_link[prev] = following
+      else:
+        head[id] = following
+      if following >= 0:
+        prev_link[following] = prev
+
+  '''
+  Get slots of the edges of a component.
+  @param id : id of the component
+  @return list(int) : slots
+  '''
+  def get_slots(self, id):
+    slots = list()
+    link = self.head[id]
+    while link >= 0:
+      slots.append(link >> 1)
+      link = self.next_link[link]
+    return slots
+
+  '''
+  Add difference of an edge between two components.
+  @param id1        : id of a component
+  @param id2        : id of another component
+  @param difference : difference between the components
+  '''
+  def add_difference(self, id1, id2, difference):
+    self.put(self.create_key(id1, id2), difference)
+
+  '''
+  Get minimum difference of the edge which has id1 and id2.
+  @param id_set : edge id set
+  @return float : minimum difference
+  '''
+  def get_merged_edge(self, id_set):
+    slot = self.find_slot(self.create_key(id_set.get_id1(), id_set.get_id2()))
+    if slot < 0:
+      raise KeyError(id_set)
+    return self.values[slot]
+
+  '''
+  Get merged edge dict in added order.
+  @return dict(EdgeIdSet, float) : minimum difference of all edges
+  '''
+  def get_edge_dict(self):
+    slots = sorted((slot for slot in range(len(self.keys)) if self.keys[slot] >= 0), key=lambda slot: self.seq[slot])
+    return dict((EdgeIdSet(*divmod(self.keys[slot], self.key_base)), self.values[slot]) for slot in slots)
+
+  '''
+  Merge edges with changing ids of all components.
+  @param from_id : Edge of this id will be changed to to_id
+  @param to_id   : Edge of from_id will be changed to this id
+  '''
+  def merge(self, from_id, to_id):
+    # Slots of the edges of from_id, found by its list
+    slots = self.get_slots(from_id)
+    if not slots:
+      return
+    keys = self.keys
+
+    # Move edges of from_id to to_id in added order, same as MergedEdgeList
+    slots.sort(key=lambda slot: self.seq[slot])
+    moved = list()
+    for slot in slots:
+      id1, id2 = divmod(keys[slot], self.key_base)
+      id_pair_of_to = id2 if id1 == from_id else id1
+      # Edges between from_id and to_id are deleted
+      if id_pair_of_to != to_id:
+        moved.append((self.create_key(id_pair_of_to, to_id), self.values[slot]))
+      self.delete(slot)
+    for key, value in moved:
+      self.put(key, value)
+
+  '''
+  Print list of edges
+  '''
+  def print_list(self):
+    print("--- list of edges in merged edges---")
+    for id_set, difference in self.get_edge_dict().items():
+      print("(id1:{0}, id2:{1}) : {2}".format(id_set.get_id1(), id_set.get_id2(), difference))
+    print("--- list of edges in merged edges ---")
+
+  '''
+  Get minimum difference edge between the specified two components.
+  @param id_set : id set to search
+  @return int : minimmum difference
+  '''
+  def calc_min_diff(self, id_set):
+    slot = self.find_slot(self.create_key(id_set.get_id1(), id_set.get_id2()))
+    if slot >= 0:
+      return self.values[slot]
+    else:
+      # Edge is infinite
+      print("{0},{1} is infinite.".format(id_set.get_id1(), id_set.get_id2()))
+      return sys.maxsize
+
+  '''
+  Create sorted edge by no-decreasing edge weight, edges of the same weight in added order.
+  @return CompactSortedEdges : sequence of (EdgeIdSet, minimum difference)
+  '''
+  def create_sorted_mc(self):
+    # numpy sorts typed arrays without copying them into objects
+    import numpy as np
+    keys = np.frombuffer(self.keys, dtype=np.int64)
+    values = np.frombuffer(self.values, dtype=np.float64)
+    seq = np.frombuffer(self.seq, dtype=np.int64)
+    alive = np.flatnonzero(keys >= 0)
+    order = alive[np.lexsort((seq[alive], values[alive]))]
+    return CompactSortedEdges(keys[order], values[order], self.key_base)
@@ -1,30 +1,28 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
-import numpy as np
-from Component import *
-
 '''
 Judge if merging two components.
 @param id_set : id set to check merge
 @param mcl : Merged Component List
 @param mel : Merged Edge List
+@param config : GBSConfig of the run (None for module defaults)
 @return bool : TRUE if merging two components, else FALSE
 '''
-def gbs_is_merge(id_set, mcl, mel):
-  return gbs_dif(id_set, mel) < gbs_mint(id_set.get_id1(), id_set.get_id2(), mcl)
+def gbs_is_merge(id_set, mcl, mel, config=None):
+  return gbs_dif(id_set, mel) < gbs_mint(id_set.get_id1(), id_set.get_id2(), mcl, config)
 
 '''
 Calculate the mimum internal difference between two components.
 @param id1 : One of two components to calculate minimum internal difference of boundary
 @param id2 : One of two components to calculate minimum internal difference of boundary
 @param mcl : Merged Component List
+@param config : GBSConfig of the run (None for module defaults)
 @return float : minimum internal difference between two components
 '''
-def gbs_mint(id1, id2, mcl):
+def gbs_mint(id1, id2, mcl, config=None):
   mc1 = mcl.get_merged_component(id1)
   mc2 = mcl.get_merged_component(id2)
-  return min(gbs_int(mc1)+gbs_tau(mc1), gbs_int(mc2)+gbs_tau(mc2))
+  return min(gbs_int(mc1)+gbs_tau(mc1, config), gbs_int(mc2)+gbs_tau(mc2, config))
 
 '''
 Difference method
@@ -32,6 +30,9 @@ Difference method
 LUMINANCE = 0
 RGB_DIFF = 1
 
+'''
+Default of GBSConfig, only LUMINANCE is implemented.
+'''
 method = LUMINANCE
 
 '''
@@ -59,15 +60,48 @@ def gbs_int(mc):
 
 '''
 Coefficient parameter to calculate threashold
+Default of GBSConfig, give GBSConfig to change it per run.
 '''
 tau_k = 4.5
 '''
 Calculate threashold based on the size of the component.
 @param mc : merged component to calculate the threashold
+@param config : GBSConfig of the run (None for module defaults)
 @return float : threashold based on the size of the component
 '''
-def gbs_tau(mc):
-  return float(tau_k / mc.get_size())
+def gbs_tau(mc, config=None):
+  k = tau_k if config is None else config.get_tau_k()
+  return float(k / mc.get_size())
+
+'''
+Parameters of a segmentation run.
+Each run reads only its own config, so runs with different parameters can share threads.
+'''
+class GBSConfig:
+
+  '''
+  Initialize with parameters.
+  @param tau_k  : coefficient parameter to calculate threashold (None for module default)
+  @param method : difference method, LUMINANCE or RGB_DIFF (None for module default)
+  '''
+  def __init__(self, tau_k=None, method=None):
+    # Defaults are copied on creation, later changes of module globals do not affect this run
+    self.tau_k = globals()['tau_k'] if tau_k is None else tau_k
+    self.method = globals()['method'] if method is None else method
+
+  '''
+  Get coefficient parameter to calculate threashold.
+  @return float : tau_k
+  '''
+  def get_tau_k(self):
+    return self.tau_k
+
+  '''
+  Get difference method.
+  @return int : LUMINANCE or RGB_DIFF
+  '''
+  def get_method(self):
+    return self.method
 
 '''
 Calculate luminance
@@ -94,7 +128,7 @@ class Pixel:
   '''
   def __init__(self, row, col, img):
     self.elem = (row, col)
-    self.rgba = img[row][col]
+    self.rgba = img[row, col]
     self.value = calc_luminance(self.rgba)
 
   def get_elem(self):
@@ -5,34 +5,35 @@ Sample program of graph based segmentation algorithm
 '''
 
 # Import required packages
-from PIL import Image
 import numpy as np
 
+from ImageLoader import load_image
 from SegmentationProcess import *
 import GraphBasedSegment as gbs
 
 # Load image via PIL.
+# Give max_pixels (e.g. 100*100) to decode large JPEG with reduced resolution.
 src_file = 'images/sample5.jpg'
-img = np.array(Image.open(src_file))
+img = load_image(src_file).get_array()
 # Specify destination output file.
 dst = 'result/gbs_ret.png'
 # Specify coloring segmentations each of which has top n area. 
 top_n = 40
 # Specify tau_k parameter optinally.
-gbs.tau_k = 1.4
+config = gbs.GBSConfig(tau_k=1.4)
 
 # Print image information
 print("file : {0}, shape:{1}".format(src_file, img.shape))
 
 '''
 # Initialize SegmentationProcess.
-ggs = GridGraphSegmentation(img, dst, top_n)
+ggs = GridGraphSegmentation(img, dst, top_n, config)
 # Traing the image and output a image file.
 ggs.train()
 '''
 
 # Initialize SegmentationProcess.
 nn = 3
-nngs = NearestNeightborGraphSegmentation(img, dst, top_n, nn)
+nngs = NearestNeightborGraphSegmentation(img, dst, top_n, nn, config)
 # Traing the image and output a image file.
 nngs.train()
\ No newline at end of file
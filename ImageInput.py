@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+import UFArrayGraph as uag
+
+'''
+Input images of processes without extra copies.
+Sources are numpy arrays (C order or strided views such as crops and channel
+slices), numpy.memmap, objects with the buffer protocol (bytes, bytearray,
+memoryview, array.array, mmap) and PIL images.
+Arrays, memory maps and buffers are used as they are. PIL keeps pixels in its own
+storage, so a PIL image is copied once by the array interface of PIL, or read in
+strips of rows by calc_luminance_plane without a full copy.
+Luminance is calculated in strips of rows, so a strided or memory mapped source
+is read once and temporaries stay in the cache.
+'''
+
+'''
+Pixels of a strip to calculate luminance at once
+'''
+STRIP_PIXELS = 2**18
+
+'''
+PIL modes read as luminance, grayscale or rgb(a)
+'''
+PIL_MODES = ('L', 'RGB', 'RGBA', 'RGBX')
+
+'''
+Get if the source is a PIL image.
+@param src : source image
+@return bool : True for PIL image
+'''
+def is_pil_image(src):
+  # PIL is not imported to check
+  return hasattr(src, 'getbands') and hasattr(src, 'crop') and hasattr(src, 'size')
+
+'''
+Get numpy array of a source image without copy of arrays and buffers.
+@param src   : numpy array (row, col[, channel]), buffer protocol object or PIL image
+@param shape : shape (row, col[, channel]) of a flat buffer (None for a shaped source)
+@param dtype : element type of a flat buffer
+@return numpy.ndarray : image array, a view of src except for PIL images
+'''
+def as_image_array(src, shape=None, dtype=np.uint8):
+  if isinstance(src, np.ndarray):
+    array = src
+  elif is_pil_image(src):
+    if src.mode not in PIL_MODES:
+      raise InvalidParameterException()
+    # asarray takes the bytes of PIL without another copy of np.array
+    array = np.asarray(src)
+  else:
+    try:
+      view = memoryview(src)
+    except TypeError:
+      raise InvalidParameterException()
+    if shape is not None:
+      array = np.frombuffer(view, dtype=dtype)
+    else:
+      array = np.asarray(view)
+  if shape is not None:
+    array = array.reshape(shape)
+  if array.ndim not in (2, 3) or array.size == 0:
+    raise InvalidParameterException()
+  return array
+
+'''
+Get shape of a source image.
+@param src : numpy array or PIL image
+@return (int, int) : (row, col)
+'''
+def get_image_shape(src):
+  if is_pil_image(src):
+    return (src.size[1], src.size[0])
+  return tuple(np.shape(src)[:2])
+
+'''
+Get rows of a strip.
+@param shape        : (row, col)
+@param strip_pixels : pixels of a strip
+@return int : rows
+'''
+def get_strip_rows(shape, strip_pixels=STRIP_PIXELS):
+  return max(1, strip_pixels // max(1, shape[1]))
+
+'''
+Calculate luminance plane in one pass over the source.
+Same values as UFArrayGraph.calc_luminance_plane.
+@param src          : numpy array (row, col[, rgb(a)]), memmap or PIL image
+@param out          : float64 array (row, col) to write into (None to allocate)
+@param strip_pixels : pixels of a strip
+@return numpy.ndarray : luminance plane (row, col)
+'''
+def calc_luminance_plane(src, out=None, strip_pixels=STRIP_PIXELS):
+  if is_pil_image(src) and src.mode not in PIL_MODES:
+    raise InvalidParameterException()
+  shape = get_image_shape(src)
+  if out is None:
+    out = np.empty(shape, dtype=np.float64)
+  rows = get_strip_rows(shape, strip_pixels)
+  for begin in range(0, shape[0], rows):
+    end = min(begin + rows, shape[0])
+    if is_pil_image(src):
+      strip = np.asarray(src.crop((0, begin, shape[1], end)))
+    else:
+      strip = src[begin:end]
+    uag.calc_luminance_values(strip, 2, out[begin:end])
+  return out
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+
+import math
+
+import numpy as np
+
+'''
+Decoded image and the size of the source file.
+'''
+class LoadedImage:
+
+  '''
+  Initialize with decoded array.
+  @param array     : decoded uint8 array (row, col[, channel])
+  @param full_size : (row, col) of the source image
+  '''
+  def __init__(self, array, full_size):
+    self.array = array
+    self.full_size = full_size
+
+  '''
+  Get decoded array.
+  @return numpy.ndarray : uint8 array (row, col[, channel])
+  '''
+  def get_array(self):
+    return self.array
+
+  '''
+  Get size of the source image.
+  @return (int, int) : (row, col)
+  '''
+  def get_full_size(self):
+    return self.full_size
+
+  '''
+  Get if decoded with reduced resolution.
+  @return bool : True if reduced
+  '''
+  def is_reduced(self):
+    return self.array.shape[:2] != tuple(self.full_size)
+
+  '''
+  Map labels of the decoded image to the full resolution (nearest neighbor).
+  @param labels : labels (row, col) or result image (row, col, 3) of the decoded image
+  @return numpy.ndarray : labels or result image of the full resolution
+  '''
+  def expand_labels(self, labels):
+    if not self.is_reduced():
+      return labels
+    rows = np.arange(self.full_size[0]) * labels.shape[0] // self.full_size[0]
+    cols = np.arange(self.full_size[1]) * labels.shape[1] // self.full_size[1]
+    return labels[rows[:, None], cols[None, :]]
+
+
+'''
+Get size to request for a pixel budget.
+@param size       : (width, height) of the source image
+@param max_pixels : pixel budget
+@return (int, int) : (width, height) not more than the budget
+'''
+def get_budget_size(size, max_pixels):
+  scale = math.sqrt(float(size[0]*size[1]) / max_pixels)
+  if scale <= 1.0:
+    return size
+  return (max(1, int(size[0] / scale)), max(1, int(size[1] / scale)))
+
+'''
+Load an image as uint8 array.
+With a pixel budget, JPEG is decoded in draft mode, which scales by 1/2, 1/4 or 1/8
+in the DCT domain while decoding. Other formats are decoded and reduced by an integer
+factor. The result keeps at least the budget size, so it may be a little larger.
+@param path       : image file path
+@param max_pixels : pixel budget (None for full resolution)
+@param mode       : PIL mode to convert (e.g. 'RGB', None to keep)
+@param out        : uint8 array to reuse if it has the decoded shape (None to allocate)
+@return LoadedImage : decoded image and the source size
+'''
+def load_image(path, max_pixels=None, mode=None, out=None):
+  # PIL is loaded only to decode images
+  from PIL import Image
+  img = Image.open(path)
+  full_size = (img.size[1], img.size[0])
+  if max_pixels is not None and img.size[0]*img.size[1] > max_pixels:
+    request = get_budget_size(img.size, max_pixels)
+    if img.format == 'JPEG':
+      img.draft(mode or img.mode, request)
+    factor = min(img.size[0] // request[0], img.size[1] // request[1])
+    if factor > 1:
+      img = img.reduce(factor)
+  if mode is not None and img.mode != mode:
+    img = img.convert(mode)
+  array = np.asarray(img)
+  if out is not None and out.shape == array.shape and out.dtype == array.dtype:
+    np.copyto(out, array)
+    array = out
+  else:
+    array = np.ascontiguousarray(array)
+    if not array.flags.writeable:
+      array = array.copy()
+  return LoadedImage(array, full_size)
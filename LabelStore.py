@@ -0,0 +1,380 @@
+# -*- coding:utf-8 -*-
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+
+'''
+Append-only store of label maps for segmentation datasets.
+A store is a directory:
+  chunkNNNNN.bin : records appended back to back, aligned to RECORD_ALIGN bytes
+                   record = label map (uint16 or uint32) + region sizes (uint32)
+  index.bin      : one INDEX_DTYPE entry per record, appended after its record
+Labels are renumbered 0 to n-1 and region n has sizes[n] pixels.
+Records never span chunks and are read as memory maps without copy.
+An index entry is written only after its record, so a crashed writer leaves
+only complete records in the index.
+Workers append to their own shard (a store in shard-<name>) and merge_shards moves
+the chunks of all shards into the store at the end without copying records.
+'''
+
+'''
+Entry of the index
+'''
+INDEX_DTYPE = np.dtype([('key', '<i8'), ('chunk', '<i4'), ('itemsize', '<i4'), ('offset', '<i8'),
+                        ('rows', '<i4'), ('cols', '<i4'), ('regions', '<i8')])
+
+'''
+Bytes of a chunk to start the next one
+'''
+CHUNK_SIZE = 256*2**20
+
+'''
+Alignment of records in chunks
+'''
+RECORD_ALIGN = 64
+
+'''
+Prefix of shard directories
+'''
+SHARD_PREFIX = 'shard-'
+
+'''
+Prefix of shard directories merged and being removed
+'''
+MERGED_PREFIX = 'merged-'
+
+'''
+Plan of a shard merge, written in the shard before its chunks are moved
+'''
+MERGE_PLAN = 'merge.json'
+
+'''
+Get chunk file name.
+@param chunk : chunk number
+@return str : file name
+'''
+def get_chunk_name(chunk):
+  return 'chunk{0:05d}.bin'.format(chunk)
+
+'''
+Read index entries of a store.
+@param path : store directory
+@return numpy.ndarray : entries (INDEX_DTYPE), empty if the store has no record
+'''
+def read_index(path):
+  file = os.path.join(path, 'index.bin')
+  if not os.path.exists(file):
+    return np.empty(0, dtype=INDEX_DTYPE)
+  # An entry cut by a crash is dropped
+  length = os.path.getsize(file) // INDEX_DTYPE.itemsize
+  return np.fromfile(file, dtype=INDEX_DTYPE, count=length)
+
+'''
+Renumber a label map to 0 to n-1 and count pixels of each region.
+@param labels : integer label map (row, col)
+@return (numpy.ndarray, numpy.ndarray) : compact labels (uint16 if n fits, else uint32) and sizes (uint32)
+'''
+def compact_labels(labels):
+  flat = np.asarray(labels).reshape(-1)
+  if flat.size == 0:
+    return np.empty(np.shape(labels), dtype=np.uint16), np.empty(0, dtype=np.uint32)
+  if int(flat.min()) >= 0 and int(flat.max()) < 4*flat.size:
+    # Root pixel indices are renumbered without sort
+    count = np.bincount(flat)
+    used = count > 0
+    renumber = np.cumsum(used) - 1
+    compact = renumber[flat]
+    sizes = count[used]
+  else:
+    values, compact, sizes = np.unique(flat, return_inverse=True, return_counts=True)
+  dtype = np.uint16 if len(sizes) <= 2**16 else np.uint32
+  return compact.astype(dtype).reshape(np.shape(labels)), sizes.astype(np.uint32)
+
+'''
+Get size of a record.
+@param entry : index entry
+@return (int, int) : bytes of labels and bytes of the record
+'''
+def get_record_size(entry):
+  label_bytes = int(entry['rows'])*int(entry['cols'])*int(entry['itemsize'])
+  # Sizes start aligned to 4 bytes
+  label_bytes = (label_bytes + 3) // 4 * 4
+  return label_bytes, label_bytes + 4*int(entry['regions'])
+
+
+'''
+Writer appending label maps to a store or its shard.
+'''
+class LabelStoreWriter:
+
+  '''
+  Open a store to append, created if not exist.
+  @param path       : store directory
+  @param shard      : shard name of the worker (None to append to the store itself)
+  @param chunk_size : bytes of a chunk to start the next one
+  '''
+  def __init__(self, path, shard=None, chunk_size=CHUNK_SIZE):
+    self.path = path if shard is None else os.path.join(path, SHARD_PREFIX + str(shard))
+    os.makedirs(self.path, exist_ok=True)
+    self.chunk_size = chunk_size
+    index = read_index(self.path)
+    self.length = len(index)
+    if self.length > 0:
+      self.chunk = int(index['chunk'].max())
+      self.offset = self.get_chunk_end()
+    else:
+      # Records without entries are overwritten
+      self.chunk = 0
+      self.offset = 0
+    self.index_file = open(os.path.join(self.path, 'index.bin'), 'ab')
+    # Drop a cut entry to keep entries aligned
+    self.index_file.truncate(self.length * INDEX_DTYPE.itemsize)
+    self.chunk_file = None
+
+  '''
+  Get aligned end of the current chunk file.
+  @return int : offset of the next record
+  '''
+  def get_chunk_end(self):
+    file = os.path.join(self.path, get_chunk_name(self.chunk))
+    size = os.path.getsize(file) if os.path.exists(file) else 0
+    return (size + RECORD_ALIGN - 1) // RECORD_ALIGN * RECORD_ALIGN
+
+  '''
+  Append a label map.
+  @param labels : integer label map (row, col), e.g. root pixel indices
+  @param key    : key to find the record (None for the record number)
+  @return int : record number in this store or shard
+  '''
+  def append(self, labels, key=None):
+    if np.ndim(labels) != 2 or np.size(labels) == 0:
+      raise InvalidParameterException()
+    compact, sizes = compact_labels(labels)
+    entry = np.zeros(1, dtype=INDEX_DTYPE)[0]
+    entry['key'] = self.length if key is None else key
+    entry['itemsize'] = compact.itemsize
+    entry['rows'], entry['cols'] = compact.shape
+    entry['regions'] = len(sizes)
+    label_bytes, record_bytes = get_record_size(entry)
+    if self.offset > 0 and self.offset + record_bytes > self.chunk_size:
+      self.close_chunk()
+      self.chunk += 1
+      self.offset = 0
+    if self.chunk_file is None:
+      self.chunk_file = open(os.path.join(self.path, get_chunk_name(self.chunk)), 'r+b' if self.offset > 0 else 'wb')
+    entry['chunk'] = self.chunk
+    entry['offset'] = self.offset
+    self.chunk_file.seek(self.offset)
+    self.chunk_file.write(np.ascontiguousarray(compact).tobytes())
+    self.chunk_file.seek(self.offset + label_bytes)
+    self.chunk_file.write(sizes.tobytes())
+    # Record goes to the file before its entry
+    self.chunk_file.flush()
+    self.index_file.write(entry.tobytes())
+    self.offset = (self.offset + record_bytes + RECORD_ALIGN - 1) // RECORD_ALIGN * RECORD_ALIGN
+    self.length += 1
+    return self.length - 1
+
+  '''
+  Get number of records.
+  @return int : records
+  '''
+  def get_length(self):
+    return self.length
+
+  '''
+  Flush records and entries to the disk.
+  '''
+  def flush(self):
+    if self.chunk_file is not None:
+      self.chunk_file.flush()
+      os.fsync(self.chunk_file.fileno())
+    self.index_file.flush()
+    os.fsync(self.index_file.fileno())
+
+  '''
+  Flush and close the current chunk.
+  '''
+  def close_chunk(self):
+    if self.chunk_file is not None:
+      self.flush()
+      self.chunk_file.close()
+      self.chunk_file = None
+
+  '''
+  Flush and close the writer.
+  '''
+  def close(self):
+    self.close_chunk()
+    self.flush()
+    self.index_file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+'''
+Reader of label maps in a store.
+'''
+class LabelStoreReader:
+
+  '''
+  Open a store.
+  @param path : store directory
+  '''
+  def __init__(self, path):
+    self.path = path
+    self.index = read_index(path)
+    self.chunks = dict()
+    self.keys = None
+
+  '''
+  Get number of records.
+  @return int : records
+  '''
+  def __len__(self):
+    return len(self.index)
+
+  '''
+  Get memory map of a chunk, opened on the first use.
+  @param chunk : chunk number
+  @return numpy.memmap : bytes of the chunk
+  '''
+  def get_chunk(self, chunk):
+    if chunk not in self.chunks:
+      self.chunks[chunk] = np.memmap(os.path.join(self.path, get_chunk_name(chunk)), dtype=np.uint8, mode='r')
+    return self.chunks[chunk]
+
+  '''
+  Get labels of a record without copy.
+  @param number : record number
+  @return numpy.ndarray : read only label map (row, col), uint16 or uint32
+  '''
+  def get_labels(self, number):
+    entry = self.index[number]
+    chunk = self.get_chunk(int(entry['chunk']))
+    dtype = np.uint16 if entry['itemsize'] == 2 else np.uint32
+    shape = (int(entry['rows']), int(entry['cols']))
+    return np.frombuffer(chunk, dtype=dtype, count=shape[0]*shape[1], offset=int(entry['offset'])).reshape(shape)
+
+  '''
+  Get pixels of each region of a record without copy.
+  @param number : record number
+  @return numpy.ndarray : read only sizes (uint32), indexed by label
+  '''
+  def get_sizes(self, number):
+    entry = self.index[number]
+    chunk = self.get_chunk(int(entry['chunk']))
+    label_bytes, record_bytes = get_record_size(entry)
+    return np.frombuffer(chunk, dtype=np.uint32, count=int(entry['regions']), offset=int(entry['offset']) + label_bytes)
+
+  '''
+  Get key of a record.
+  @param number : record number
+  @return int : key
+  '''
+  def get_key(self, number):
+    return int(self.index[number]['key'])
+
+  '''
+  Find a record by key.
+  @param key : key given to append
+  @return int : record number (the last one for a duplicated key)
+  '''
+  def find(self, key):
+    if self.keys is None:
+      self.keys = dict((key, number) for number, key in enumerate(self.index['key'].tolist()))
+    return self.keys[key]
+
+  '''
+  Release memory maps, which are closed when labels got before are released.
+  '''
+  def close(self):
+    self.chunks = dict()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+'''
+Get shard names of a store.
+@param path : store directory
+@return list(str) : shard names sorted
+'''
+def get_shards(path):
+  if not os.path.isdir(path):
+    return list()
+  return sorted(name[len(SHARD_PREFIX):] for name in os.listdir(path)
+                if name.startswith(SHARD_PREFIX) and os.path.isdir(os.path.join(path, name)))
+
+'''
+Get the merge plan of a shard, written at the first try of its merge.
+The plan fixes the index length and the first chunk number before the shard, so
+a merge interrupted at any step is done again to the same chunks and entries.
+@param path       : store directory
+@param shard_path : shard directory
+@return dict : base (index length) and first_chunk
+'''
+def get_merge_plan(path, shard_path):
+  file = os.path.join(shard_path, MERGE_PLAN)
+  if os.path.exists(file):
+    with open(file) as f:
+      return json.load(f)
+  index = read_index(path)
+  plan = {'base': len(index), 'first_chunk': int(index['chunk'].max()) + 1 if len(index) > 0 else 0}
+  temp = file + '.tmp'
+  with open(temp, 'w') as f:
+    json.dump(plan, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(temp, file)
+  return plan
+
+'''
+Merge shards into the store after all workers are closed.
+Chunks of shards are renamed into the store and their entries are appended in
+shard name order, so records are not copied.
+Each shard is merged by its plan (see get_merge_plan) and renamed to merged-<name>
+before it is removed, so merge_shards can be run again after a crash at any step
+without lost or duplicated entries.
+@param path : store directory
+@return int : number of records in the store
+'''
+def merge_shards(path):
+  os.makedirs(path, exist_ok=True)
+  # Shards merged by an interrupted run
+  for name in os.listdir(path):
+    if name.startswith(MERGED_PREFIX):
+      shutil.rmtree(os.path.join(path, name))
+  for shard in get_shards(path):
+    shard_path = os.path.join(path, SHARD_PREFIX + shard)
+    plan = get_merge_plan(path, shard_path)
+    entries = read_index(shard_path)
+    chunks = sorted(set(entries['chunk'].tolist()))
+    renumber = dict((chunk, plan['first_chunk'] + number) for number, chunk in enumerate(chunks))
+    for chunk, merged in renumber.items():
+      source = os.path.join(shard_path, get_chunk_name(chunk))
+      # Renamed already by an interrupted merge
+      if os.path.exists(source):
+        os.replace(source, os.path.join(path, get_chunk_name(merged)))
+    entries['chunk'] = [renumber[chunk] for chunk in entries['chunk'].tolist()]
+    # Chunks are renamed before entries point them, entries of an interrupted merge are written again
+    with open(os.path.join(path, 'index.bin'), 'ab') as f:
+      f.truncate(plan['base'] * INDEX_DTYPE.itemsize)
+      f.write(entries.tobytes())
+      f.flush()
+      os.fsync(f.fileno())
+    merged_path = os.path.join(path, MERGED_PREFIX + shard)
+    os.replace(shard_path, merged_path)
+    shutil.rmtree(merged_path)
+  return len(read_index(path))
@@ -16,17 +16,29 @@ Max hue value
 '''
 MAX_HUE = 360
 
+'''
+Colors created per number of colors
+'''
+colors_cache = dict()
+
+'''
+Palettes created per number of colors
+'''
+palette_cache = dict()
+
 '''
 Create colors divided by hue value.
 @param div_n : number of colors to create
 @return [(int)] : list of rgb colors
 '''
 def create_colors(div_n):
-  colors = list()
-  for n in range(div_n):
-    hue = float(n/div_n)
-    colors.append(hsv2rgb((hue, 1.0, 1.0)))
-  return colors
+  if div_n not in colors_cache:
+    colors = list()
+    for n in range(div_n):
+      hue = float(n/div_n)
+      colors.append(hsv2rgb((hue, 1.0, 1.0)))
+    colors_cache[div_n] = colors
+  return list(colors_cache[div_n])
 
 '''
 Randomize order when create colors
@@ -38,6 +50,23 @@ def create_random_colors(div_n):
   shuffle(colors)
   return colors
 
+'''
+Get color table of randomized colors, created once per number of colors.
+@param div_n : number of colors
+@return numpy.ndarray : uint8 array (div_n + 1, 3), row 0 is black for uncolored
+'''
+def get_palette(div_n):
+  if div_n not in palette_cache:
+    # numpy is loaded only for rendering, calc_luminance does not need it
+    import numpy as np
+    palette = np.zeros((div_n + 1, 3), dtype=np.uint8)
+    if div_n > 0:
+      palette[1:] = create_random_colors(div_n)
+    palette.flags.writeable = False
+    # Threads creating the same palette at once share the first one
+    return palette_cache.setdefault(div_n, palette)
+  return palette_cache[div_n]
+
 '''
 Calculate luminance
 @param rgb : list pf rgb value of the pixel
@@ -7,3 +7,11 @@ class InvalidParameterException(Exception):
   '''
   def print_err(self):
     print("Invalid parameters are passed to the function")
+
+class MemoryBudgetException(Exception):
+
+  '''
+  Print error content.
+  '''
+  def print_err(self):
+    print("No segmentation engine fits the memory budget: {0}".format(self))
@@ -0,0 +1,281 @@
+# -*- coding:utf-8 -*-
+
+import os
+import queue
+import socket
+import threading
+import time
+
+import numpy as np
+
+from ImageLoader import load_image
+from ParameterExceptions import InvalidParameterException
+from LabelStore import LabelStoreWriter
+import ResultFormat as rfmt
+
+'''
+End of jobs in a queue
+'''
+END_OF_JOBS = None
+
+'''
+Busy time and processed items of a stage.
+'''
+class StageStats:
+
+  '''
+  Initialize with zero.
+  @param name    : stage name
+  @param threads : number of threads of the stage
+  '''
+  def __init__(self, name, threads):
+    self.name = name
+    self.threads = threads
+    self.busy = 0.0
+    self.items = 0
+    self.lock = threading.Lock()
+
+  '''
+  Add busy time of an item.
+  @param elapsed : seconds spent for the item
+  '''
+  def add(self, elapsed):
+    with self.lock:
+      self.busy += elapsed
+      self.items += 1
+
+  '''
+  Get stage name.
+  @return str : name
+  '''
+  def get_name(self):
+    return self.name
+
+  '''
+  Get number of processed items.
+  @return int : items
+  '''
+  def get_items(self):
+    return self.items
+
+  '''
+  Get busy time of all threads.
+  @return float : seconds
+  '''
+  def get_busy(self):
+    return self.busy
+
+  '''
+  Get utilisation of the threads of the stage.
+  @param wall : wall clock seconds of the run
+  @return float : busy time / (wall * threads) [0.0-1.0]
+  '''
+  def get_utilisation(self, wall):
+    if wall <= 0:
+      return 0.0
+    return self.busy / (wall * self.threads)
+
+
+'''
+Batch segmentation in pipelined stages with bounded queues.
+  read    : reader threads decode source files
+  segment : worker threads train segmentation processes
+  write   : writer threads encode and save results
+Queues between stages are bounded, so at most queue_size images wait at each.
+Works with SegmentationProcess and UFSegmentationProcess subclasses.
+'''
+class PipelineRunner:
+
+  '''
+  Initialize stages.
+  @param create_process : function(img) returning a process created with dst_img None,
+                          e.g. lambda img: GridGraphSegmentation(img, None, 40, 125)
+  @param readers    : number of reader threads
+  @param workers    : number of segmentation threads
+  @param writers    : number of writer threads
+  @param queue_size : maximum number of images waiting between stages
+  @param train_options : keyword arguments of train, e.g. {'backend': 'auto'}
+  @param max_pixels : pixel budget to decode sources (None for full resolution)
+  @param expand     : save results in full resolution of the sources
+  @param result_format  : rgb, palette or npy (see ResultFormat)
+  @param compress_level : zlib level of PNG (None for PIL default)
+  @param label_store    : LabelStore directory to append label maps to instead of saving files
+                          (None to save files), jobs are then (source path, int key)
+  @param worker_id      : prefix of shard names in the label store (None for host name and process id)
+  '''
+  def __init__(self, create_process, readers=2, workers=1, writers=2, queue_size=4, train_options=None,
+               max_pixels=None, expand=False, result_format='rgb', compress_level=None, label_store=None,
+               worker_id=None):
+    self.create_process = create_process
+    self.train_options = train_options or dict()
+    self.max_pixels = max_pixels
+    self.expand = expand
+    self.result_format = result_format
+    self.compress_level = compress_level
+    self.label_store = label_store
+    if worker_id is None:
+      worker_id = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+    self.worker_id = worker_id
+    # Each writer thread appends to its own shard
+    self.store_writers = dict()
+    self.store_lock = threading.Lock()
+    self.readers = readers
+    self.workers = workers
+    self.writers = writers
+    self.queue_size = queue_size
+    self.stats = list()
+    self.errors = list()
+    self.wall = 0.0
+
+  '''
+  Run a stage: take items, handle them and count busy time.
+  @param stats      : StageStats of the stage
+  @param in_queue   : queue to take items from
+  @param out_queue  : queue to put results to (None for the last stage)
+  @param handle     : function(item) returning the result
+  '''
+  def run_stage(self, stats, in_queue, out_queue, handle):
+    while True:
+      item = in_queue.get()
+      if item is END_OF_JOBS:
+        break
+      begin = time.time()
+      try:
+        result = handle(item)
+      except Exception as e:
+        self.errors.append((item[0], e))
+        result = None
+      stats.add(time.time() - begin)
+      if out_queue is not None and result is not None:
+        out_queue.put(result)
+
+  '''
+  Decode a source image.
+  @param job : (source path, destination path)
+  @return (str, LoadedImage) : destination path and image
+  '''
+  def read(self, job):
+    return (job[1], load_image(job[0], self.max_pixels))
+
+  '''
+  Segment an image.
+  @param item : (destination path, LoadedImage)
+  @return (str, numpy.ndarray, numpy.ndarray) : destination path, segmented image and palette
+  '''
+  def segment(self, item):
+    process = self.create_process(item[1].get_array())
+    process.set_result_format('npy' if self.label_store is not None else self.result_format)
+    process.train(**self.train_options)
+    result = process.get_result_image()
+    if self.expand:
+      result = item[1].expand_labels(result)
+    return (item[0], result, process.get_result_palette())
+
+  '''
+  Encode and save a segmented image.
+  @param item : (destination path or label store key, segmented image, palette)
+  '''
+  def write(self, item):
+    if self.label_store is not None:
+      self.get_store_writer().append(item[1], item[0])
+      return
+    rfmt.save_result(item[1], item[0], self.result_format, item[2], self.compress_level)
+
+  '''
+  Get shard writer of the current writer thread.
+  Shards are named by worker id and thread, so runners of other processes or hosts
+  appending to the same store never share a shard.
+  @return LabelStoreWriter : writer
+  '''
+  def get_store_writer(self):
+    ident = threading.get_ident()
+    with self.store_lock:
+      if ident not in self.store_writers:
+        shard = '{0}-{1}'.format(self.worker_id, ident)
+        self.store_writers[ident] = LabelStoreWriter(self.label_store, shard)
+      return self.store_writers[ident]
+
+  '''
+  Close shard writers.
+  Shards are not merged here, since other runners may still append to the store.
+  Call LabelStore.merge_shards after all runners are closed.
+  '''
+  def close_label_store(self):
+    for writer in self.store_writers.values():
+      writer.close()
+    self.store_writers = dict()
+
+  '''
+  Start threads of a stage.
+  @param name      : stage name
+  @param threads   : number of threads
+  @param in_queue  : queue to take items from
+  @param out_queue : queue to put results to
+  @param handle    : function(item) returning the result
+  @return list(threading.Thread) : started threads
+  '''
+  def start_stage(self, name, threads, in_queue, out_queue, handle):
+    stats = StageStats(name, threads)
+    self.stats.append(stats)
+    started = list()
+    for i in range(threads):
+      thread = threading.Thread(target=self.run_stage, args=(stats, in_queue, out_queue, handle))
+      thread.daemon = True
+      thread.start()
+      started.append(thread)
+    return started
+
+  '''
+  Stop threads of a stage after its queue is drained.
+  @param threads  : threads of the stage
+  @param in_queue : queue of the stage
+  '''
+  def stop_stage(self, threads, in_queue):
+    for thread in threads:
+      in_queue.put(END_OF_JOBS)
+    for thread in threads:
+      thread.join()
+
+  '''
+  Run all jobs through the pipeline.
+  @param jobs : list of (source path, destination path), or (source path, int key) with label_store
+  @return list(StageStats) : stats of read, segment and write stages
+  '''
+  def run(self, jobs):
+    if self.label_store is not None and not all(isinstance(job[1], (int, np.integer)) for job in jobs):
+      raise InvalidParameterException()
+    self.stats = list()
+    self.errors = list()
+    job_queue = queue.Queue()
+    decoded_queue = queue.Queue(maxsize=self.queue_size)
+    segmented_queue = queue.Queue(maxsize=self.queue_size)
+    for job in jobs:
+      job_queue.put(job)
+
+    begin = time.time()
+    read_threads = self.start_stage('read', self.readers, job_queue, decoded_queue, self.read)
+    segment_threads = self.start_stage('segment', self.workers, decoded_queue, segmented_queue, self.segment)
+    write_threads = self.start_stage('write', self.writers, segmented_queue, None, self.write)
+    self.stop_stage(read_threads, job_queue)
+    self.stop_stage(segment_threads, decoded_queue)
+    self.stop_stage(write_threads, segmented_queue)
+    if self.label_store is not None:
+      self.close_label_store()
+    self.wall = time.time() - begin
+    return self.stats
+
+  '''
+  Get failed jobs.
+  @return list((object, Exception)) : first element of the failed item and its error
+  '''
+  def get_errors(self):
+    return self.errors
+
+  '''
+  Print utilisation of each stage of the last run.
+  '''
+  def print_stats(self):
+    print("wall : {0:.3f} sec".format(self.wall))
+    for stats in self.stats:
+      print("{0} : threads {1}, items {2}, busy {3:.3f} sec, utilisation {4:.0%}".format(
+        stats.get_name(), stats.threads, stats.get_items(), stats.get_busy(), stats.get_utilisation(self.wall)))
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+
+'''
+Output formats of segmented results
+  rgb     : rgb image (row, col, 3)
+  palette : palette index image (row, col), saved as 8 bit "P" mode PNG
+  npy     : label map (row, col) of component ids (-1 for masked pixels), saved as raw .npy
+'''
+RESULT_FORMATS = ('rgb', 'palette', 'npy')
+
+'''
+Max colors of palette format (index 0 is uncolored)
+'''
+MAX_PALETTE_COLORS = 255
+
+'''
+zlib level for fast PNG encoding, larger files but several times faster than default 6
+'''
+FAST_COMPRESS_LEVEL = 1
+
+'''
+Check result format.
+@param result_format : one of RESULT_FORMATS
+@param n             : number of colors
+'''
+def check_result_format(result_format, n=0):
+  if result_format not in RESULT_FORMATS:
+    raise InvalidParameterException()
+  if result_format == 'palette' and n > MAX_PALETTE_COLORS:
+    raise InvalidParameterException()
+
+'''
+Create empty palette index image.
+@param shape : (row, col)
+@param n     : number of colors
+@return numpy.ndarray : zero index image, uint8 if n fits in a byte
+'''
+def create_index_image(shape, n):
+  dtype = np.uint8 if n <= MAX_PALETTE_COLORS else np.uint16
+  return np.zeros(shape, dtype=dtype)
+
+'''
+Convert palette index image to result of the format.
+@param index         : palette index image (row, col)
+@param labels        : label map (row, col), used by npy format
+@param palette       : uint8 array (colors + 1, 3), row 0 is uncolored
+@param result_format : one of RESULT_FORMATS
+@return numpy.ndarray : rgb image, index image or label map
+'''
+def convert_result(index, labels, palette, result_format):
+  if result_format == 'rgb':
+    return palette[index]
+  if result_format == 'palette':
+    return index
+  return labels
+
+'''
+Save result of the format.
+@param result         : rgb image, index image or label map
+@param name           : result file name (npy format appends .npy if missing)
+@param result_format  : one of RESULT_FORMATS
+@param palette        : uint8 array (colors + 1, 3) for palette format
+@param compress_level : zlib level of PNG (None for PIL default)
+'''
+def save_result(result, name, result_format='rgb', palette=None, compress_level=None):
+  if result_format == 'npy':
+    np.save(name, result)
+    return
+  # PIL is loaded only to save images
+  from PIL import Image
+  options = dict()
+  if compress_level is not None:
+    options['compress_level'] = compress_level
+  if result_format == 'palette':
+    img_raw = Image.fromarray(result, 'P')
+    img_raw.putpalette(palette.tobytes())
+  else:
+    img_raw = Image.fromarray(result)
+  img_raw.save(name, **options)
@@ -0,0 +1,386 @@
+# -*- coding:utf-8 -*-
+
+'''
+Evaluation of segmentation quality and speed.
+Metrics compare a label map with a ground truth label map of the same shape.
+Label values are arbitrary integers, only the partition is compared.
+Overlaps of segments and ground truth regions are counted once into a sparse
+contingency table with np.bincount, and all metrics are computed from it.
+Run this file to print the Pareto table of engine settings.
+'''
+
+import contextlib
+import io
+import os
+import time
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+import UFArraySegment as uas
+import UFCellSegmentation as ucs
+from ImageLoader import LoadedImage, load_image
+
+'''
+Distance in pixels within which a ground truth boundary is recalled
+'''
+BOUNDARY_TOLERANCE = 2
+
+'''
+Renumber labels to 0 to n-1.
+Labels in a small non negative range (e.g. root pixel indices) are renumbered with
+np.bincount, others are sorted with np.unique.
+@param labels : integer label array
+@return (numpy.ndarray, int) : flat compact labels (int64) and number of labels
+'''
+def compact_labels(labels):
+  flat = np.asarray(labels).reshape(-1)
+  if flat.size == 0:
+    return np.empty(0, dtype=np.int64), 0
+  low = int(flat.min())
+  high = int(flat.max())
+  if low >= 0 and high < 4*flat.size:
+    used = np.bincount(flat, minlength=high+1) > 0
+    renumber = np.cumsum(used, dtype=np.int64) - 1
+    return renumber[flat], int(renumber[-1]) + 1
+  values, inverse = np.unique(flat, return_inverse=True)
+  return inverse.reshape(-1).astype(np.int64), len(values)
+
+'''
+Rounds of count_overlaps before sorting the remaining pixels
+'''
+OVERLAP_ROUNDS = 8
+
+'''
+Count pixels of each pair of a segment and a region present in the images.
+When the pairs fit a dense table, they are counted with one np.bincount. Otherwise
+each round counts one region per segment (the region written last into a table
+of segments) and leaves pixels of other regions to the next round. Segments
+overlap a few regions, so a few linear rounds replace sorting all pixels.
+@param seg       : compact segment of each pixel
+@param seg_len   : number of segments
+@param truth     : compact region of each pixel
+@param truth_len : number of regions
+@return (pair_seg, pair_truth, overlap) : segment, region and pixels of each pair
+'''
+def count_overlaps(seg, seg_len, truth, truth_len):
+  if seg_len*truth_len <= 4*len(seg):
+    count = np.bincount(seg*truth_len + truth, minlength=seg_len*truth_len)
+    pair = np.flatnonzero(count)
+    return pair // truth_len, pair % truth_len, count[pair]
+  pair_segs = list()
+  pair_truths = list()
+  overlaps = list()
+  owner = np.empty(seg_len, dtype=np.int64)
+  for i in range(OVERLAP_ROUNDS):
+    if len(seg) == 0:
+      break
+    owner[seg] = truth
+    hit = owner[seg] == truth
+    count = np.bincount(seg[hit], minlength=seg_len)
+    pair = np.flatnonzero(count)
+    pair_segs.append(pair)
+    pair_truths.append(owner[pair])
+    overlaps.append(count[pair])
+    seg = seg[~hit]
+    truth = truth[~hit]
+  if len(seg) > 0:
+    pairs, count = np.unique(seg*truth_len + truth, return_counts=True)
+    pair_segs.append(pairs // truth_len)
+    pair_truths.append(pairs % truth_len)
+    overlaps.append(count)
+  return np.concatenate(pair_segs), np.concatenate(pair_truths), np.concatenate(overlaps)
+
+
+'''
+Sparse contingency table of segments and ground truth regions.
+'''
+class ContingencyTable:
+
+  '''
+  Count overlaps of segments and ground truth regions.
+  @param labels       : label map (row, col)
+  @param ground_truth : ground truth label map (row, col)
+  '''
+  def __init__(self, labels, ground_truth):
+    if np.shape(labels) != np.shape(ground_truth):
+      raise InvalidParameterException()
+    seg, self.seg_len = compact_labels(labels)
+    truth, self.truth_len = compact_labels(ground_truth)
+    self.pixels = len(seg)
+    self.pair_seg, self.pair_truth, self.overlap = count_overlaps(seg, self.seg_len, truth, self.truth_len)
+    self.seg_size = np.bincount(seg, minlength=self.seg_len)
+    self.truth_size = np.bincount(truth, minlength=self.truth_len)
+
+  '''
+  Get number of segments.
+  @return int : segments
+  '''
+  def get_seg_len(self):
+    return self.seg_len
+
+  '''
+  Get number of ground truth regions.
+  @return int : regions
+  '''
+  def get_truth_len(self):
+    return self.truth_len
+
+  '''
+  Get undersegmentation error (corrected form of Neubert and Protzel).
+  Each segment overlapping a region leaks the smaller of its part inside and outside the region.
+  @return float : error in [0, 1], 0 is best
+  '''
+  def get_undersegmentation_error(self):
+    if self.pixels == 0:
+      return 0.0
+    outside = self.seg_size[self.pair_seg] - self.overlap
+    return float(np.minimum(self.overlap, outside).sum()) / self.pixels
+
+  '''
+  Get achievable segmentation accuracy.
+  Each segment is labeled with the region it overlaps most.
+  @return float : accuracy in [0, 1], 1 is best
+  '''
+  def get_achievable_accuracy(self):
+    if self.pixels == 0:
+      return 1.0
+    best = np.zeros(self.seg_len, dtype=np.int64)
+    np.maximum.at(best, self.pair_seg, self.overlap)
+    return float(best.sum()) / self.pixels
+
+  '''
+  Get variation of information H(S|G) + H(G|S).
+  @return float : variation in nats, 0 for the same partition
+  '''
+  def get_variation_of_information(self):
+    if self.pixels == 0:
+      return 0.0
+    joint = self.overlap / self.pixels
+    seg = self.seg_size[self.pair_seg] / self.pixels
+    truth = self.truth_size[self.pair_truth] / self.pixels
+    # Clip rounding below zero for the same partition
+    return max(0.0, float(-(joint * (np.log(joint / seg) + np.log(joint / truth))).sum()))
+
+'''
+Get boundary pixels of a label map.
+A pixel is a boundary if its right or bottom neighbor has another label.
+@param labels : label map (row, col)
+@return numpy.ndarray : bool boundary map (row, col)
+'''
+def calc_boundary_map(labels):
+  labels = np.asarray(labels)
+  boundary = np.zeros(labels.shape, dtype=np.bool_)
+  boundary[:, :-1] |= labels[:, :-1] != labels[:, 1:]
+  boundary[:-1, :] |= labels[:-1, :] != labels[1:, :]
+  return boundary
+
+'''
+Dilate a bool map by a square of the radius.
+@param mask   : bool map (row, col)
+@param radius : radius in pixels
+@return numpy.ndarray : dilated bool map
+'''
+def dilate(mask, radius):
+  result = mask.copy()
+  # Separable square, row then column
+  for axis in (0, 1):
+    source = result.copy()
+    for shift in range(1, radius+1):
+      front = [slice(None)]*2
+      back = [slice(None)]*2
+      front[axis] = slice(shift, None)
+      back[axis] = slice(None, -shift)
+      result[tuple(front)] |= source[tuple(back)]
+      result[tuple(back)] |= source[tuple(front)]
+  return result
+
+'''
+Get boundary recall.
+@param labels       : label map (row, col)
+@param ground_truth : ground truth label map (row, col)
+@param tolerance    : distance in pixels within which a boundary is recalled
+@return float : ratio of ground truth boundary pixels near a segment boundary, 1 is best
+'''
+def calc_boundary_recall(labels, ground_truth, tolerance=BOUNDARY_TOLERANCE):
+  truth = calc_boundary_map(ground_truth)
+  truth_len = int(truth.sum())
+  if truth_len == 0:
+    return 1.0
+  near = dilate(calc_boundary_map(labels), tolerance)
+  return float((truth & near).sum()) / truth_len
+
+'''
+Evaluate a label map with all metrics.
+@param labels       : label map (row, col)
+@param ground_truth : ground truth label map (row, col)
+@param tolerance    : distance in pixels of boundary recall
+@return dict(str, float) : segments, boundary_recall, undersegmentation_error, asa and vi
+'''
+def evaluate(labels, ground_truth, tolerance=BOUNDARY_TOLERANCE):
+  table = ContingencyTable(labels, ground_truth)
+  return {
+    'segments': table.get_seg_len(),
+    'boundary_recall': calc_boundary_recall(labels, ground_truth, tolerance),
+    'undersegmentation_error': table.get_undersegmentation_error(),
+    'asa': table.get_achievable_accuracy(),
+    'vi': table.get_variation_of_information(),
+  }
+
+'''
+Create ground truth of the synthetic image (UFBenchmark.create_synthetic_image).
+@param row   : rows of the image
+@param col   : columns of the image
+@param block : size of blocks
+@return numpy.ndarray : block number of each pixel (row, col)
+'''
+def create_synthetic_ground_truth(row, col, block=32):
+  block_col = (col + block - 1) // block
+  return (np.arange(row)[:, np.newaxis] // block) * block_col + np.arange(col)[np.newaxis, :] // block
+
+'''
+Segment an image with reduced resolution and expand the labels.
+@param img    : numpy array of image
+@param tau_k  : merging super parameter
+@param factor : reduction factor
+@return numpy.ndarray : labels of the full resolution
+'''
+def segment_reduced(img, tau_k, factor):
+  reduced = np.ascontiguousarray(img[::factor, ::factor])
+  labels = uas.segment_image(reduced, tau_k).get_labels().reshape(reduced.shape[:2])
+  return LoadedImage(reduced, img.shape[:2]).expand_labels(labels)
+
+'''
+Engine settings swept by run_sweep, name -> function(img, tau_k) returning labels.
+exact is the reference of images without ground truth.
+'''
+SWEEP_SETTINGS = {
+  'exact': lambda img, tau_k: uas.segment_image(img, tau_k).get_labels().reshape(img.shape[:2]),
+  'python': lambda img, tau_k: uas.segment_image(img, tau_k, backend='python').get_labels().reshape(img.shape[:2]),
+  'prune': lambda img, tau_k: uas.segment_image(img, tau_k, prune=True).get_labels().reshape(img.shape[:2]),
+  'threads2': lambda img, tau_k: uas.segment_image(img, tau_k, threads=2).get_labels().reshape(img.shape[:2]),
+  'reduce2': lambda img, tau_k: segment_reduced(img, tau_k, 2),
+  'reduce4': lambda img, tau_k: segment_reduced(img, tau_k, 4),
+  'cells4': lambda img, tau_k: ucs.segment_cells(img, tau_k, 4, 'block'),
+  'seeds4': lambda img, tau_k: ucs.segment_cells(img, tau_k, 4, 'seed'),
+}
+
+'''
+Result of a setting on an image.
+'''
+class SweepResult:
+
+  '''
+  Initialize with measured values.
+  @param image      : image name
+  @param setting    : setting name
+  @param tau_k      : merging super parameter
+  @param throughput : megapixels per second
+  @param metrics    : dict of evaluate
+  '''
+  def __init__(self, image, setting, tau_k, throughput, metrics):
+    self.image = image
+    self.setting = setting
+    self.tau_k = tau_k
+    self.throughput = throughput
+    self.metrics = metrics
+    self.pareto = False
+
+  '''
+  Get quality used for the Pareto front.
+  @return float : achievable segmentation accuracy
+  '''
+  def get_quality(self):
+    return self.metrics['asa']
+
+  '''
+  Get if the result dominates another one (not worse in both and better in one).
+  @param other : SweepResult
+  @return bool : True if dominates
+  '''
+  def dominates(self, other):
+    if self.throughput < other.throughput or self.get_quality() < other.get_quality():
+      return False
+    return self.throughput > other.throughput or self.get_quality() > other.get_quality()
+
+'''
+Mark results on the Pareto front of throughput and quality for each image.
+@param results : list of SweepResult
+@return list(SweepResult) : results on the front
+'''
+def mark_pareto_front(results):
+  front = list()
+  for result in results:
+    rivals = [other for other in results if other.image == result.image]
+    result.pareto = not any(other.dominates(result) for other in rivals)
+    if result.pareto:
+      front.append(result)
+  return front
+
+'''
+Sweep settings and parameters over images.
+@param images     : list of (name, img, ground truth or None for the exact setting)
+@param settings   : dict of name -> function(img, tau_k) (None for SWEEP_SETTINGS)
+@param tau_k_list : merging super parameters
+@param repeat     : number of measurements
+@return list(SweepResult) : results with Pareto front marked
+'''
+def run_sweep(images, settings=None, tau_k_list=(4.5, 125), repeat=2):
+  settings = SWEEP_SETTINGS if settings is None else settings
+  if uas.is_jit_available():
+    # Compile before measurement
+    uas.compile_merge_sorted_edges()
+  results = list()
+  for name, img, ground_truth in images:
+    megapixels = img.shape[0]*img.shape[1] / 1e6
+    for tau_k in tau_k_list:
+      reference = ground_truth
+      if reference is None:
+        reference = SWEEP_SETTINGS['exact'](img, tau_k)
+      for setting, segment in settings.items():
+        best = None
+        for i in range(repeat):
+          # Engines may print their statistics
+          with contextlib.redirect_stdout(io.StringIO()):
+            begin = time.perf_counter()
+            labels = segment(img, tau_k)
+            elapsed = time.perf_counter() - begin
+          best = elapsed if best is None else min(best, elapsed)
+        results.append(SweepResult(name, setting, tau_k, megapixels / best, evaluate(labels, reference)))
+  mark_pareto_front(results)
+  return results
+
+'''
+Print results as a table, Pareto front is marked with *.
+@param results : list of SweepResult
+'''
+def print_pareto_table(results):
+  print("{0:<16} {1:<10} {2:>7} {3:>9} {4:>8} {5:>6} {6:>6} {7:>6} {8:>6}".format(
+    'image', 'setting', 'tau_k', 'MP/sec', 'segments', 'BR', 'UE', 'ASA', 'VI'))
+  for result in results:
+    metrics = result.metrics
+    print("{0:<16} {1:<10} {2:>7} {3:>9.2f} {4:>8} {5:>6.3f} {6:>6.3f} {7:>6.3f} {8:>6.3f} {9}".format(
+      result.image, result.setting, result.tau_k, result.throughput, metrics['segments'],
+      metrics['boundary_recall'], metrics['undersegmentation_error'], metrics['asa'], metrics['vi'],
+      '*' if result.pareto else ''))
+
+'''
+Create images to evaluate: synthetic blocks with ground truth and sample images if exist.
+Sample images have no ground truth and are compared with the exact setting.
+@param shape        : synthetic image shape (row, col)
+@param block        : size of synthetic blocks
+@param sample_files : sample image paths
+@param max_pixels   : pixel budget of sample images
+@return list((str, numpy.ndarray, numpy.ndarray)) : (name, img, ground truth or None)
+'''
+def create_evaluation_images(shape=(512, 512), block=32, sample_files=('images/sample4.jpg', 'images/sample5.jpg'),
+                             max_pixels=512*512):
+  from UFBenchmark import create_synthetic_image
+  images = [('synthetic', create_synthetic_image(shape[0], shape[1], block), create_synthetic_ground_truth(shape[0], shape[1], block))]
+  for path in sample_files:
+    if os.path.exists(path):
+      images.append((os.path.basename(path), load_image(path, max_pixels, 'RGB').get_array(), None))
+  return images
+
+
+if __name__ == '__main__':
+  print_pareto_table(run_sweep(create_evaluation_images()))
@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+
+from ParameterExceptions import InvalidParameterException, MemoryBudgetException
+import UFArrayGraph as uag
+import UFArraySegment as uas
+
+'''
+Planner of segmentation engines.
+Edge count is exact, peak memory and runtime are estimated with constants calibrated
+by UFBenchmark.calibrate_planner, memory constants bound the measured peaks from above:
+  memory  = mem_pixel * pixels + mem_edge * edges
+  runtime = sec_pixel * pixels + sec_edge * edges + sec_edge_pixel * edges * pixels
+The last term is for engines which rename edges on each merge (SegmentationProcess).
+Memory is the peak memory of training and result image, the source image is not included.
+All engines run in memory, there is no tiled engine for images.
+
+Engines:
+  uf_numba       : UFSegmentationProcess, backend numba
+  uf_python      : UFSegmentationProcess, backend python
+  uf_dict        : UFSegmentationProcess, backend dict
+  legacy_compact : SegmentationProcess, compact mode
+  legacy         : SegmentationProcess
+'''
+ENGINES = ('uf_numba', 'uf_python', 'uf_dict', 'legacy_compact', 'legacy')
+
+'''
+Calibrated constants of engines (mem_pixel, mem_edge, sec_pixel, sec_edge, sec_edge_pixel)
+'''
+ENGINE_CONSTANTS = {
+  'uf_numba':       (225.5, 32.66, 7.725e-07, 3.168e-07, 0.0),
+  'uf_python':      (225.0, 32.7, 8.677e-06, 2.902e-06, 0.0),
+  'uf_dict':        (518.7, 396.9, 0.0, 1.238e-05, 0.0),
+  'legacy_compact': (126.7, 136.6, 0.0, 8.347e-06, 2.155e-09),
+  'legacy':         (352.1, 589.5, 0.0, 5.26e-06, 3.443e-08),
+}
+
+'''
+Seconds to compile the numba merge loop on the first use
+'''
+JIT_COMPILE_SECONDS = 0.9
+
+'''
+Get search directions of a graph.
+@param shape : (img_row, img_col)
+@param graph : grid or nn
+@param nn    : nearest neighbor distance of nn graph
+@return list((int, int)) : search directions (drow, dcol)
+'''
+def get_graph_search(shape, graph='grid', nn=2):
+  if graph == 'grid':
+    return uag.GRID_GRAPH_SEARCH
+  if graph == 'nn':
+    return uag.create_nn_search(shape, nn)
+  raise InvalidParameterException()
+
+'''
+Count edges of a graph, same as the edges trained by all engines.
+@param shape  : (img_row, img_col)
+@param search : search directions (drow, dcol)
+@return int : number of edges
+'''
+def count_edges(shape, search):
+  return uag.count_neighbor_edges(shape, search, 0, shape[0])
+
+'''
+Get engines available in this environment.
+@return list(str) : engine names
+'''
+def get_available_engines():
+  return [engine for engine in ENGINES if engine != 'uf_numba' or uas.is_jit_available()]
+
+
+'''
+Estimate of an engine for an image.
+'''
+class PlanEstimate:
+
+  '''
+  Initialize with estimated values.
+  @param engine   : engine name
+  @param shape    : (img_row, img_col)
+  @param graph    : grid or nn
+  @param nn       : nearest neighbor distance of nn graph
+  @param edge_len : number of edges
+  @param memory   : peak memory in bytes
+  @param runtime  : runtime in seconds
+  '''
+  def __init__(self, engine, shape, graph, nn, edge_len, memory, runtime):
+    self.engine = engine
+    self.shape = shape
+    self.graph = graph
+    self.nn = nn
+    self.edge_len = edge_len
+    self.memory = memory
+    self.runtime = runtime
+
+  '''
+  Get engine name.
+  @return str : engine
+  '''
+  def get_engine(self):
+    return self.engine
+
+  '''
+  Get number of edges.
+  @return int : edges
+  '''
+  def get_edge_len(self):
+    return self.edge_len
+
+  '''
+  Get estimated peak memory.
+  @return int : bytes
+  '''
+  def get_memory(self):
+    return self.memory
+
+  '''
+  Get estimated runtime.
+  @return float : seconds
+  '''
+  def get_runtime(self):
+    return self.runtime
+
+  '''
+  Get keyword arguments of train for the engine.
+  @return dict : train options
+  '''
+  def get_train_options(self):
+    if self.engine.startswith('uf_'):
+      return {'backend': self.engine[3:]}
+    return dict()
+
+  '''
+  Create segmentation process of the engine.
+  @param img     : source image (shape must be the planned one)
+  @param dst_img : path of an output image (None to keep it in memory)
+  @param top_n   : color segmentations having top n area
+  @param tau_k   : merging super parameter
+  @return SegmentationProcess or UFSegmentationProcess : process, train it with get_train_options
+  '''
+  def create_process(self, img, dst_img, top_n, tau_k=4.5):
+    if tuple(img.shape[:2]) != tuple(self.shape):
+      raise InvalidParameterException()
+    if self.engine.startswith('uf_'):
+      import UFSegmentationProcess as usp
+      if self.graph == 'grid':
+        return usp.GridGraphSegmentation(img, dst_img, top_n, tau_k)
+      return usp.NearestNeightborGraphSegmentation(img, dst_img, top_n, tau_k, self.nn)
+    import SegmentationProcess as sp
+    import GraphBasedSegment as gbs
+    config = gbs.GBSConfig(tau_k=tau_k)
+    compact = self.engine == 'legacy_compact'
+    if self.graph == 'grid':
+      return sp.GridGraphSegmentation(img, dst_img, top_n, config, compact)
+    return sp.NearestNeightborGraphSegmentation(img, dst_img, top_n, self.nn, config, compact)
+
+  '''
+  Print the estimate.
+  '''
+  def print_estimate(self):
+    print("engine : {0}, edges : {1}, memory : {2:.1f} MB, runtime : {3:.1f} sec".format(
+      self.engine, self.edge_len, self.memory / 2**20, self.runtime))
+
+'''
+Estimate edges, peak memory and runtime of an engine.
+@param shape  : (img_row, img_col)
+@param engine : one of ENGINES
+@param graph  : grid or nn
+@param nn     : nearest neighbor distance of nn graph
+@return PlanEstimate : estimate
+'''
+def estimate(shape, engine, graph='grid', nn=2):
+  if engine not in ENGINE_CONSTANTS:
+    raise InvalidParameterException()
+  shape = (int(shape[0]), int(shape[1]))
+  pixels = shape[0] * shape[1]
+  edge_len = count_edges(shape, get_graph_search(shape, graph, nn))
+  mem_pixel, mem_edge, sec_pixel, sec_edge, sec_edge_pixel = ENGINE_CONSTANTS[engine]
+  memory = int(mem_pixel * pixels + mem_edge * edge_len)
+  runtime = sec_pixel * pixels + sec_edge * edge_len + sec_edge_pixel * edge_len * pixels
+  if engine == 'uf_numba' and uas.jit_merge_sorted_edges is None:
+    runtime += JIT_COMPILE_SECONDS
+  return PlanEstimate(engine, shape, graph, nn, edge_len, memory, runtime)
+
+'''
+Pick the fastest engine which fits the memory budget.
+@param shape         : (img_row, img_col)
+@param memory_budget : bytes allowed for the segmentation
+@param graph         : grid or nn
+@param nn            : nearest neighbor distance of nn graph
+@param engines       : engines to consider (None for all available)
+@return PlanEstimate : estimate of the picked engine
+@exception MemoryBudgetException : if no engine fits the budget
+'''
+def plan(shape, memory_budget, graph='grid', nn=2, engines=None):
+  engines = get_available_engines() if engines is None else engines
+  estimates = [estimate(shape, engine, graph, nn) for engine in engines]
+  fitting = [est for est in estimates if est.get_memory() <= memory_budget]
+  if len(fitting) == 0:
+    smallest = min(estimates, key=lambda est: est.get_memory())
+    raise MemoryBudgetException(
+      "{0}x{1} {2} graph ({3} edges) needs at least {4:.1f} MB with {5}, budget is {6:.1f} MB".format(
+        shape[0], shape[1], graph, smallest.get_edge_len(), smallest.get_memory() / 2**20,
+        smallest.get_engine(), memory_budget / 2**20))
+  return min(fitting, key=lambda est: est.get_runtime())
@@ -1,29 +1,46 @@
 # -*- coding:utf-8 -*-
 
 from abc import ABCMeta, abstractmethod
-from PIL import Image
-import numpy as np
+from math import sqrt
 
-from Component import *
-from Edge import *
+from Component import Component, MergedComponentList, CompactMergedComponentList
+from Edge import EdgeIdSet, MergedEdgeList, CompactMergedEdgeList
 import GraphBasedSegment as gbs
 import CreateResultImage as cri
+import MakeColor as mcolor
+import ResultFormat as rfmt
+from TraceProfiler import NULL_TRACER
+import ImageInput as imin
 
 class SegmentationProcess:
   __metaclass__ = ABCMeta
 
   '''
   Initialize with empty lists.
-  @param src_img : source image to process
-  @param dst_img : path of an output image
+  @param src_img : source image to process, numpy array, memmap, shaped buffer or PIL image
+                   (see ImageInput), arrays and buffers are not copied
+  @param dst_img : path of an output image (None to keep it in memory)
   @param top_n   : color segmentations having top n area
+  @param config  : GBSConfig of this run (None for GraphBasedSegment defaults)
+  @param compact : keep pixel ids and minimum differences instead of Pixel, Component and Edge objects
   '''
-  def __init__(self, src_img, dst_img, top_n):
-    self.img = src_img
+  def __init__(self, src_img, dst_img, top_n, config=None, compact=False):
+    self.img = imin.as_image_array(src_img)
     self.dst_img = dst_img
     self.top_n = top_n
-    self.mcl = MergedComponentList()
-    self.mel = MergedEdgeList()
+    self.config = config if config is not None else gbs.GBSConfig()
+    self.compact = compact
+    self.result_image = None
+    self.result_format = 'rgb'
+    self.compress_level = None
+    self.tracer = NULL_TRACER
+    if compact:
+      size = src_img.shape[0] * src_img.shape[1]
+      self.mcl = CompactMergedComponentList(size, src_img.shape[1])
+      self.mel = CompactMergedEdgeList(size)
+    else:
+      self.mcl = MergedComponentList()
+      self.mel = MergedEdgeList()
     self.converted_id_list = ConvertedIdList()
     self.cd = dict()
 
@@ -51,6 +68,36 @@ class SegmentationProcess:
   def init_graph(self):
     pass
 
+  '''
+  Create graph in compact mode, in the same order as init_graph.
+  @param search : search directions (drow, dcol)
+  '''
+  def init_compact_graph(self, search):
+    img_row = self.img.shape[0]
+    img_col = self.img.shape[1]
+    # Values are calculated once per pixel in one pass, same as Pixel
+    values = imin.calc_luminance_plane(self.img).reshape(-1).tolist()
+    self.mel.reserve(sum((img_row - abs(dif[0])) * (img_col - abs(dif[1])) for dif in search))
+
+    # y loop
+    for row in range(img_row):
+      # x loop
+      for col in range(img_col):
+        # Issue unique id for this element
+        pixel_id = img_col * row + col
+        value = values[pixel_id]
+        self.mcl.add_pixel_id(pixel_id, pixel_id, value)
+
+        # Search edges
+        for dif in search:
+          target_row = row + dif[0]
+          target_col = col + dif[1]
+          if not (0 <= target_row < img_row and 0 <= target_col < img_col):
+            continue
+          target_id = img_col * target_row + target_col
+          # Add edge
+          self.mel.add_difference(pixel_id, target_id, abs(value - values[target_id]))
+
   '''
   Construct new segmentation from previous segmentation.
   @param id_set : id set to check segmentation
@@ -67,7 +114,7 @@ class SegmentationProcess:
 
     id_set = EdgeIdSet(converted_id1, converted_id2)
 
-    if gbs.gbs_is_merge(id_set=id_set, mcl=self.mcl, mel=self.mel):
+    if gbs.gbs_is_merge(id_set=id_set, mcl=self.mcl, mel=self.mel, config=self.config):
       # merge id2 to id1
       self.mcl.merge(id_set.get_id2(), id_set.get_id1())
       self.mel.merge(id_set.get_id2(), id_set.get_id1())
@@ -77,22 +124,66 @@ class SegmentationProcess:
   Train graph based segmentation.
   '''
   def train(self):
-    # Initialize segmentation
-    self.init_graph()
-    # Release dict memory
-    self.cd.clear()
+    with self.tracer.span('train', shape=list(self.img.shape[:2]), compact=self.compact):
+      # Initialize segmentation
+      with self.tracer.span('init_graph'):
+        self.init_graph()
+        # Release dict memory
+        self.cd.clear()
+
+      # Train segmentation
+      with self.tracer.span('sort_edges'):
+        sorted_mc = self.mel.create_sorted_mc()
+      print("edge_len = {0}".format(len(sorted_mc)))
+
+      with self.tracer.sample('merge', edges=len(sorted_mc)):
+        for phase, mc in enumerate(sorted_mc):
+          self.construct_segmentation(id_set=mc[0])
+          if phase % 1000 == 0:
+            print("phase = {0}".format(phase))
+
+      # Create image
+      with self.tracer.span('create_result'):
+        self.result_image = cri.create_colorized_result(self.img, self.mcl, self.top_n, self.dst_img,
+          self.result_format, self.compress_level)
+
+  '''
+  Set tracer to profile stages of train.
+  @param tracer : TraceProfiler.TraceRecorder (NULL_TRACER to disable)
+  '''
+  def set_tracer(self, tracer):
+    self.tracer = tracer
+
+  '''
+  Set output format of the result.
+  @param result_format  : rgb, palette or npy (see ResultFormat)
+  @param compress_level : zlib level of PNG, ResultFormat.FAST_COMPRESS_LEVEL for fast encoding
+  '''
+  def set_result_format(self, result_format, compress_level=None):
+    rfmt.check_result_format(result_format, self.top_n)
+    self.result_format = result_format
+    self.compress_level = compress_level
 
-    # Train segmentation
-    sorted_mc = self.mel.create_sorted_mc()
-    print("edge_len = {0}".format(len(sorted_mc)))
+  '''
+  Get segmented image created by train.
+  @return numpy.ndarray : segmented image of the result format
+  '''
+  def get_result_image(self):
+    return self.result_image
 
-    for phase, mc in enumerate(sorted_mc):
-      self.construct_segmentation(id_set=mc[0])
-      if phase % 1000 == 0:
-        print("phase = {0}".format(phase))
+  '''
+  Get parameters of this run.
+  @return GBSConfig : config
+  '''
+  def get_config(self):
+    return self.config
 
-    # Create image
-    cri.create_colorized_result(self.img, self.mcl, self.top_n, self.dst_img)
+  '''
+  Get color table of the result in palette format.
+  @return numpy.ndarray : uint8 array (top_n + 1, 3), row 0 is uncolored
+  '''
+  def get_result_palette(self):
+    return mcolor.get_palette(self.top_n)
 
 
 '''
@@ -109,6 +200,9 @@ class GridGraphSegmentation(SegmentationProcess):
   Create grid-graph based initailized components.
   '''
   def init_graph(self):
+    if self.compact:
+      self.init_compact_graph(self.grid_graph_search)
+      return
     img_row = self.img.shape[0]
     img_col = self.img.shape[1]
 
@@ -148,9 +242,11 @@ class NearestNeightborGraphSegmentation(SegmentationProcess):
   @param dst_img : path of an output image
   @param top_n   : color segmentations having top n area
   @param nn      : nearest neighbor distance
+  @param config  : GBSConfig of this run (None for GraphBasedSegment defaults)
+  @param compact : keep pixel ids and minimum differences instead of objects
   '''
-  def __init__(self, src_img, dst_img, top_n, nn=2):
-    SegmentationProcess.__init__(self, src_img, dst_img, top_n)
+  def __init__(self, src_img, dst_img, top_n, nn=2, config=None, compact=False):
+    SegmentationProcess.__init__(self, src_img, dst_img, top_n, config, compact)
     # Limit maximum nn to size/4
     img_row = self.img.shape[0]
     img_col = self.img.shape[1]
@@ -177,6 +273,9 @@ class NearestNeightborGraphSegmentation(SegmentationProcess):
   Create grid-graph based initailized components.
   '''
   def init_graph(self):
+    if self.compact:
+      self.init_compact_graph(self.nn_graph_search)
+      return
     img_row = self.img.shape[0]
     img_col = self.img.shape[1]
 
@@ -0,0 +1,296 @@
+# -*- coding:utf-8 -*-
+
+import json
+import os
+import sys
+import threading
+import time
+
+'''
+Opt-in profiling of segmentation runs.
+Processes hold NULL_TRACER unless set_tracer is called, which only enters empty
+context managers around stages, so nothing is measured or sampled when disabled.
+TraceRecorder writes spans of stages as Chrome trace events (chrome://tracing,
+Perfetto), and optionally samples the stack of the merge loop into collapsed
+stacks ("frame;frame;frame count" lines) for flamegraph tools.
+'''
+
+'''
+Span doing nothing
+'''
+class NullSpan:
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+  '''
+  Add values known after the stage began.
+  @param args : values shown with the span
+  '''
+  def set_args(self, **args):
+    pass
+
+'''
+Shared span of the disabled tracer
+'''
+NULL_SPAN = NullSpan()
+
+
+'''
+Tracer of disabled profiling.
+'''
+class NullTracer:
+
+  '''
+  Get a span of a stage.
+  @param name : stage name
+  @param args : values shown with the span
+  @return NullSpan : span doing nothing
+  '''
+  def span(self, name, **args):
+    return NULL_SPAN
+
+  '''
+  Get a span of a stage with stack sampling.
+  @param name : stage name
+  @param args : values shown with the span
+  @return NullSpan : span doing nothing
+  '''
+  def sample(self, name, **args):
+    return NULL_SPAN
+
+'''
+Shared tracer of processes without profiling
+'''
+NULL_TRACER = NullTracer()
+
+
+'''
+Span recording its time as a trace event.
+'''
+class TraceSpan:
+
+  '''
+  Initialize with a recorder.
+  @param recorder : TraceRecorder
+  @param name     : stage name
+  @param args     : values shown with the span
+  '''
+  def __init__(self, recorder, name, args):
+    self.recorder = recorder
+    self.name = name
+    self.args = args
+    self.begin = 0.0
+
+  def __enter__(self):
+    self.begin = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.recorder.add_event(self.name, self.begin, time.perf_counter(), self.args)
+    return False
+
+  '''
+  Add values known after the stage began, such as counters of the stage.
+  @param args : values shown with the span
+  '''
+  def set_args(self, **args):
+    self.args.update(args)
+
+
+'''
+Switch interval shared by sampled spans of all threads.
+The interval is process wide, so it is lowered by the first entering span and
+restored by the last exiting one, nested or overlapping spans do not restore a
+value set by another span.
+'''
+class SwitchInterval:
+
+  '''
+  Initialize with no span.
+  '''
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.count = 0
+    self.saved = None
+    self.interval = None
+
+  '''
+  Lower the switch interval for a span.
+  @param interval : seconds between samples of the span
+  '''
+  def acquire(self, interval):
+    with self.lock:
+      if self.count == 0:
+        self.saved = sys.getswitchinterval()
+        self.interval = self.saved
+      self.count += 1
+      if interval < self.interval:
+        self.interval = interval
+        sys.setswitchinterval(interval)
+
+  '''
+  Restore the switch interval after the last span.
+  '''
+  def release(self):
+    with self.lock:
+      self.count -= 1
+      if self.count == 0:
+        sys.setswitchinterval(self.saved)
+        self.saved = None
+        self.interval = None
+
+'''
+Switch interval of the process
+'''
+SWITCH_INTERVAL = SwitchInterval()
+
+
+'''
+Span sampling the stack of the entering thread in a background thread.
+'''
+class SampledSpan(TraceSpan):
+
+  def __enter__(self):
+    self.ident = threading.get_ident()
+    self.stop = threading.Event()
+    # Let the sampler take the GIL as often as it samples
+    SWITCH_INTERVAL.acquire(self.recorder.sample_interval)
+    self.sampler = threading.Thread(target=self.run_sampler)
+    self.sampler.daemon = True
+    self.sampler.start()
+    return TraceSpan.__enter__(self)
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    TraceSpan.__exit__(self, exc_type, exc_value, traceback)
+    self.stop.set()
+    self.sampler.join()
+    SWITCH_INTERVAL.release()
+    return False
+
+  '''
+  Sample the stack until the span exits.
+  '''
+  def run_sampler(self):
+    while not self.stop.wait(self.recorder.sample_interval):
+      frame = sys._current_frames().get(self.ident)
+      if frame is not None:
+        self.recorder.add_stack(get_frame_stack(frame))
+
+'''
+Get names of frames from the outermost one.
+@param frame : innermost frame
+@return tuple(str) : frame names (file:qualified name)
+'''
+def get_frame_stack(frame):
+  names = list()
+  while frame is not None:
+    code = frame.f_code
+    names.append("{0}:{1}".format(os.path.basename(code.co_filename), getattr(code, 'co_qualname', code.co_name)))
+    frame = frame.f_back
+  names.reverse()
+  return tuple(names)
+
+
+'''
+Tracer recording spans and stack samples.
+'''
+class TraceRecorder:
+
+  '''
+  Initialize with no event.
+  @param sample          : sample stacks in spans of sample
+  @param sample_interval : seconds between samples
+  '''
+  def __init__(self, sample=False, sample_interval=0.001):
+    self.sampling = sample
+    self.sample_interval = sample_interval
+    self.origin = time.perf_counter()
+    self.events = list()
+    self.stacks = dict()
+    self.lock = threading.Lock()
+
+  '''
+  Get a span of a stage.
+  @param name : stage name
+  @param args : values shown with the span
+  @return TraceSpan : span to enter with with statement
+  '''
+  def span(self, name, **args):
+    return TraceSpan(self, name, args)
+
+  '''
+  Get a span of a stage with stack sampling if enabled.
+  @param name : stage name
+  @param args : values shown with the span
+  @return TraceSpan : span to enter with with statement
+  '''
+  def sample(self, name, **args):
+    if not self.sampling:
+      return TraceSpan(self, name, args)
+    return SampledSpan(self, name, args)
+
+  '''
+  Add a complete event.
+  @param name  : stage name
+  @param begin : perf_counter at the beginning
+  @param end   : perf_counter at the end
+  @param args  : values shown with the span
+  '''
+  def add_event(self, name, begin, end, args):
+    event = {'name': name, 'cat': 'segmentation', 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+             'ts': (begin - self.origin) * 1e6, 'dur': (end - begin) * 1e6, 'args': args}
+    with self.lock:
+      self.events.append(event)
+
+  '''
+  Count a sampled stack.
+  @param stack : frame names from the outermost one
+  '''
+  def add_stack(self, stack):
+    with self.lock:
+      self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+  '''
+  Get recorded events.
+  @return list(dict) : trace events
+  '''
+  def get_events(self):
+    return self.events
+
+  '''
+  Get sampled stacks.
+  @return dict(tuple, int) : number of samples of each stack
+  '''
+  def get_stacks(self):
+    return self.stacks
+
+  '''
+  Save events as Chrome trace event JSON.
+  @param path : output file
+  '''
+  def save_trace(self, path):
+    with open(path, 'w') as f:
+      json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+  '''
+  Save sampled stacks as collapsed stacks for flamegraph tools.
+  @param path : output file
+  '''
+  def save_collapsed(self, path):
+    with open(path, 'w') as f:
+      for stack, count in sorted(self.stacks.items()):
+        f.write("{0} {1}\n".format(';'.join(name.replace(';', ':') for name in stack), count))
+
+  '''
+  Print total time of each stage.
+  '''
+  def print_summary(self):
+    totals = dict()
+    for event in self.events:
+      totals[event['name']] = totals.get(event['name'], 0.0) + event['dur'] / 1e6
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]):
+      print("{0} : {1:.3f} sec".format(name, total))
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+
+import time
+
+'''
+Token to cancel a running training cooperatively.
+Share the token with the training and call cancel from another thread.
+'''
+class CancelToken:
+
+  '''
+  Initialize as not cancelled.
+  '''
+  def __init__(self):
+    self.cancelled = False
+
+  '''
+  Request the training to stop.
+  '''
+  def cancel(self):
+    self.cancelled = True
+
+  '''
+  Get if the training is requested to stop.
+  @return bool : True if cancelled, else False
+  '''
+  def is_cancelled(self):
+    return self.cancelled
+
+
+'''
+Check time budget and cancel token every check_interval edges.
+'''
+class TrainController:
+
+  '''
+  Initialize with a time budget and a cancel token.
+  @param time_budget    : seconds allowed for training from now (None for no limit)
+  @param cancel_token   : CancelToken to stop training (None for no token)
+  @param check_interval : number of edges between checks
+  '''
+  def __init__(self, time_budget=None, cancel_token=None, check_interval=1000):
+    self.deadline = None if time_budget is None else time.time() + time_budget
+    self.cancel_token = cancel_token
+    self.check_interval = max(1, check_interval)
+
+  '''
+  Get if the training should stop now.
+  @return bool : True if the deadline passed or the token is cancelled
+  '''
+  def is_expired(self):
+    if self.cancel_token is not None and self.cancel_token.is_cancelled():
+      return True
+    if self.deadline is not None and time.time() >= self.deadline:
+      return True
+    return False
+
+  '''
+  Get if the training should stop before processing the edge.
+  Checking is done only every check_interval edges to keep the loop cheap.
+  @param phase : index of the edge to be processed
+  @return bool : True if the training should stop
+  '''
+  def should_stop(self, phase):
+    if phase % self.check_interval != 0:
+      return False
+    return self.is_expired()
+
+
+'''
+Result of the training.
+Union find is always valid even if the training is stopped halfway.
+'''
+class TrainResult:
+
+  '''
+  Initialize with the union find state.
+  @param uf        : union find (result)
+  @param completed : True if all edges are processed
+  @param processed : number of processed edges
+  @param edge_len  : number of all edges
+  '''
+  def __init__(self, uf, completed, processed, edge_len):
+    self.uf = uf
+    self.completed = completed
+    self.processed = processed
+    self.edge_len = edge_len
+
+  '''
+  Get union find.
+  @return UnionFind : union find tree
+  '''
+  def get_union_find(self):
+    return self.uf
+
+  '''
+  Get if all edges are processed.
+  @return bool : True if completed, else False
+  '''
+  def is_completed(self):
+    return self.completed
+
+  '''
+  Get fraction of processed edges.
+  @return float : processed edges / all edges [0.0-1.0]
+  '''
+  def get_progress(self):
+    if self.edge_len == 0:
+      return 1.0
+    return float(self.processed) / self.edge_len
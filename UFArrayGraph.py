@@ -0,0 +1,328 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+'''
+Vectorized graph construction over flat pixel indices.
+Pixel index is row*img_col + col (0 origin, unlike create_pixel_id).
+Edges are issued in the same order as init_graph of UFSegmentationProcess,
+pixel by pixel and direction by direction, so sorting them stably gives the
+same merge order as the dict based process.
+'''
+
+'''
+Search for 4 direction (drow, dcol)
+'''
+GRID_GRAPH_SEARCH = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+'''
+Create search directions of nearest neighbor graph.
+Same as NearestNeightborGraphSegmentation.init_nn.
+@param shape : (img_row, img_col)
+@param nn    : nearest neighbor distance, limited to size/4
+@return list((int, int)) : search directions (drow, dcol)
+'''
+def create_nn_search(shape, nn):
+  nn = min(nn, min(shape[0]/4, shape[1]/4))
+  search = list()
+  for row in range(0, int(nn)+1):
+    for col in range(int(nn), -int(nn), -1):
+      # Check if the cell is in the range nn
+      if (row**2 + col**2) ** 0.5 > nn:
+        continue
+      # Check if not base point
+      if row == 0 and col == 0:
+        continue
+      search.append((row, col))
+  return search
+
+'''
+Calculate luminance of all pixels at once.
+Same weights as calc_luminance.
+@param img : numpy array of image (row, col[, rgb(a)])
+@param out : float64 array (row, col) to write into (None to allocate)
+@return numpy.ndarray : luminance plane (row, col)
+'''
+def calc_luminance_plane(img, out=None):
+  return calc_luminance_values(img, 2, out)
+
+'''
+Calculate luminance of all elements of an image or a volume at once.
+@param img          : numpy array (spatial axes[, rgb(a)])
+@param spatial_ndim : number of spatial axes (2 for image, 3 for volume)
+@param out          : float64 array of spatial shape to write into (None to allocate)
+@return numpy.ndarray : luminance of each element
+'''
+def calc_luminance_values(img, spatial_ndim, out=None):
+  if out is None:
+    out = np.empty(img.shape[:spatial_ndim], dtype=np.float64)
+  if img.ndim == spatial_ndim:
+    # monocolor
+    out[...] = img
+    return out
+  np.multiply(img[..., 0], 0.298912, out=out)
+  out += 0.586611*img[..., 1]
+  out += 0.114478*img[..., 2]
+  return out
+
+'''
+Get search directions which issue edges.
+When both dif and -dif are searched, an edge is issued twice. The backward one
+(-dif, pointing to a smaller index) is issued later, so it is dropped here.
+@param search : search directions
+@return list(tuple) : search directions issuing edges
+'''
+def get_issuing_search(search):
+  search = [tuple(dif) for dif in search]
+  zero = (0,)*len(search[0])
+  return [dif for dif in search if not (dif < zero and tuple(-d for d in dif) in search)]
+
+'''
+Get region of origins (in band coordinates) which have a target for the direction.
+@param shape : shape of the spatial axes
+@param dif   : search direction
+@param begin : first index of the band along axis 0
+@param end   : index to stop before along axis 0
+@return tuple(slice) : region, None if empty
+'''
+def get_search_region(shape, dif, begin, end):
+  region = [slice(max(0, -d), min(length, length - d)) for d, length in zip(dif, shape)]
+  region[0] = slice(max(region[0].start, begin) - begin, min(region[0].stop, end) - begin)
+  if any(r.start >= r.stop for r in region):
+    return None
+  return tuple(region)
+
+'''
+Count edges issued from origins in a band.
+@param shape  : shape of the spatial axes
+@param search : search directions
+@param begin  : first index of the band along axis 0
+@param end    : index to stop before along axis 0
+@return int : number of edges
+'''
+def count_neighbor_edges(shape, search, begin, end):
+  shape = tuple(int(length) for length in shape[:len(search[0])])
+  count = 0
+  for dif in get_issuing_search(search):
+    region = get_search_region(shape, dif, begin, end)
+    if region is not None:
+      count += int(np.prod([r.stop - r.start for r in region], dtype=np.int64))
+  return count
+
+'''
+Create edges of the graph as pairs of flat pixel indices.
+Duplicated edges (searched from both pixels) are kept only at the first place.
+Shape and search directions may have any number of axes (2 for image, 3 for volume).
+Origins can be limited to a band along axis 0, targets may be out of the band.
+@param shape  : (img_row, img_col) or (depth, img_row, img_col)
+@param search : search directions (drow, dcol) or (ddepth, drow, dcol)
+@param begin  : first index of the band along axis 0
+@param end    : index to stop before along axis 0 (None for the end)
+@return (numpy.ndarray, numpy.ndarray) : origin and target pixel indices (int64)
+'''
+def create_neighbor_index(shape, search, begin=0, end=None):
+  shape = tuple(int(length) for length in shape[:len(search[0])])
+  end = shape[0] if end is None else end
+  strides = [int(np.prod(shape[axis+1:], dtype=np.int64)) for axis in range(len(shape))]
+  band_shape = (end - begin,) + shape[1:]
+  search = get_issuing_search(search)
+  base = np.arange(begin*strides[0], end*strides[0], dtype=np.int64).reshape(band_shape)
+  targets = np.full(band_shape + (len(search),), -1, dtype=np.int64)
+  for order, dif in enumerate(search):
+    region = get_search_region(shape, dif, begin, end)
+    if region is None:
+      continue
+    targets[region + (order,)] = base[region] + sum(d*stride for d, stride in zip(dif, strides))
+  targets = targets.reshape(-1)
+  valid = targets >= 0
+  origin = np.repeat(base.reshape(-1), len(search))[valid]
+  target = targets[valid]
+  return origin, target
+
+'''
+Create mask of active pixels from the alpha channel.
+@param img       : numpy array of image (row, col[, rgb(a)])
+@param threshold : pixels with alpha over threshold are active
+@return numpy.ndarray : bool mask (row, col), all True without alpha channel
+'''
+def create_alpha_mask(img, threshold=0):
+  if img.ndim != 3 or img.shape[2] != 4:
+    return np.ones(img.shape[:2], dtype=np.bool_)
+  return img[..., 3] > threshold
+
+'''
+Create edges between active pixels with compact ids.
+Excluded pixels have no id and no edge, so work scales with active pixels.
+Edges are in the same order as create_neighbor_index without excluded ones.
+@param shape  : (img_row, img_col) or (depth, img_row, img_col)
+@param search : search directions
+@param mask   : bool mask of active pixels with the shape
+@return (origin, target, active) : compact ids of edges and flat indices of active pixels
+'''
+def create_masked_neighbor_index(shape, search, mask):
+  shape = tuple(int(length) for length in shape[:len(search[0])])
+  mask = np.asarray(mask, dtype=np.bool_).reshape(shape)
+  active = np.flatnonzero(mask)
+  compact = np.full(mask.size, -1, dtype=np.int64)
+  compact[active] = np.arange(len(active), dtype=np.int64)
+  strides = [int(np.prod(shape[axis+1:], dtype=np.int64)) for axis in range(len(shape))]
+
+  origins = list()
+  targets = list()
+  for dif in get_issuing_search(search):
+    region = get_search_region(shape, dif, 0, shape[0])
+    if region is None:
+      continue
+    shifted = tuple(slice(r.start + d, r.stop + d) for r, d in zip(region, dif))
+    valid = mask[region] & mask[shifted]
+    coords = np.unravel_index(np.flatnonzero(valid), valid.shape)
+    origin = np.ravel_multi_index(tuple(c + r.start for c, r in zip(coords, region)), shape).astype(np.int64)
+    origins.append(origin)
+    targets.append(origin + sum(d*stride for d, stride in zip(dif, strides)))
+  if not origins:
+    empty = np.empty(0, dtype=np.int64)
+    return empty, empty, active
+  origin = np.concatenate(origins)
+  target = np.concatenate(targets)
+  # Directions are concatenated in search order, so stable sort gives issued order
+  sorter = np.argsort(origin, kind='stable')
+  return compact[origin[sorter]], compact[target[sorter]], active
+
+'''
+Resolve links between runs to their smallest linked run.
+Each round hooks the larger root of every unresolved link to the smaller one,
+then jumps to grand parents until all runs point their roots.
+@param run_len : number of runs
+@param first   : run of one end of links
+@param second  : run of the other end of links
+@return numpy.ndarray : smallest linked run of each run
+'''
+def resolve_run_links(run_len, first, second):
+  parent = np.arange(run_len, dtype=np.int64)
+  while len(first) > 0:
+    low = np.minimum(parent[first], parent[second])
+    high = np.maximum(parent[first], parent[second])
+    # Resolved links stay resolved
+    pending = low != high
+    if not pending.any():
+      break
+    first = first[pending]
+    second = second[pending]
+    np.minimum.at(parent, high[pending], low[pending])
+    while True:
+      grand = parent[parent]
+      if np.array_equal(grand, parent):
+        break
+      parent = grand
+  return parent
+
+'''
+Label connected runs of equal values in two raster passes.
+Pass 1 numbers runs along rows, pass 2 links runs joined by the other search
+directions and resolves the links. Pixels joined by zero weight edges of the graph
+get the same label.
+@param plane  : values (row, col), e.g. luminance plane
+@param search : search directions (drow, dcol)
+@param mask   : bool mask (row, col) of active pixels (None for all)
+@return (numpy.ndarray, int) : label of each pixel (row, col) numbered in raster order of the
+                               first pixels (-1 for excluded pixels) and number of labels
+'''
+def label_flat_runs(plane, search, mask=None):
+  shape = plane.shape
+  flat = plane.reshape(-1)
+  mask = None if mask is None else np.asarray(mask, dtype=np.bool_).reshape(shape)
+  search = get_issuing_search(search)
+  horizontal = [dif for dif in search if dif[0] == 0 and abs(dif[1]) == 1]
+  # Pass 1: runs along rows
+  start = np.ones(flat.size, dtype=np.bool_)
+  if horizontal:
+    np.not_equal(flat[1:], flat[:-1], out=start[1:])
+    start[::shape[1]] = True
+    if mask is not None:
+      active = mask.reshape(-1)
+      start[1:] |= ~(active[1:] & active[:-1])
+  run = (np.cumsum(start) - 1).reshape(shape)
+  run_len = int(run[-1, -1]) + 1
+
+  # Pass 2: links between runs
+  firsts = list()
+  seconds = list()
+  for dif in search:
+    if dif in horizontal:
+      continue
+    region = get_search_region(shape, dif, 0, shape[0])
+    if region is None:
+      continue
+    shifted = tuple(slice(r.start + d, r.stop + d) for r, d in zip(region, dif))
+    first = run[region]
+    second = run[shifted]
+    joined = (plane[region] == plane[shifted]) & (first != second)
+    if mask is not None:
+      joined &= mask[region] & mask[shifted]
+    # A link repeating the left one is dropped
+    joined[:, 1:] &= ~(joined[:, :-1] & (first[:, 1:] == first[:, :-1]) & (second[:, 1:] == second[:, :-1]))
+    firsts.append(first[joined])
+    seconds.append(second[joined])
+  empty = np.empty(0, dtype=np.int64)
+  parent = resolve_run_links(run_len, np.concatenate(firsts) if firsts else empty,
+    np.concatenate(seconds) if seconds else empty)
+
+  roots = parent == np.arange(run_len)
+  if mask is not None:
+    # Excluded pixels are runs alone
+    roots[run[~mask]] = False
+  number = np.cumsum(roots) - 1
+  labels = number[parent][run]
+  if mask is not None:
+    labels[~mask] = -1
+  return labels, int(roots.sum())
+
+'''
+Collapse runs into single nodes.
+Edges inside runs weigh zero, and the other edges keep the issued order.
+@param runs   : run label of each node
+@param origin : origin node indices of edges
+@param target : target node indices of edges
+@param weight : edge weights
+@return (origin, target, weight, first, size) : edges between runs, first node and number of nodes of each run
+'''
+def collapse_flat_runs(runs, origin, target, weight):
+  if len(runs) == 0:
+    return origin, target, weight, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+  size = np.bincount(runs)
+  # Runs are numbered in order of their first nodes
+  seen = np.empty(len(runs), dtype=np.int64)
+  seen[0] = -1
+  np.maximum.accumulate(runs[:-1], out=seen[1:])
+  first = np.flatnonzero(runs > seen)
+  between = weight != 0
+  return runs[origin[between]], runs[target[between]], weight[between], first, size
+
+'''
+Calculate edge weights as difference of luminance.
+@param plane  : luminance plane
+@param origin : origin pixel indices
+@param target : target pixel indices
+@param out    : float64 array to write into (None to allocate)
+@param work   : float64 work array of the same size (None to allocate)
+@return numpy.ndarray : edge weights
+'''
+def calc_edge_weights(plane, origin, target, out=None, work=None):
+  flat = plane.reshape(-1)
+  if out is None:
+    out = np.empty(len(origin), dtype=np.float64)
+  if work is None:
+    work = np.empty(len(origin), dtype=np.float64)
+  np.take(flat, origin, out=out)
+  np.take(flat, target, out=work)
+  np.subtract(out, work, out=out)
+  np.abs(out, out=out)
+  return out
+
+'''
+Sort edges by no-decreasing edge weight keeping the issued order on ties.
+@param weight : edge weights
+@return numpy.ndarray : edge order
+'''
+def sort_edges(weight):
+  return np.argsort(weight, kind='stable')
@@ -0,0 +1,333 @@
+# -*- coding:utf-8 -*-
+
+import importlib.util
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+from UFArrayUnionFind import ArrayUnionFind, find
+import UFArrayGraph as uag
+import UFThreadedGraph as utg
+import TraceProfiler as tp
+
+'''
+Merge two trees of root nodes.
+Merge smaller rank tree to another one.
+@param parent  : parent array
+@param rank    : rank array
+@param size    : size array
+@param min_dif : min dif array
+@param s1      : root node id
+@param s2      : root node id
+@param edge_value : interested edge value
+'''
+def union_roots(parent, rank, size, min_dif, s1, s2, edge_value):
+  if rank[s1] < rank[s2]:
+    s1, s2 = s2, s1
+  elif rank[s1] == rank[s2]:
+    rank[s1] += 1
+  parent[s2] = s1
+  size[s1] += size[s2]
+  min_dif[s1] = edge_value
+
+'''
+Create the union function keeping the largest internal difference.
+Same as union_roots for edges in sorted order, where edge_value is never smaller
+than the internal differences. Trees merged out of sorted order (e.g. cells or
+components built before the loop) keep Int(C) as the largest merged edge.
+@param union_roots : union function
+@return function : union function with the same arguments
+'''
+def create_union_roots_keep_max(union_roots):
+
+  def union_roots_keep_max(parent, rank, size, min_dif, s1, s2, edge_value):
+    union_roots(parent, rank, size, min_dif, s1, s2, max(edge_value, min_dif[s1], min_dif[s2]))
+
+  return union_roots_keep_max
+
+'''
+Union function in pure Python keeping the largest internal difference
+'''
+union_roots_keep_max = create_union_roots_keep_max(union_roots)
+
+'''
+Create the merge loop with find and union functions.
+The same loop is run as it is or compiled with the compiled functions.
+@param find        : find function
+@param union_roots : union function
+@return function : merge loop
+'''
+def create_merge_sorted_edges(find, union_roots):
+
+  '''
+  Merge components along sorted edges from start to stop.
+  Same predicate as UFGraphBasedSegment.merge.
+  @param parent  : parent array
+  @param rank    : rank array
+  @param size    : size array
+  @param min_dif : min dif array
+  @param origin  : origin pixel indices of edges
+  @param target  : target pixel indices of edges
+  @param weight  : edge weights
+  @param order   : edge order sorted by weight
+  @param tau_k   : merging super parameter
+  @param start   : first position in order to process
+  @param stop    : position in order to stop before
+  @return int : number of merges
+  '''
+  def merge_sorted_edges(parent, rank, size, min_dif, origin, target, weight, order, tau_k, start, stop):
+    merged = 0
+    for phase in range(start, stop):
+      edge = order[phase]
+      edge_value = weight[edge]
+      s1 = find(parent, origin[edge])
+      s2 = find(parent, target[edge])
+      if s1 == s2:
+        continue
+      mint = min(min_dif[s1] + tau_k / size[s1], min_dif[s2] + tau_k / size[s2])
+      if edge_value < mint:
+        union_roots(parent, rank, size, min_dif, s1, s2, edge_value)
+        merged += 1
+    return merged
+
+  return merge_sorted_edges
+
+'''
+Merge loop in pure Python
+'''
+merge_sorted_edges = create_merge_sorted_edges(find, union_roots)
+
+'''
+Merge loop in pure Python keeping the largest internal difference
+'''
+merge_sorted_edges_keep_max = create_merge_sorted_edges(find, union_roots_keep_max)
+
+'''
+Backends of the merge loop
+  python : pure Python loop
+  numba  : loop compiled with numba
+  auto   : numba if importable, else python
+'''
+BACKENDS = ('python', 'numba')
+
+'''
+Merge loops compiled with numba (None until compiled)
+'''
+jit_merge_sorted_edges = None
+jit_merge_sorted_edges_keep_max = None
+
+'''
+Compile the merge loop with numba.
+numba is imported only here, so it costs nothing unless compiled backend is used.
+@param keep_max : compile the loop with union_roots_keep_max
+@return function : compiled merge loop
+'''
+def compile_merge_sorted_edges(keep_max=False):
+  global jit_merge_sorted_edges, jit_merge_sorted_edges_keep_max
+  import numba
+  if keep_max:
+    if jit_merge_sorted_edges_keep_max is None:
+      jit_merge_sorted_edges_keep_max = numba.njit(nogil=True)(create_merge_sorted_edges(numba.njit(find),
+        numba.njit(create_union_roots_keep_max(numba.njit(union_roots)))))
+    return jit_merge_sorted_edges_keep_max
+  if jit_merge_sorted_edges is None:
+    jit_merge_sorted_edges = numba.njit(nogil=True)(
+      create_merge_sorted_edges(numba.njit(find), numba.njit(union_roots)))
+  return jit_merge_sorted_edges
+
+'''
+Get if numba is importable.
+@return bool : True if compiled backend is available
+'''
+def is_jit_available():
+  return importlib.util.find_spec('numba') is not None
+
+'''
+Get the merge loop of the backend.
+@param backend  : python, numba or auto
+@param keep_max : loop with union_roots_keep_max
+@return function : merge loop
+'''
+def get_merge_kernel(backend='auto', keep_max=False):
+  python_kernel = merge_sorted_edges_keep_max if keep_max else merge_sorted_edges
+  if backend == 'python':
+    return python_kernel
+  if backend == 'numba':
+    return compile_merge_sorted_edges(keep_max)
+  if backend == 'auto':
+    # Fall back to pure Python silently
+    return compile_merge_sorted_edges(keep_max) if is_jit_available() else python_kernel
+  raise InvalidParameterException()
+
+'''
+Merge components along all sorted edges.
+Stop between chunks of edges when the controller expires.
+@param uf         : ArrayUnionFind
+@param origin     : origin pixel indices of edges
+@param target     : target pixel indices of edges
+@param weight     : edge weights
+@param order      : edge order sorted by weight
+@param tau_k      : merging super parameter
+@param controller : TrainController (None for no limit)
+@param backend    : python, numba or auto
+@param keep_max   : keep the largest internal difference for trees merged out of sorted order
+@return int : number of processed edges
+'''
+def train_sorted_edges(uf, origin, target, weight, order, tau_k, controller=None, backend='auto', keep_max=False):
+  kernel = get_merge_kernel(backend, keep_max)
+  parent, rank, size, min_dif = uf.get_arrays()
+  edge_len = len(order)
+  if controller is None:
+    kernel(parent, rank, size, min_dif, origin, target, weight, order, tau_k, 0, edge_len)
+    return edge_len
+  for start in range(0, edge_len, controller.check_interval):
+    if controller.is_expired():
+      return start
+    stop = min(edge_len, start + controller.check_interval)
+    kernel(parent, rank, size, min_dif, origin, target, weight, order, tau_k, start, stop)
+  return edge_len
+
+'''
+Counter of edges sorted and pruned by train_pruned_edges.
+'''
+class EdgePruneCounter:
+
+  '''
+  Initialize with zero.
+  '''
+  def __init__(self):
+    self.sorted_len = 0
+    self.pruned_len = 0
+    self.processed_len = 0
+    self.rounds = 0
+
+  '''
+  Get number of sorted edges.
+  @return int : sorted edges
+  '''
+  def get_sorted(self):
+    return self.sorted_len
+
+  '''
+  Get number of pruned edges, which are never sorted.
+  @return int : pruned edges
+  '''
+  def get_pruned(self):
+    return self.pruned_len
+
+  '''
+  Get number of processed edges including pruned ones.
+  @return int : processed edges
+  '''
+  def get_processed(self):
+    return self.processed_len
+
+  '''
+  Get number of rounds of sorting.
+  @return int : rounds
+  '''
+  def get_rounds(self):
+    return self.rounds
+
+'''
+Merge components along edges, sorting only edges which can be merged.
+An edge merges only if weight < Int(C) + tau_k/|C| for both components, and Int(C)
+is at most the largest weight merged so far (max_merged). So an edge is never
+merged if weight >= max_merged + tau_k. Edges lighter than a bound are sorted and
+merged, then the bound is raised to (at least) max_merged + tau_k until the
+bound stops growing. Remaining edges are pruned without sorting.
+The result is the same as train_sorted_edges on all sorted edges.
+@param uf         : ArrayUnionFind
+@param origin     : origin pixel indices of edges
+@param target     : target pixel indices of edges
+@param weight     : edge weights (not sorted)
+@param tau_k      : merging super parameter
+@param controller : TrainController (None for no limit)
+@param backend    : python, numba or auto
+@return EdgePruneCounter : numbers of sorted and pruned edges
+'''
+def train_pruned_edges(uf, origin, target, weight, tau_k, controller=None, backend='auto'):
+  counter = EdgePruneCounter()
+  min_dif = uf.get_arrays()[3]
+  upper = float(min_dif.max()) + tau_k
+  step = tau_k
+  remaining = np.arange(len(weight), dtype=np.int64)
+  while len(remaining) > 0:
+    # Edges under the bound in issued order
+    light = weight[remaining] < upper
+    group = remaining[light]
+    remaining = remaining[~light]
+    order = group[uag.sort_edges(weight[group])]
+    counter.sorted_len += len(order)
+    counter.rounds += 1
+    processed = train_sorted_edges(uf, origin, target, weight, order, tau_k, controller, backend)
+    counter.processed_len += processed
+    if processed < len(order):
+      # Stopped by the controller
+      return counter
+    bound = float(min_dif.max()) + tau_k
+    if bound <= upper:
+      # All remaining edges are at least the bound
+      break
+    # Raise the bound with growing steps to keep rounds few
+    upper = max(bound, upper + step)
+    step *= 2
+  counter.pruned_len = len(remaining)
+  counter.processed_len += len(remaining)
+  return counter
+
+'''
+Segment an image with vectorized graph construction.
+@param img     : numpy array of image
+@param tau_k   : merging super parameter
+@param search  : search directions (drow, dcol)
+@param threads : number of threads to build the graph (1 for no thread)
+@param backend : python, numba or auto
+@param prune   : sort only edges which can be merged (see train_pruned_edges)
+@param tracer  : TraceProfiler.TraceRecorder to record the merge and its edge counters
+@return ArrayUnionFind : union find (result)
+'''
+def segment_image(img, tau_k=4.5, search=uag.GRID_GRAPH_SEARCH, threads=1, backend='auto', prune=False,
+                  tracer=tp.NULL_TRACER):
+  if threads == 1:
+    origin, target = uag.create_neighbor_index(img.shape, search)
+    plane = uag.calc_luminance_plane(img)
+    weight = uag.calc_edge_weights(plane, origin, target)
+    order = None if prune else uag.sort_edges(weight)
+  else:
+    origin, target, weight, order = utg.build_graph_threaded(img, search, threads, sort=not prune)
+  uf = ArrayUnionFind(img.shape[0]*img.shape[1])
+  if prune:
+    with tracer.sample('merge_pruned', edges=len(weight)) as span:
+      counter = train_pruned_edges(uf, origin, target, weight, float(tau_k), backend=backend)
+      span.set_args(sorted=counter.get_sorted(), pruned=counter.get_pruned())
+  else:
+    with tracer.sample('merge', edges=len(weight)):
+      train_sorted_edges(uf, origin, target, weight, order, float(tau_k), backend=backend)
+  return uf
+
+'''
+Segment only active pixels of an image.
+Excluded pixels have no union find entry and no edge.
+@param img             : numpy array of image
+@param mask            : bool mask of active pixels (None to take it from alpha channel)
+@param tau_k           : merging super parameter
+@param search          : search directions (drow, dcol)
+@param backend         : python, numba or auto
+@param alpha_threshold : pixels with alpha over threshold are active when mask is None
+@return numpy.ndarray : root pixel index of each pixel (row, col), -1 for excluded pixels
+'''
+def segment_masked_image(img, mask=None, tau_k=4.5, search=uag.GRID_GRAPH_SEARCH, backend='auto', alpha_threshold=0):
+  if mask is None:
+    mask = uag.create_alpha_mask(img, alpha_threshold)
+  origin, target, active = uag.create_masked_neighbor_index(img.shape, search, mask)
+  # Luminance of active pixels only
+  pixels = img.reshape((-1,) + img.shape[2:])[active]
+  values = uag.calc_luminance_values(pixels, 1)
+  weight = uag.calc_edge_weights(values, origin, target)
+  order = uag.sort_edges(weight)
+  uf = ArrayUnionFind(len(active))
+  train_sorted_edges(uf, origin, target, weight, order, float(tau_k), backend=backend)
+  labels = np.full(img.shape[0]*img.shape[1], -1, dtype=np.int64)
+  labels[active] = active[uf.get_labels()]
+  return labels.reshape(img.shape[:2])
@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+'''
+Implementation of Union Find Tree over flat numpy arrays.
+Index of the arrays means flat pixel index (row*img_col + col).
+  parent  : parent node (the node itself for root)
+  rank    : rank of the tree (valid for root)
+  size    : size of the tree (valid for root)
+  min_dif : largest merged edge value in the tree (valid for root)
+Same values as UFRoot, but arrays can be reused and compiled.
+'''
+class ArrayUnionFind:
+
+  '''
+  Initialize every node as a single node tree.
+  @param size : number of nodes
+  '''
+  def __init__(self, size):
+    self.identity = np.arange(size, dtype=np.int64)
+    self.parent = self.identity.copy()
+    # Rank never exceeds log2(size)
+    self.rank = np.ones(size, dtype=np.int8)
+    self.size = np.ones(size, dtype=np.int64)
+    self.min_dif = np.zeros(size, dtype=np.float64)
+    self.work = None
+
+  '''
+  Reset every node to a single node tree without allocation.
+  '''
+  def reset(self):
+    np.copyto(self.parent, self.identity)
+    self.rank.fill(1)
+    self.size.fill(1)
+    self.min_dif.fill(0)
+
+  '''
+  Find the root node id of the node.
+  @param id : node id
+  @return int : root node id
+  '''
+  def find(self, id):
+    return find(self.parent, id)
+
+  '''
+  Get root node id of all nodes.
+  @param out : int64 array to write into (None to allocate)
+  @return numpy.ndarray : root node id of each node
+  '''
+  def get_labels(self, out=None):
+    if out is None:
+      out = np.empty(len(self.parent), dtype=np.int64)
+    if self.work is None:
+      self.work = np.empty(len(self.parent), dtype=np.int64)
+    np.copyto(out, self.parent)
+    # Jump to grand parent until all nodes point their roots
+    while True:
+      np.take(out, out, out=self.work)
+      if np.array_equal(self.work, out):
+        break
+      np.copyto(out, self.work)
+    return out
+
+  '''
+  Get root id and size.
+  @return list((int, int)) : root node id and size of the tree
+  '''
+  def subsetall(self):
+    roots = np.flatnonzero(self.parent == self.identity)
+    return list(zip(roots.tolist(), self.size[roots].tolist()))
+
+  '''
+  Get arrays of the union find.
+  @return (parent, rank, size, min_dif) : arrays of the union find
+  '''
+  def get_arrays(self):
+    return (self.parent, self.rank, self.size, self.min_dif)
+
+
+'''
+Find the root node id with path compression.
+Written with plain loops to be compiled as it is.
+@param parent : parent array
+@param id     : node id
+@return int : root node id
+'''
+def find(parent, id):
+  root = id
+  while parent[root] != root:
+    root = parent[root]
+  # compress the tree search root
+  while parent[id] != root:
+    next_id = parent[id]
+    parent[id] = root
+    id = next_id
+  return root
@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+from UFArrayUnionFind import ArrayUnionFind
+from UFArraySegment import train_sorted_edges
+import UFArrayGraph as uag
+
+'''
+Segmentation of many small images packed into one id space.
+Images of the same shape are stacked and their edges are built at once as a volume
+searched only inside slices, then images get disjoint id ranges. Edges of a stack
+are sorted at once image by image (one row per image), so the merge loop walks the
+union find image by image in cache. All edges are merged in one loop, and the union
+find is split back into label maps. No edge crosses images and the sort is stable,
+so every label map is the same as the image segmented alone (root pixel index in
+the image).
+'''
+class UFBatchSegmentation:
+
+  '''
+  Initialize with parameters shared by images.
+  @param tau_k   : merging super parameter
+  @param search  : search directions (drow, dcol)
+  @param backend : merge loop backend (python, numba or auto)
+  '''
+  def __init__(self, tau_k=4.5, search=uag.GRID_GRAPH_SEARCH, backend='auto'):
+    self.tau_k = float(tau_k)
+    self.backend = backend
+    # Search inside a slice of stacked images
+    self.search = [(0,) + tuple(dif) for dif in search]
+    self.stack_index = dict()
+
+  '''
+  Get edges of stacked images, cached for repeated batches of thumbnails.
+  @param shape : (images, row, col)
+  @return (numpy.ndarray, numpy.ndarray) : origin and target indices in the stack
+  '''
+  def get_stack_index(self, shape):
+    if shape not in self.stack_index:
+      self.stack_index[shape] = uag.create_neighbor_index(shape, self.search)
+    return self.stack_index[shape]
+
+  '''
+  Pack images into one graph.
+  @param images : list of numpy arrays (row, col[, rgb(a)])
+  @return (origin, target, weight, order, offsets) : sorted edges in the packed id space and first id of each image
+  '''
+  def pack(self, images):
+    groups = dict()
+    for number, img in enumerate(images):
+      if img.ndim not in (2, 3):
+        raise InvalidParameterException()
+      groups.setdefault(img.shape, list()).append(number)
+    offsets = np.empty(len(images), dtype=np.int64)
+    origins = list()
+    targets = list()
+    weights = list()
+    orders = list()
+    offset = 0
+    edge_offset = 0
+    for shape, numbers in groups.items():
+      stack_shape = (len(numbers),) + shape[:2]
+      origin, target = self.get_stack_index(stack_shape)
+      values = uag.calc_luminance_values(np.stack([images[number] for number in numbers]), 3)
+      weight = uag.calc_edge_weights(values, origin, target)
+      # Edges of an image are contiguous and images have the same number of edges
+      image_edges = weight.reshape(len(numbers), -1)
+      order = np.argsort(image_edges, axis=1, kind='stable')
+      order += edge_offset + image_edges.shape[1]*np.arange(len(numbers), dtype=np.int64)[:, np.newaxis]
+      orders.append(order.reshape(-1))
+      weights.append(weight)
+      origins.append(origin + offset)
+      targets.append(target + offset)
+      image_size = shape[0]*shape[1]
+      offsets[numbers] = offset + image_size*np.arange(len(numbers), dtype=np.int64)
+      offset += len(numbers)*image_size
+      edge_offset += len(weight)
+    if not origins:
+      empty = np.empty(0, dtype=np.int64)
+      return empty, empty, np.empty(0, dtype=np.float64), empty, offsets
+    return np.concatenate(origins), np.concatenate(targets), np.concatenate(weights), np.concatenate(orders), offsets
+
+  '''
+  Segment images in one merge loop.
+  @param images : list of numpy arrays (row, col[, rgb(a)]), shapes may differ
+  @return list(numpy.ndarray) : root pixel index of each pixel (row, col) of each image
+  '''
+  def segment(self, images):
+    images = [np.asarray(img) for img in images]
+    origin, target, weight, order, offsets = self.pack(images)
+    size = sum(img.shape[0]*img.shape[1] for img in images)
+    uf = ArrayUnionFind(size)
+    train_sorted_edges(uf, origin, target, weight, order, self.tau_k, backend=self.backend)
+    labels = uf.get_labels()
+    results = list()
+    for img, offset in zip(images, offsets.tolist()):
+      image_size = img.shape[0]*img.shape[1]
+      # Roots are inside the image, shift them to the image id space
+      results.append((labels[offset:offset + image_size] - offset).reshape(img.shape[:2]))
+    return results
+
+'''
+Segment many small images at once.
+@param images  : list of numpy arrays (row, col[, rgb(a)])
+@param tau_k   : merging super parameter
+@param search  : search directions (drow, dcol)
+@param backend : python, numba or auto
+@return list(numpy.ndarray) : root pixel index of each pixel (row, col) of each image
+'''
+def segment_images(images, tau_k=4.5, search=uag.GRID_GRAPH_SEARCH, backend='auto'):
+  return UFBatchSegmentation(tau_k, search, backend).segment(images)
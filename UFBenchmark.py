@@ -0,0 +1,256 @@
+# -*- coding:utf-8 -*-
+
+'''
+Benchmark of graph based segmentation with Union Find
+Run this file to print the results.
+'''
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import UFArrayGraph as uag
+import UFArraySegment as uas
+import UFBatchSegmentation as ubatch
+from UFArrayUnionFind import ArrayUnionFind
+
+'''
+Create a synthetic image of flat blocks with noise.
+@param row   : rows of the image
+@param col   : columns of the image
+@param block : size of blocks
+@param seed  : random seed
+@return numpy.ndarray : uint8 image (row, col, 3)
+'''
+def create_synthetic_image(row, col, block=32, seed=0):
+  rng = np.random.RandomState(seed)
+  block_row = (row + block - 1) // block
+  block_col = (col + block - 1) // block
+  colors = rng.randint(0, 256, (block_row, block_col, 3))
+  img = np.repeat(np.repeat(colors, block, axis=0), block, axis=1)[:row, :col]
+  img = img + rng.randint(-8, 9, img.shape)
+  return np.clip(img, 0, 255).astype(np.uint8)
+
+'''
+Measure the best time of a function.
+@param func   : function without parameter
+@param repeat : number of measurements
+@return float : best time in seconds
+'''
+def measure(func, repeat=3):
+  best = None
+  for i in range(repeat):
+    begin = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - begin
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+'''
+Benchmark merge loop backends on the same sorted edges.
+Partitions of all backends are checked to be identical.
+@param shape  : image shape (row, col)
+@param tau_k  : merging super parameter
+@param repeat : number of measurements
+@return dict(str, float) : edges per second of each backend
+'''
+def benchmark_backends(shape=(256, 256), tau_k=125, repeat=3):
+  img = create_synthetic_image(shape[0], shape[1])
+  origin, target = uag.create_neighbor_index(img.shape, uag.GRID_GRAPH_SEARCH)
+  weight = uag.calc_edge_weights(uag.calc_luminance_plane(img), origin, target)
+  order = uag.sort_edges(weight)
+  size = shape[0]*shape[1]
+
+  backends = ['python']
+  if uas.is_jit_available():
+    backends.append('numba')
+    # Compile before measurement
+    uas.compile_merge_sorted_edges()
+
+  results = dict()
+  reference = None
+  for backend in backends:
+    uf = ArrayUnionFind(size)
+
+    def run():
+      uf.reset()
+      uas.train_sorted_edges(uf, origin, target, weight, order, float(tau_k), backend=backend)
+
+    elapsed = measure(run, repeat)
+    labels = uf.get_labels()
+    if reference is None:
+      reference = labels
+    elif not np.array_equal(labels, reference):
+      raise AssertionError("partition of {0} differs from python".format(backend))
+    results[backend] = len(order) / elapsed
+    print("backend : {0}, edges : {1}, {2:.0f} edges/sec".format(backend, len(order), results[backend]))
+  return results
+
+'''
+Benchmark packed segmentation of thumbnails against segmenting them one by one.
+Label maps of both are checked to be identical.
+@param shape  : thumbnail shape (row, col)
+@param count  : number of thumbnails
+@param tau_k  : merging super parameter
+@param repeat : number of measurements
+@return float : speedup of the packed segmentation
+'''
+def benchmark_batch(shape=(64, 64), count=200, tau_k=4.5, repeat=3):
+  images = [create_synthetic_image(shape[0], shape[1], block=8, seed=seed) for seed in range(count)]
+  batch = ubatch.UFBatchSegmentation(tau_k)
+  if uas.is_jit_available():
+    uas.compile_merge_sorted_edges()
+  results = list()
+
+  def run_single():
+    import UFSegmentationProcess as usp
+    del results[:]
+    with contextlib.redirect_stdout(io.StringIO()):
+      for img in images:
+        process = usp.GridGraphSegmentation(img, None, 10, tau_k)
+        process.set_result_format('npy')
+        process.train()
+        results.append(process.get_result_image())
+
+  single = measure(run_single, repeat)
+  packed = measure(lambda: batch.segment(images), repeat)
+  for img, expected, labels in zip(images, results, batch.segment(images)):
+    # Label values differ between engines, compare partitions
+    pairs = np.unique(np.stack([expected.reshape(-1), labels.reshape(-1)]), axis=1)
+    if len(np.unique(pairs[0])) != pairs.shape[1] or len(np.unique(pairs[1])) != pairs.shape[1]:
+      raise AssertionError("packed partition differs from the image segmented alone")
+  print("thumbnails : {0} of {1}, one by one : {2:.3f} sec, packed : {3:.3f} sec, speedup {4:.1f}".format(
+    count, shape, single, packed, single / packed))
+  return single / packed
+
+'''
+Script to measure import time of a module in a new interpreter
+'''
+IMPORT_SCRIPT = '''
+import sys, time
+begin = time.perf_counter()
+import {0}
+elapsed = time.perf_counter() - begin
+print(elapsed, 'numpy' in sys.modules, 'PIL' in sys.modules, 'numba' in sys.modules)
+'''
+
+'''
+Benchmark import time of modules, each measured in a new interpreter like a fresh worker.
+@param modules : module names
+@param repeat  : number of measurements
+@return dict(str, float) : best import time in seconds of each module
+'''
+def benchmark_import(modules=('UnionFind', 'UFGraphBasedSegment', 'SegmentationProcess', 'UFArraySegment',
+                              'UFSegmentationProcess', 'PipelineRunner'), repeat=5):
+  results = dict()
+  for module in modules:
+    best = None
+    for i in range(repeat):
+      output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT.format(module)],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+      fields = output.decode().split()
+      elapsed = float(fields[0])
+      best = elapsed if best is None else min(best, elapsed)
+    loaded = [name for name, flag in zip(('numpy', 'PIL', 'numba'), fields[1:]) if flag == 'True']
+    results[module] = best
+    print("import : {0}, {1:.1f} msec, loads {2}".format(module, best * 1000, ', '.join(loaded) or 'nothing'))
+  return results
+
+'''
+Image sizes measured to calibrate each engine, (small, large) side length
+'''
+CALIBRATION_SIDES = {
+  'uf_numba': (200, 400),
+  'uf_python': (100, 200),
+  'uf_dict': (50, 100),
+  'legacy_compact': (30, 60),
+  'legacy': (20, 40),
+}
+
+'''
+Margin of calibrated memory over the largest measured peak
+'''
+CALIBRATION_MEMORY_MARGIN = 1.1
+
+'''
+Measure peak memory of a planned engine with tracemalloc.
+@param plan  : SegmentationPlanner.PlanEstimate of the image
+@param img   : source image
+@param tau_k : merging super parameter
+@return int : peak bytes of creating and training the process
+'''
+def measure_peak_memory(plan, img, tau_k=4.5):
+  def run():
+    process = plan.create_process(img, None, 10, tau_k)
+    process.train(**plan.get_train_options())
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    # Lazy allocations of the first run are not a part of the engine
+    run()
+    tracemalloc.start()
+    try:
+      run()
+      return tracemalloc.get_traced_memory()[1]
+    finally:
+      tracemalloc.stop()
+
+'''
+Calibrate constants of SegmentationPlanner on this machine.
+Each engine segments grid and nn graphs of two sizes. Peak memory is measured with
+tracemalloc and runtime separately, because tracing slows the engines down.
+Memory constants are fitted by least squares and then scaled up, so that no measured
+peak is over its estimate, with CALIBRATION_MEMORY_MARGIN.
+@param engines : engine names (None for all available)
+@param nn      : nearest neighbor distance of nn graph
+@param tau_k   : merging super parameter
+@return dict(str, tuple) : constants of each engine, same layout as SegmentationPlanner.ENGINE_CONSTANTS
+'''
+def calibrate_planner(engines=None, nn=3, tau_k=4.5):
+  import SegmentationPlanner as splan
+  engines = splan.get_available_engines() if engines is None else engines
+  if 'uf_numba' in engines:
+    # Compile time is added by the planner separately
+    uas.compile_merge_sorted_edges()
+  results = dict()
+  for engine in engines:
+    samples = list()
+    for side in CALIBRATION_SIDES[engine]:
+      img = create_synthetic_image(side, side, block=8)
+      for graph in ('grid', 'nn'):
+        plan = splan.estimate(img.shape[:2], engine, graph, nn)
+
+        def run():
+          process = plan.create_process(img, None, 10, tau_k)
+          process.train(**plan.get_train_options())
+
+        memory = measure_peak_memory(plan, img, tau_k)
+        with contextlib.redirect_stdout(io.StringIO()):
+          elapsed = measure(run, 1)
+        samples.append((side * side, plan.get_edge_len(), memory, elapsed))
+    pixels, edges, memory, elapsed = [np.array(values, dtype=np.float64) for values in zip(*samples)]
+    mem_pixel, mem_edge = np.maximum(np.linalg.lstsq(np.stack([pixels, edges], axis=1), memory, rcond=None)[0], 0.0)
+    # The planner must not underestimate any measured peak
+    scale = np.max(memory / (mem_pixel * pixels + mem_edge * edges)) * CALIBRATION_MEMORY_MARGIN
+    mem_pixel *= scale
+    mem_edge *= scale
+    if engine.startswith('legacy'):
+      # Edges are renamed on each merge
+      features = np.stack([np.zeros_like(pixels), edges, edges * pixels], axis=1)
+    else:
+      features = np.stack([pixels, edges, np.zeros_like(pixels)], axis=1)
+    sec_pixel, sec_edge, sec_edge_pixel = np.linalg.lstsq(features, elapsed, rcond=None)[0]
+    constants = tuple(max(0.0, float(value)) for value in (mem_pixel, mem_edge, sec_pixel, sec_edge, sec_edge_pixel))
+    results[engine] = constants
+    print("  '{0}': ({1}),".format(engine, ', '.join('{0:.4g}'.format(value) for value in constants)))
+  return results
+
+
+if __name__ == '__main__':
+  benchmark_import()
+  benchmark_backends()
+  benchmark_batch()
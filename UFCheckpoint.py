@@ -0,0 +1,239 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+import UFArraySegment as uas
+import ImageInput as imin
+
+'''
+Checkpoint of the merge loop over flat arrays.
+Files in the checkpoint directory (all arrays are .npy, loadable with mmap_mode):
+  meta.json        : parameters and content hash of the job, written after the edge arrays
+  origin, target, weight, order, active : sorted graph, written once
+  state0, state1   : two buffers of union find arrays (parent, rank, size, min_dif)
+  state.json       : buffer and edge cursor of the last complete state
+A state is copied into the buffer not pointed by state.json, and flushed in a
+background thread while the merge loop goes on. state.json is replaced after the
+flush, so a crash at any time leaves the last complete state to resume.
+Resuming from the state gives the same arrays as an uninterrupted run, because
+the merge loop depends only on the arrays and the cursor.
+'''
+
+'''
+Names of edge arrays
+'''
+EDGE_ARRAYS = ('origin', 'target', 'weight', 'order', 'active')
+
+'''
+Names of union find arrays
+'''
+STATE_ARRAYS = ('parent', 'rank', 'size', 'min_dif')
+
+'''
+Write json file atomically.
+@param file  : file path
+@param value : json value
+'''
+def write_json(file, value):
+  temp = file + '.tmp'
+  with open(temp, 'w') as f:
+    json.dump(value, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(temp, file)
+
+'''
+Calculate hash of the image and mask contents.
+Rows are hashed in strips, so strided views and memory maps are not copied at once.
+@param img  : numpy array of image
+@param mask : bool mask of active pixels (None for all pixels)
+@return str : hex digest
+'''
+def calc_content_hash(img, mask=None):
+  digest = hashlib.sha256(str(img.dtype).encode())
+  rows = imin.get_strip_rows(img.shape, imin.STRIP_PIXELS)
+  for begin in range(0, img.shape[0], rows):
+    digest.update(np.ascontiguousarray(img[begin:begin + rows]).data)
+  if mask is not None:
+    digest.update(np.packbits(mask).data)
+  return digest.hexdigest()
+
+'''
+Read json file.
+@param file : file path
+@return object : json value, None if not exist
+'''
+def read_json(file):
+  if not os.path.exists(file):
+    return None
+  with open(file) as f:
+    return json.load(f)
+
+
+'''
+Checkpoint directory of a segmentation job.
+'''
+class UFCheckpoint:
+
+  '''
+  Initialize with a directory, created if not exist.
+  @param path : checkpoint directory
+  '''
+  def __init__(self, path):
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+    self.buffers = dict()
+    self.next_buffer = 0
+    self.thread = None
+
+  '''
+  Get path of a file in the checkpoint.
+  @param name : file name
+  @return str : path
+  '''
+  def get_file(self, name):
+    return os.path.join(self.path, name)
+
+  '''
+  Get parameters of the saved job.
+  @return dict : meta, None if edges are not saved
+  '''
+  def get_meta(self):
+    return read_json(self.get_file('meta.json'))
+
+  '''
+  Get if the sorted graph is saved.
+  @return bool : True if saved
+  '''
+  def has_edges(self):
+    return self.get_meta() is not None
+
+  '''
+  Save the sorted graph once.
+  @param meta   : json parameters of the job, checked on resume
+  @param arrays : dict of EDGE_ARRAYS
+  '''
+  def save_edges(self, meta, arrays):
+    for name in EDGE_ARRAYS:
+      np.save(self.get_file(name + '.npy'), arrays[name])
+    # meta marks the edges complete
+    write_json(self.get_file('meta.json'), meta)
+
+  '''
+  Load the sorted graph as memory maps.
+  @return dict : dict of EDGE_ARRAYS
+  '''
+  def load_edges(self):
+    return dict((name, np.load(self.get_file(name + '.npy'), mmap_mode='r')) for name in EDGE_ARRAYS)
+
+  '''
+  Get memory maps of a state buffer, created on the first use.
+  @param buffer : buffer number (0 or 1)
+  @param arrays : union find arrays to fit
+  @return list(numpy.memmap) : memory maps of STATE_ARRAYS
+  '''
+  def get_buffer(self, buffer, arrays):
+    if buffer not in self.buffers:
+      maps = list()
+      for name, array in zip(STATE_ARRAYS, arrays):
+        file = self.get_file('state{0}_{1}.npy'.format(buffer, name))
+        maps.append(np.lib.format.open_memmap(file, mode='w+', dtype=array.dtype, shape=array.shape))
+      self.buffers[buffer] = maps
+    return self.buffers[buffer]
+
+  '''
+  Save union find arrays and the edge cursor.
+  Arrays are copied at once, then flushed in background.
+  @param uf     : ArrayUnionFind
+  @param cursor : number of processed edges in the sorted order
+  '''
+  def save_state(self, uf, cursor):
+    # The other buffer may still be flushed
+    self.wait()
+    buffer = self.next_buffer
+    maps = self.get_buffer(buffer, uf.get_arrays())
+    for state_map, array in zip(maps, uf.get_arrays()):
+      np.copyto(state_map, array)
+    self.next_buffer = 1 - buffer
+    self.thread = threading.Thread(target=self.commit_state, args=(buffer, maps, cursor))
+    self.thread.start()
+
+  '''
+  Flush a state buffer and point it as the last state.
+  @param buffer : buffer number
+  @param maps   : memory maps of the buffer
+  @param cursor : number of processed edges
+  '''
+  def commit_state(self, buffer, maps, cursor):
+    for state_map in maps:
+      state_map.flush()
+    write_json(self.get_file('state.json'), {'buffer': buffer, 'cursor': cursor})
+
+  '''
+  Wait for the state being flushed.
+  '''
+  def wait(self):
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+  '''
+  Load the last state into union find arrays.
+  @param uf : ArrayUnionFind of the saved size
+  @return int : edge cursor to resume from, 0 if no state is saved
+  '''
+  def load_state(self, uf):
+    state = read_json(self.get_file('state.json'))
+    if state is None:
+      return 0
+    buffer = state['buffer']
+    for name, array in zip(STATE_ARRAYS, uf.get_arrays()):
+      saved = np.load(self.get_file('state{0}_{1}.npy'.format(buffer, name)), mmap_mode='r')
+      if saved.shape != array.shape:
+        raise InvalidParameterException()
+      np.copyto(array, saved)
+    # Keep the loaded buffer until a newer state is complete
+    self.next_buffer = 1 - buffer
+    return state['cursor']
+
+'''
+Merge components along sorted edges with checkpoints.
+@param uf         : ArrayUnionFind (restored by load_state when resuming)
+@param origin     : origin pixel indices of edges
+@param target     : target pixel indices of edges
+@param weight     : edge weights
+@param order      : edge order sorted by weight
+@param tau_k      : merging super parameter
+@param checkpoint : UFCheckpoint
+@param interval   : number of edges between checkpoints
+@param start      : edge cursor to start from
+@param controller : TrainController (None for no limit), the state is saved when stopped
+@param backend    : python, numba or auto
+@return int : number of processed edges
+'''
+def train_checkpointed(uf, origin, target, weight, order, tau_k, checkpoint, interval=1000000, start=0,
+                       controller=None, backend='auto'):
+  kernel = uas.get_merge_kernel(backend)
+  parent, rank, size, min_dif = uf.get_arrays()
+  edge_len = len(order)
+  interval = max(1, interval)
+  step = interval if controller is None else min(interval, controller.check_interval)
+  position = start
+  saved = start
+  while position < edge_len:
+    if controller is not None and controller.is_expired():
+      break
+    stop = min(edge_len, position + step)
+    kernel(parent, rank, size, min_dif, origin, target, weight, order, tau_k, position, stop)
+    position = stop
+    if position - saved >= interval and position < edge_len:
+      checkpoint.save_state(uf, position)
+      saved = position
+  checkpoint.save_state(uf, position)
+  checkpoint.wait()
+  return position
@@ -1,10 +1,10 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
 import numpy as np
 
 import MakeColor as mcolor
-from UFGraphBasedSegment import *
+import ResultFormat as rfmt
+from UFGraphBasedSegment import get_elem_from_pixe_id
 
 '''
 Make monocolor segmented image
@@ -38,25 +38,33 @@ Make rgb color segmented image with top n area segment.
 @param img  : source image
 @param uf   : union find (result)
 @param n    : colorize top n are segment
-@param name : result image file name
+@param name : result image file name (None not to save)
+@param result_format  : rgb, palette or npy (see ResultFormat)
+@param compress_level : zlib level of PNG (None for PIL default)
+@return numpy.ndarray : segmented image (row, col, 3), palette index image or label map (row, col)
 '''
-def create_colorized_result(img, uf, n, name):
+def create_colorized_result(img, uf, n, name, result_format='rgb', compress_level=None):
+  rfmt.check_result_format(result_format, n)
+  # Colors are shared by results with the same n
+  palette = mcolor.get_palette(n)
   # image size
   row = img.shape[0]
   col = img.shape[1]
 
-  segmented_image = np.zeros((row, col, 3), dtype=np.uint8)
+  index_image = rfmt.create_index_image((row, col), n)
+  label_image = np.zeros((row, col), dtype=np.int32) if result_format == 'npy' else None
   uf_subset = uf.subsetall()
+  # Excluded (masked) pixels have no root node
+  root_ids = set(subset[0] for subset in uf_subset) if label_image is not None else None
   # n can not be over size of mc_dict
   n = min(n, len(uf_subset))
   # Get top n of sorted subset 
   sorted_uf_subset = sorted(uf_subset, key=lambda x:x[1], reverse=True)[:n]
-  # Create n sets of colors and root ids
-  colors = mcolor.create_random_colors(n)
+  # Create sets of color indices and root ids
   id_color_dict = dict()
-  for subset, color in zip(sorted_uf_subset, colors):
-    id_color_dict[subset[0]] = color
-    print("Size : {0}, color : {1}".format(subset[1], color))
+  for color_index, subset in enumerate(sorted_uf_subset, 1):
+    id_color_dict[subset[0]] = color_index
+    print("Size : {0}, color : {1}".format(subset[1], tuple(palette[color_index].tolist())))
 
   # Get all table
   uf_table = uf.get_all_union()
@@ -70,10 +78,12 @@ def create_colorized_result(img, uf, n, name):
 
     uf_id = uf.find(uf_id)
     if uf_id in id_color_dict:
-      color = id_color_dict[uf_id]
-      segmented_image[elem[0], elem[1], 0] = color[0]
-      segmented_image[elem[0], elem[1], 1] = color[1]
-      segmented_image[elem[0], elem[1], 2] = color[2]
+      index_image[elem[0], elem[1]] = id_color_dict[uf_id]
+    if label_image is not None:
+      # Excluded (masked) pixels are -1 as in UFArraySegment.segment_masked_image
+      label_image[elem[0], elem[1]] = uf_id if uf_id in root_ids else -1
 
-  img_raw = Image.fromarray(segmented_image)
-  img_raw.save(name)
+  segmented_image = rfmt.convert_result(index_image, label_image, palette, result_format)
+  if name is not None:
+    rfmt.save_result(segmented_image, name, result_format, palette, compress_level)
+  return segmented_image
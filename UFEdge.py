@@ -1,10 +1,5 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
-import numpy as np
-from math import *
-import sys
-
 '''
 Preserve pair of edge pixels between two components
 '''
@@ -1,11 +1,7 @@
 # -*- coding:utf-8 -*-
 
-from PIL import Image
-import numpy as np
-
-from Component import *
 from UnionFind import UnionFind
-from MakeColor import *
+from MakeColor import calc_luminance
 
 '''
 Create id of the specified pixel in the source image
@@ -50,13 +46,14 @@ class UFGraphBasedSegment:
   @param id1 : component id to merge
   @param id2 : component id to merge
   @param edge_value : difference value of intertested edge
+  @param keep_max   : keep the largest internal difference of the two components (see UnionFind.union)
   @return bool : TRUE if merging two components, else FALSE
   '''
-  def merge(self, id1, id2, edge_value):
+  def merge(self, id1, id2, edge_value, keep_max=False):
     root_node1 = self.uf.get_root(id1)
     root_node2 = self.uf.get_root(id2)
     if edge_value < self.mint(root_node1, root_node2):
-      self.uf.union(id1=id1, id2=id2, edge_value=edge_value)
+      self.uf.union(id1=id1, id2=id2, edge_value=edge_value, keep_max=keep_max)
 
   '''
   Calculate the minimum internal difference between two components.
@@ -96,7 +93,7 @@ class UFComponent:
   '''
   def __init__(self, row, col, img):
     self.elem = (row, col)
-    self.rgba = img[row][col]
+    self.rgba = img[row, col]
     self.value = calc_luminance(self.rgba)
 
   def get_elem(self):
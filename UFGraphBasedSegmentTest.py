@@ -5,15 +5,16 @@ Sample program of graph based segmentation algorithm with Union Find
 '''
 
 # Import required packages
-from PIL import Image
 import numpy as np
 
+from ImageLoader import load_image
 from UFSegmentationProcess import *
 
 # Load image via PIL.
+# Give max_pixels (e.g. 100*100) to decode large JPEG with reduced resolution.
 src_file = 'images/sample4.jpg'
 # src_file = 'images/texture.png'
-img = np.array(Image.open(src_file))
+img = load_image(src_file).get_array()
 # Specify destination output file.
 dst = 'result/gbs_ret.png'
 # Specify coloring segmentations each of which has top n area. 
@@ -1,31 +1,55 @@
 # -*- coding:utf-8 -*-
 
 from abc import ABCMeta, abstractmethod
-from PIL import Image
+from math import sqrt
 import numpy as np
 
-from UFGraphBasedSegment import *
-from UFEdge import *
+from UFGraphBasedSegment import UFGraphBasedSegment, UFComponent, UFRoot, create_pixel_id, get_elem_from_pixe_id
+from UnionFind import UnionFind
+from UFEdge import UFEdge, EdgeIdSet
+from TrainControl import TrainController, TrainResult
+from ParameterExceptions import InvalidParameterException
+from UFArrayUnionFind import ArrayUnionFind
+import UFArrayGraph as uag
+import UFArraySegment as uas
 import UFCreateResultImage as cri
+from UFCheckpoint import UFCheckpoint, train_checkpointed, calc_content_hash
+import MakeColor as mcolor
+import ResultFormat as rfmt
+from TraceProfiler import NULL_TRACER
+import ImageInput as imin
 
 class UFSegmentationProcess:
   __metaclass__ = ABCMeta
 
   '''
   Initialize with empty lists.
-  @param src_img : source image to process
-  @param dst_img : path of an output image
+  @param src_img : source image to process, numpy array, memmap, shaped buffer or PIL image
+                   (see ImageInput), arrays and buffers are not copied
+  @param dst_img : path of an output image (None to keep it in memory)
   @param top_n   : color segmentations having top n area
   @param tau_k   : merging super parameter
+  @param mask    : bool mask (row, col) of pixels to segment, 'alpha' to take
+                   pixels with non zero alpha, None for all pixels
   '''
-  def __init__(self, src_img, dst_img, top_n, tau_k=4.5):
-    self.img = src_img
+  def __init__(self, src_img, dst_img, top_n, tau_k=4.5, mask=None):
+    self.img = imin.as_image_array(src_img)
     self.dst_img = dst_img
     self.top_n = top_n
     self.tau_k = tau_k
+    if isinstance(mask, str):
+      if mask != 'alpha':
+        raise InvalidParameterException()
+      mask = uag.create_alpha_mask(self.img)
+    self.mask = None if mask is None else np.asarray(mask, dtype=np.bool_)
     self.edge_dict = dict()
     self.component_dict = dict()
     self.root_dict = dict()
+    self.ufgbs = None
+    self.result_image = None
+    self.result_format = 'rgb'
+    self.compress_level = None
+    self.tracer = NULL_TRACER
 
   '''
   Get or create UF Component if not exist.
@@ -45,6 +69,16 @@ class UFSegmentationProcess:
       self.root_dict[target_id] = UFRoot(rank=1, min_dif=0, size=1)
       return target_component
 
+  '''
+  Get if the pixel is segmented.
+  Excluded pixels have no component and no edge.
+  @param row : row of the pixel
+  @param col : column of the pixel
+  @return bool : True if the pixel is not masked out
+  '''
+  def is_active(self, row, col):
+    return self.mask is None or self.mask[row, col]
+
   '''
   Abstract method to create graph.
   Implement concrete process at concrete class
@@ -53,33 +87,531 @@ class UFSegmentationProcess:
   def init_graph(self):
     pass
 
+  '''
+  Abstract method to get the search directions of the graph.
+  Implement concrete process at concrete class
+  @return list((int, int)) : search directions (drow, dcol)
+  '''
+  @abstractmethod
+  def get_graph_search(self):
+    pass
+
   '''
   Train graph based segmentation.
+  Training stops gracefully when the time budget is over or the token is cancelled.
+  Edges are processed in sorted order, so a stopped training gives a coarse result.
+  @param time_budget    : seconds allowed for training (None for no limit)
+  @param cancel_token   : CancelToken to stop training (None for no token)
+  @param check_interval : number of edges between checks of budget and token
+  @param backend        : dict for component objects, or python, numba or auto for
+                          flat arrays (see UFArraySegment), the result is the same
+  @param prune          : with array backends, sort only edges which can be merged
+  @param checkpoint     : with array backends, directory to save the sorted graph and the
+                          state periodically, training resumes from it if saved (None for no checkpoint)
+  @param checkpoint_interval : number of edges between checkpoints
+  @param premerge       : collapse runs of equal luminance into single nodes before sorting
+                          (see create_run_graph), the partition is the same but update is not available
+  @return TrainResult : union find, completed flag and fraction of processed edges
+  '''
+  def train(self, time_budget=None, cancel_token=None, check_interval=1000, backend='dict', prune=False,
+            checkpoint=None, checkpoint_interval=1000000, premerge=False):
+    controller = TrainController(time_budget, cancel_token, check_interval)
+    if checkpoint is not None and (backend == 'dict' or prune or premerge):
+      raise InvalidParameterException()
+    # Zero edges merge only with positive tau_k
+    premerge = premerge and self.tau_k > 0
+    with self.tracer.span('train', shape=list(self.img.shape[:2]), backend=backend, prune=prune, premerge=premerge):
+      if checkpoint is not None:
+        return self.train_checkpoint(controller, backend, UFCheckpoint(checkpoint), checkpoint_interval)
+      if backend != 'dict':
+        return self.train_array(controller, backend, prune, premerge)
+      if premerge:
+        return self.train_runs(controller)
+      return self.train_dict(controller)
+
+  '''
+  Train graph based segmentation over component objects.
+  @param controller : TrainController
+  @return TrainResult : union find, completed flag and fraction of processed edges
   '''
-  def train(self):
+  def train_dict(self, controller):
     # Initialize segmentation
-    self.init_graph()
+    with self.tracer.span('init_graph'):
+      self.init_graph()
 
     # Initialize uf graph based segment with the size of image
     size = self.img.shape[0]*self.img.shape[1]
     ufgbs = UFGraphBasedSegment(size=size, tau_k=self.tau_k, root_dict=self.root_dict)
+    self.ufgbs = ufgbs
 
     # Train segmentation
-    sorted_edge = sorted(self.edge_dict.items(), key=lambda item:item[1].get_difference())
-    print("edge len = {0}".format(len(sorted_edge)))
-
-    for phase, edge_item in enumerate(sorted_edge):
-      id_set = edge_item[0]
-      edge = edge_item[1]
-      edge_value = edge.get_difference()
-      ufgbs.merge(id1=id_set.get_id1(), id2=id_set.get_id2(), edge_value=edge_value)
-      # Debug
-      if phase % 1000 == 0:
-        print("phase = {0}".format(phase))
-      # Debug
+    with self.tracer.span('sort_edges'):
+      sorted_edge = sorted(self.edge_dict.items(), key=lambda item:item[1].get_difference())
+
+    processed = len(sorted_edge)
+    with self.tracer.sample('merge', edges=len(sorted_edge)):
+      for phase, edge_item in enumerate(sorted_edge):
+        if controller.should_stop(phase):
+          processed = phase
+          break
+        id_set = edge_item[0]
+        edge = edge_item[1]
+        edge_value = edge.get_difference()
+        ufgbs.merge(id1=id_set.get_id1(), id2=id_set.get_id2(), edge_value=edge_value)
+
+    # Create image
+    with self.tracer.span('create_result'):
+      self.result_image = cri.create_colorized_result(self.img, ufgbs.get_union_find(), self.top_n, self.dst_img,
+        self.result_format, self.compress_level)
+
+    return TrainResult(ufgbs.get_union_find(), processed == len(sorted_edge), processed, len(sorted_edge))
+
+  '''
+  Train graph based segmentation over root objects of runs of equal luminance.
+  Same union find and merge as train_dict, but pixels of a run start as one tree
+  and only edges between runs are sorted and merged.
+  @param controller : TrainController
+  @return TrainResult : union find, completed flag and fraction of processed edges
+  '''
+  def train_runs(self, controller):
+    with self.tracer.span('create_run_graph') as span:
+      origin, target, weight, active, runs, run_size = self.create_run_graph()
+      span.set_args(runs=len(run_size))
+    run_of, first = runs
+
+    # Pixels of a run point to its first pixel, which has the root node
+    run_ids = active[first] + 1
+    self.root_dict = dict((run_id, UFRoot(rank=1, min_dif=0, size=size))
+                          for run_id, size in zip(run_ids.tolist(), run_size.tolist()))
+    size = self.img.shape[0]*self.img.shape[1]
+    ufgbs = UFGraphBasedSegment(size=size, tau_k=self.tau_k, root_dict=self.root_dict)
+    table = -np.arange(size + 1)
+    table[active + 1] = run_ids[run_of]
+    table[run_ids] = -run_ids
+    ufgbs.get_union_find().set_all_union(table.tolist())
+    # Incremental update needs component objects
+    self.ufgbs = None
+
+    with self.tracer.span('sort_edges'):
+      order = uag.sort_edges(weight)
+      sorted_edge = zip(run_ids[origin[order]].tolist(), run_ids[target[order]].tolist(), weight[order].tolist())
+
+    processed = len(weight)
+    with self.tracer.sample('merge', edges=len(weight)):
+      for phase, (id1, id2, edge_value) in enumerate(sorted_edge):
+        if controller.should_stop(phase):
+          processed = phase
+          break
+        ufgbs.merge(id1=id1, id2=id2, edge_value=edge_value)
+
+    # Create image
+    with self.tracer.span('create_result'):
+      self.result_image = cri.create_colorized_result(self.img, ufgbs.get_union_find(), self.top_n, self.dst_img,
+        self.result_format, self.compress_level)
+
+    return TrainResult(ufgbs.get_union_find(), processed == len(weight), processed, len(weight))
+
+  '''
+  Set tracer to profile stages of train and resume.
+  @param tracer : TraceProfiler.TraceRecorder (NULL_TRACER to disable)
+  '''
+  def set_tracer(self, tracer):
+    self.tracer = tracer
+
+
+  '''
+  Set output format of the result.
+  @param result_format  : rgb, palette or npy (see ResultFormat)
+  @param compress_level : zlib level of PNG, ResultFormat.FAST_COMPRESS_LEVEL for fast encoding
+  '''
+  def set_result_format(self, result_format, compress_level=None):
+    rfmt.check_result_format(result_format, self.top_n)
+    self.result_format = result_format
+    self.compress_level = compress_level
+
+  '''
+  Get segmented image created by train or update.
+  @return numpy.ndarray : segmented image of the result format
+  '''
+  def get_result_image(self):
+    return self.result_image
+
+  '''
+  Get color table of the result in palette format.
+  @return numpy.ndarray : uint8 array (top_n + 1, 3), row 0 is uncolored
+  '''
+  def get_result_palette(self):
+    return mcolor.get_palette(self.top_n)
+
+  '''
+  Train graph based segmentation over flat arrays.
+  Graph is built with vectorized operations in the same order as init_graph.
+  @param controller : TrainController
+  @param backend    : python, numba or auto
+  @param prune      : sort only edges which can be merged
+  @param premerge   : merge over runs of equal luminance (see create_run_graph)
+  @return TrainResult : union find, completed flag and fraction of processed edges
+  '''
+  def train_array(self, controller, backend, prune=False, premerge=False):
+    if premerge:
+      with self.tracer.span('create_run_graph') as span:
+        origin, target, weight, active, runs, run_size = self.create_run_graph()
+        span.set_args(runs=len(run_size))
+    else:
+      with self.tracer.span('create_array_graph'):
+        origin, target, weight, active = self.create_array_graph()
+      runs = None
+    edge_len = len(weight)
+
+    # Incremental update needs component objects
+    self.ufgbs = None
+    if premerge:
+      # A run starts as a tree of its pixels with zero internal difference
+      array_uf = ArrayUnionFind(len(run_size))
+      np.copyto(array_uf.get_arrays()[2], run_size)
+    else:
+      array_uf = ArrayUnionFind(len(active))
+    if prune:
+      # Sort and merge are interleaved by pruning
+      with self.tracer.sample('merge_pruned', edges=edge_len) as span:
+        counter = uas.train_pruned_edges(array_uf, origin, target, weight,
+          float(self.tau_k), controller, backend)
+        span.set_args(sorted=counter.get_sorted(), pruned=counter.get_pruned())
+      processed = counter.get_processed()
+    else:
+      with self.tracer.span('sort_edges'):
+        order = uag.sort_edges(weight)
+      with self.tracer.sample('merge', edges=edge_len):
+        processed = uas.train_sorted_edges(array_uf, origin, target, weight, order,
+          float(self.tau_k), controller, backend)
+    with self.tracer.span('create_union_find'):
+      uf = self.create_union_find(array_uf, active, runs)
+
+    # Create image
+    with self.tracer.span('create_result'):
+      self.result_image = cri.create_colorized_result(self.img, uf, self.top_n, self.dst_img,
+        self.result_format, self.compress_level)
+
+    return TrainResult(uf, processed == edge_len, processed, edge_len)
+
+  '''
+  Resume training from a checkpoint saved by train.
+  @param checkpoint : checkpoint directory
+  @param backend    : python, numba or auto
+  @param time_budget, cancel_token, check_interval, checkpoint_interval : same as train
+  @return TrainResult : union find, completed flag and fraction of processed edges
+  '''
+  def resume(self, checkpoint, backend='auto', time_budget=None, cancel_token=None, check_interval=1000,
+             checkpoint_interval=1000000):
+    if not UFCheckpoint(checkpoint).has_edges():
+      raise InvalidParameterException()
+    return self.train(time_budget, cancel_token, check_interval, backend,
+      checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+
+  '''
+  Build graph over flat arrays in the same order as init_graph.
+  @param plane : luminance plane (None to calculate)
+  @return (origin, target, weight, active) : edges and flat indices of active pixels
+  '''
+  def create_array_graph(self, plane=None):
+    with self.tracer.span('neighbor_index'):
+      if self.mask is None:
+        origin, target = uag.create_neighbor_index(self.img.shape, self.get_graph_search())
+        active = np.arange(self.img.shape[0]*self.img.shape[1])
+      else:
+        origin, target, active = uag.create_masked_neighbor_index(self.img.shape, self.get_graph_search(), self.mask)
+    with self.tracer.span('edge_weights'):
+      # Luminance is read from strided sources without a contiguous copy
+      values = (imin.calc_luminance_plane(self.img) if plane is None else plane).reshape(-1)
+      if self.mask is not None:
+        values = values[active]
+      weight = uag.calc_edge_weights(values, origin, target)
+    return origin, target, weight, active
+
+  '''
+  Build graph over runs of equal luminance.
+  Edges of weight 0 always merge first (0 < Int(C) + tau_k/|C| for positive tau_k),
+  and merge exactly the pixels of each run found by UFArrayGraph.label_flat_runs.
+  A run is one node with the size of its pixels and zero internal difference, and
+  edges between runs are kept in the issued order, so merging them gives the
+  same partition as merging all pixel edges.
+  @return (origin, target, weight, active, runs, size) : edges between runs, flat indices of active pixels,
+          (run of each active pixel, first active pixel of each run) and number of pixels of each run
+  '''
+  def create_run_graph(self):
+    plane = imin.calc_luminance_plane(self.img)
+    origin, target, weight, active = self.create_array_graph(plane)
+    with self.tracer.span('label_flat_runs'):
+      labels = uag.label_flat_runs(plane, self.get_graph_search(), self.mask)[0]
+      run_of = labels.reshape(-1)[active]
+    with self.tracer.span('collapse_flat_runs'):
+      origin, target, weight, first, size = uag.collapse_flat_runs(run_of, origin, target, weight)
+    return origin, target, weight, active, (run_of, first), size
+
+  '''
+  Get parameters identifying this job in a checkpoint.
+  Content hash of the image and mask keeps a checkpoint of another image with the
+  same parameters from being resumed.
+  @return dict : json parameters
+  '''
+  def get_checkpoint_meta(self):
+    return {
+      'shape': list(self.img.shape),
+      'tau_k': float(self.tau_k),
+      'search': [list(dif) for dif in self.get_graph_search()],
+      'masked': self.mask is not None,
+      'active': None if self.mask is None else int(self.mask.sum()),
+      'content': calc_content_hash(self.img, self.mask)}
+
+  '''
+  Train over flat arrays with checkpoints, resume from the checkpoint if saved.
+  The graph is built and sorted only when the checkpoint has no graph.
+  @param controller : TrainController
+  @param backend    : python, numba or auto
+  @param checkpoint : UFCheckpoint
+  @param interval   : number of edges between checkpoints
+  @return TrainResult : union find, completed flag and fraction of processed edges
+  '''
+  def train_checkpoint(self, controller, backend, checkpoint, interval):
+    meta = self.get_checkpoint_meta()
+    if checkpoint.has_edges():
+      # Checkpoint of another job must not be resumed
+      if checkpoint.get_meta() != meta:
+        raise InvalidParameterException()
+      with self.tracer.span('load_edges'):
+        edges = checkpoint.load_edges()
+    else:
+      with self.tracer.span('create_array_graph'):
+        origin, target, weight, active = self.create_array_graph()
+      with self.tracer.span('sort_edges'):
+        order = uag.sort_edges(weight)
+      edges = {'origin': origin, 'target': target, 'weight': weight, 'active': active, 'order': order}
+      with self.tracer.span('save_edges'):
+        checkpoint.save_edges(meta, edges)
+    edge_len = len(edges['order'])
+
+    self.ufgbs = None
+    array_uf = ArrayUnionFind(len(edges['active']))
+    with self.tracer.span('load_state'):
+      start = checkpoint.load_state(array_uf)
+    with self.tracer.sample('merge', edges=edge_len, start=start):
+      processed = train_checkpointed(array_uf, edges['origin'], edges['target'], edges['weight'], edges['order'],
+        float(self.tau_k), checkpoint, interval, start, controller, backend)
+    with self.tracer.span('create_union_find'):
+      uf = self.create_union_find(array_uf, np.asarray(edges['active']))
 
     # Create image
-    cri.create_colorized_result(self.img, ufgbs.get_union_find(), self.top_n, self.dst_img)
+    with self.tracer.span('create_result'):
+      self.result_image = cri.create_colorized_result(self.img, uf, self.top_n, self.dst_img,
+        self.result_format, self.compress_level)
+
+    return TrainResult(uf, processed == edge_len, processed, edge_len)
+
+  '''
+  Convert array union find to union find with root nodes.
+  Pixel id is flat index + 1. Excluded pixels are left as trees without root node.
+  @param array_uf : ArrayUnionFind over active pixels, or runs
+  @param active   : flat indices of active pixels
+  @param runs     : (run of each active pixel, first active pixel of each run) of a union find over runs
+                    (None for pixels)
+  @return UnionFind : union find tree
+  '''
+  def create_union_find(self, array_uf, active, runs=None):
+    parent, rank, size, min_dif = array_uf.get_arrays()
+    labels = array_uf.get_labels()
+    roots = np.flatnonzero(labels == np.arange(len(labels)))
+    if runs is not None:
+      # Runs are represented by their first pixels
+      labels = runs[1][labels[runs[0]]]
+      pixel_roots = active[runs[1][roots]]
+    else:
+      pixel_roots = active[roots]
+    self.root_dict = dict()
+    for root, root_rank, root_size, root_min_dif in \
+        zip(pixel_roots.tolist(), rank[roots].tolist(), size[roots].tolist(), min_dif[roots].tolist()):
+      self.root_dict[root+1] = UFRoot(rank=root_rank, min_dif=root_min_dif, size=root_size)
+    img_size = self.img.shape[0]*self.img.shape[1]
+    table = -(np.arange(img_size) + 1)
+    table[active] = active[labels] + 1
+    table[pixel_roots] = -(pixel_roots + 1)
+    uf = UnionFind(img_size, self.root_dict)
+    uf.set_all_union([0] + table.tolist())
+    return uf
+
+  '''
+  Re-segment the image incrementally after an edit in a rectangle.
+  Components touching the rectangle (expanded by margin and the search reach)
+  and the components next to them are reset and merged again with their edges
+  in the sorted order of a full run.
+  When a neighbor component merges with another component in the run, it is
+  added to the affected components and the run is repeated, so the result is
+  the same partition as a full run on the edited image.
+  Other components keep the previous result, so the cost scales with the area of
+  the affected components and their neighbors, not the image size.
+  @note train with dict backend must be called before update.
+  @param src_img : edited source image with the same shape
+  @param rect    : changed rectangle (top, left, bottom, right), bottom and right exclusive
+  @param margin  : extra pixels around the rectangle to be recomputed
+  @return TrainResult : union find after the update
+  '''
+  def update(self, src_img, rect, margin=1):
+    if self.ufgbs is None:
+      raise InvalidParameterException()
+    src_img = imin.as_image_array(src_img)
+    if src_img.shape[:2] != self.img.shape[:2]:
+      raise InvalidParameterException()
+    top, left, bottom, right = rect
+    if not (0 <= top < bottom <= src_img.shape[0] and 0 <= left < right <= src_img.shape[1]):
+      raise InvalidParameterException()
+    self.img = src_img
+    img_row = self.img.shape[0]
+    img_col = self.img.shape[1]
+    uf = self.ufgbs.get_union_find()
+    search = self.get_graph_search()
+    both_search = search + [(-dif[0], -dif[1]) for dif in search]
+
+    # Refresh components of the changed pixels
+    for row in range(top, bottom):
+      for col in range(left, right):
+        if not self.is_active(row, col):
+          continue
+        pixel_id = create_pixel_id(self.img, row, col)
+        self.component_dict[pixel_id] = UFComponent(row=row, col=col, img=self.img)
+
+    # Recompute edges touching the changed pixels
+    for row in range(top, bottom):
+      for col in range(left, right):
+        for target_row, target_col in self.get_neighbors(row, col, both_search):
+          id_set = EdgeIdSet(create_pixel_id(self.img, row, col), create_pixel_id(self.img, target_row, target_col))
+          if id_set in self.edge_dict:
+            self.edge_dict[id_set] = UFEdge(self.component_dict[id_set.get_id1()], self.component_dict[id_set.get_id2()])
+
+    # Window whose edges touch changed pixels
+    reach = max([max(abs(dif[0]), abs(dif[1])) for dif in search]) + margin
+    window = [(row, col)
+      for row in range(max(0, top - reach), min(img_row, bottom + reach))
+      for col in range(max(0, left - reach), min(img_col, right + reach))
+      if self.is_active(row, col)]
+
+    # Roots of the previous result, kept for pixels reset in the runs
+    prev_root = dict()
+    get_prev_root = lambda pixel_id: prev_root[pixel_id] if pixel_id in prev_root else uf.find(pixel_id)
+
+    # Components touching the window
+    affected_roots = set([uf.find(create_pixel_id(self.img, row, col)) for row, col in window])
+    edge_len = 0
+    while True:
+      affected = self.collect_component_pixels(window, affected_roots, get_prev_root, both_search)
+
+      # Components next to the affected ones
+      neighbor_seeds = list()
+      neighbor_roots = set()
+      for pixel_id in affected:
+        row, col = get_elem_from_pixe_id(self.img, pixel_id)
+        for target_row, target_col in self.get_neighbors(row, col, both_search):
+          root = get_prev_root(create_pixel_id(self.img, target_row, target_col))
+          if root not in affected_roots:
+            neighbor_roots.add(root)
+            neighbor_seeds.append((target_row, target_col))
+      region = affected | self.collect_component_pixels(neighbor_seeds, neighbor_roots, get_prev_root, both_search)
+
+      # Collect edges inside the region with their order in a full run
+      edge_order = dict()
+      for pixel_id in region:
+        row, col = get_elem_from_pixe_id(self.img, pixel_id)
+        for order, dif in enumerate(search):
+          # Edges issued from this pixel and edges issued from the neighbor
+          for origin_row, origin_col, target_row, target_col in \
+              ((row, col, row + dif[0], col + dif[1]), (row - dif[0], col - dif[1], row, col)):
+            if not (0 <= origin_row < img_row and 0 <= origin_col < img_col):
+              continue
+            if not (0 <= target_row < img_row and 0 <= target_col < img_col):
+              continue
+            origin_id = create_pixel_id(self.img, origin_row, origin_col)
+            target_id = create_pixel_id(self.img, target_row, target_col)
+            if origin_id not in region or target_id not in region:
+              continue
+            id_set = EdgeIdSet(origin_id, target_id)
+            key = (origin_id, order)
+            if id_set not in edge_order or key < edge_order[id_set]:
+              edge_order[id_set] = key
+
+      # Invalidate components of the region
+      for pixel_id in region:
+        prev_root[pixel_id] = get_prev_root(pixel_id)
+      for pixel_id in region:
+        uf.reset(pixel_id, UFRoot(rank=1, min_dif=0, size=1))
+
+      # Merge again in the sorted order of a full run
+      sorted_edge = sorted(edge_order.items(),
+        key=lambda item:(self.edge_dict[item[0]].get_difference(), item[1]))
+      edge_len += len(sorted_edge)
+      for id_set, order in sorted_edge:
+        edge_value = self.edge_dict[id_set].get_difference()
+        # Internal difference stays the largest merged edge
+        self.ufgbs.merge(id1=id_set.get_id1(), id2=id_set.get_id2(), edge_value=edge_value, keep_max=True)
+
+      # Neighbor components merged with others may change merges at their boundary
+      merged_roots = dict()
+      for pixel_id in region:
+        merged_roots.setdefault(uf.find(pixel_id), set()).add(prev_root[pixel_id])
+      grown_roots = set()
+      for roots in merged_roots.values():
+        if len(roots) > 1:
+          grown_roots |= roots - affected_roots
+      if not grown_roots:
+        break
+      affected_roots |= grown_roots
+
+    # Create image
+    self.result_image = cri.create_colorized_result(self.img, uf, self.top_n, self.dst_img,
+      self.result_format, self.compress_level)
+
+    return TrainResult(uf, True, edge_len, edge_len)
+
+  '''
+  Get active neighbors of a pixel.
+  @param row    : row of the pixel
+  @param col    : col of the pixel
+  @param search : search directions (drow, dcol)
+  @return list((int, int)) : (row, col) of the neighbors
+  '''
+  def get_neighbors(self, row, col, search):
+    neighbors = list()
+    for dif in search:
+      target_row = row + dif[0]
+      target_col = col + dif[1]
+      if not (0 <= target_row < self.img.shape[0] and 0 <= target_col < self.img.shape[1]):
+        continue
+      if self.is_active(target_row, target_col):
+        neighbors.append((target_row, target_col))
+    return neighbors
+
+  '''
+  Collect all pixels of components with flood fill over the graph.
+  @param seeds    : (row, col) of pixels in the components
+  @param roots    : roots of the components
+  @param get_root : function to get the root of a pixel id
+  @param search   : search directions (drow, dcol) in both directions
+  @return set(int) : pixel ids of the components
+  '''
+  def collect_component_pixels(self, seeds, roots, get_root, search):
+    pixels = set()
+    stack = list()
+    for row, col in seeds:
+      pixel_id = create_pixel_id(self.img, row, col)
+      if pixel_id not in pixels and get_root(pixel_id) in roots:
+        pixels.add(pixel_id)
+        stack.append((row, col))
+    while stack:
+      row, col = stack.pop()
+      for target_row, target_col in self.get_neighbors(row, col, search):
+        target_id = create_pixel_id(self.img, target_row, target_col)
+        if target_id in pixels or get_root(target_id) not in roots:
+          continue
+        pixels.add(target_id)
+        stack.append((target_row, target_col))
+    return pixels
 
 
 '''
@@ -92,6 +624,13 @@ class GridGraphSegmentation(UFSegmentationProcess):
   '''
   grid_graph_search = [(1, -1), (1, 0), (1, 1), (0, 1)]
 
+  '''
+  Get the search directions of the graph.
+  @return list((int, int)) : search directions (drow, dcol)
+  '''
+  def get_graph_search(self):
+    return self.grid_graph_search
+
   '''
   Create grid-graph based initailized components.
   '''
@@ -103,6 +642,8 @@ class GridGraphSegmentation(UFSegmentationProcess):
     for row in range(img_row):
       # x loop
       for col in range(img_col):
+        if not self.is_active(row, col):
+          continue
         # Issue unique id for this element
         pixel_id = create_pixel_id(self.img, row, col)
 
@@ -114,6 +655,8 @@ class GridGraphSegmentation(UFSegmentationProcess):
           target_col = col + dif[1]
           if not (0 <= target_row < img_row and 0 <= target_col < img_col):
             continue
+          if not self.is_active(target_row, target_col):
+            continue
           # Issue unique id for this element
           target_id = create_pixel_id(self.img, target_row, target_col)
 
@@ -136,9 +679,10 @@ class NearestNeightborGraphSegmentation(UFSegmentationProcess):
   @param dst_img : path of an output image
   @param top_n   : color segmentations having top n area
   @param nn      : nearest neighbor distance
+  @param mask    : bool mask of pixels to segment, 'alpha' or None (see UFSegmentationProcess)
   '''
-  def __init__(self, src_img, dst_img, top_n, tau_k=4.5, nn=2):
-    UFSegmentationProcess.__init__(self, src_img, dst_img, top_n, tau_k)
+  def __init__(self, src_img, dst_img, top_n, tau_k=4.5, nn=2, mask=None):
+    UFSegmentationProcess.__init__(self, src_img, dst_img, top_n, tau_k, mask)
     # Limit maximum nn to size/4
     img_row = self.img.shape[0]
     img_col = self.img.shape[1]
@@ -161,6 +705,13 @@ class NearestNeightborGraphSegmentation(UFSegmentationProcess):
           continue
         self.nn_graph_search.append((row, col))
 
+  '''
+  Get the search directions of the graph.
+  @return list((int, int)) : search directions (drow, dcol)
+  '''
+  def get_graph_search(self):
+    return self.nn_graph_search
+
   '''
   Create grid-graph based initailized components.
   '''
@@ -172,6 +723,8 @@ class NearestNeightborGraphSegmentation(UFSegmentationProcess):
     for row in range(img_row):
       # x loop
       for col in range(img_col):
+        if not self.is_active(row, col):
+          continue
         # Issue unique id for this element
         pixel_id = create_pixel_id(self.img, row, col)
 
@@ -183,6 +736,8 @@ class NearestNeightborGraphSegmentation(UFSegmentationProcess):
           target_col = col + dif[1]
           if not (0 <= target_row < img_row and 0 <= target_col < img_col):
             continue
+          if not self.is_active(target_row, target_col):
+            continue
           # Issue unique id for this element
           target_id = create_pixel_id(self.img, target_row, target_col)
 
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import UFArrayGraph as uag
+
+'''
+Multithreaded graph construction over row bands.
+Each thread issues edges from the origins in its band into a preallocated slice
+of one shared edge array. Targets may be in the rows below the band, so no edge
+is lost or issued twice. Weights are calculated and pre-sorted per band, then the
+sorted bands are merged pairwise. Numpy releases GIL in these operations.
+The result is the same as sorting edges of create_neighbor_index.
+'''
+
+'''
+Split rows into bands.
+@param img_row : number of rows
+@param bands   : number of bands
+@return list((int, int)) : (begin, end) rows of each band
+'''
+def create_bands(img_row, bands):
+  bands = max(1, min(bands, img_row))
+  bounds = [img_row * i // bands for i in range(bands + 1)]
+  return [(bounds[i], bounds[i+1]) for i in range(bands)]
+
+'''
+Merge two sorted runs of edges.
+Edges of the first run come first on equal weights.
+@param run1 : (weights, order) sorted by weight
+@param run2 : (weights, order) sorted by weight, issued after run1
+@return (numpy.ndarray, numpy.ndarray) : merged (weights, order)
+'''
+def merge_two_runs(run1, run2):
+  weight1, order1 = run1
+  weight2, order2 = run2
+  # Position = index in own run + number of edges before it in the other run
+  pos1 = np.arange(len(weight1)) + np.searchsorted(weight2, weight1, side='left')
+  pos2 = np.arange(len(weight2)) + np.searchsorted(weight1, weight2, side='right')
+  weight = np.empty(len(weight1) + len(weight2), dtype=weight1.dtype)
+  order = np.empty(len(weight1) + len(weight2), dtype=order1.dtype)
+  weight[pos1] = weight1
+  weight[pos2] = weight2
+  order[pos1] = order1
+  order[pos2] = order2
+  return (weight, order)
+
+'''
+Merge sorted runs into one order, pairs of runs are merged in parallel.
+@param runs     : list of (weights, order) in issued order
+@param executor : executor to run merges
+@return numpy.ndarray : edge order
+'''
+def merge_sorted_runs(runs, executor):
+  while len(runs) > 1:
+    pairs = [(runs[i], runs[i+1]) for i in range(0, len(runs) - 1, 2)]
+    merged = list(executor.map(lambda pair: merge_two_runs(pair[0], pair[1]), pairs))
+    if len(runs) % 2 == 1:
+      merged.append(runs[-1])
+    runs = merged
+  return runs[0][1]
+
+'''
+Build sorted edges of an image with threads.
+@param img     : numpy array of image
+@param search  : search directions (drow, dcol)
+@param threads : number of threads (None for number of cpus)
+@param sort    : sort edges, if False order is None
+@return (origin, target, weight, order) : edges and their sorted order
+'''
+def build_graph_threaded(img, search=uag.GRID_GRAPH_SEARCH, threads=None, sort=True):
+  threads = threads or os.cpu_count() or 1
+  shape = img.shape[:2]
+  bands = create_bands(shape[0], threads)
+  starts = [0]
+  for begin, end in bands:
+    starts.append(starts[-1] + uag.count_neighbor_edges(shape, search, begin, end))
+
+  plane = np.empty(shape, dtype=np.float64)
+  origin = np.empty(starts[-1], dtype=np.int64)
+  target = np.empty(starts[-1], dtype=np.int64)
+  weight = np.empty(starts[-1], dtype=np.float64)
+
+  '''
+  Calculate luminance of rows in a band.
+  '''
+  def calc_band_luminance(band):
+    uag.calc_luminance_plane(img[band[0]:band[1]], out=plane[band[0]:band[1]])
+
+  '''
+  Issue, weigh and pre-sort edges of a band.
+  '''
+  def build_band(index):
+    begin, end = bands[index]
+    part = slice(starts[index], starts[index+1])
+    origin[part], target[part] = uag.create_neighbor_index(shape, search, begin, end)
+    uag.calc_edge_weights(plane, origin[part], target[part], out=weight[part])
+    if not sort:
+      return None
+    local = uag.sort_edges(weight[part])
+    return (weight[part][local], local + starts[index])
+
+  with ThreadPoolExecutor(max_workers=threads) as executor:
+    list(executor.map(calc_band_luminance, bands))
+    # Luminance of the rows below must be ready before weighing edges
+    runs = list(executor.map(build_band, range(len(bands))))
+    order = merge_sorted_runs(runs, executor) if sort else None
+  return origin, target, weight, order
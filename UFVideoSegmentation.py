@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+from UFArrayUnionFind import ArrayUnionFind
+from UFArraySegment import train_sorted_edges
+import UFArrayGraph as uag
+
+'''
+Segmentation of a stream of frames with a fixed shape.
+Edge, union find and label buffers are allocated once and reused for every frame.
+With warm start, edges inside a segment of the previous frame are merged first
+on equal weights (and earlier by temporal_bias), so segments stay coherent in time.
+With temporal_bias, edges are not merged in weight order, so the internal difference
+of a component is kept as the largest merged weight.
+'''
+class UFVideoSegmentation:
+
+  '''
+  Initialize buffers for the frame shape.
+  @param shape         : frame shape (row, col[, rgb(a)])
+  @param tau_k         : merging super parameter
+  @param search        : search directions (drow, dcol)
+  @param warm_start    : order edges with labels of the previous frame
+  @param temporal_bias : weight added to edges across previous segments for ordering
+  @param backend       : merge loop backend (python, numba or auto)
+  '''
+  def __init__(self, shape, tau_k=4.5, search=uag.GRID_GRAPH_SEARCH, warm_start=False, temporal_bias=0.0, backend='auto'):
+    self.shape = tuple(shape)
+    self.tau_k = float(tau_k)
+    self.backend = backend
+    self.warm_start = warm_start
+    self.temporal_bias = temporal_bias
+    size = self.shape[0]*self.shape[1]
+    # Neighbor index is common to all frames
+    self.origin, self.target = uag.create_neighbor_index(self.shape, search)
+    edge_len = len(self.origin)
+    self.plane = np.empty(self.shape[:2], dtype=np.float64)
+    self.weight = np.empty(edge_len, dtype=np.float64)
+    self.key = np.empty(edge_len, dtype=np.float64)
+    self.work = np.empty(edge_len, dtype=np.float64)
+    self.cross = np.empty(edge_len, dtype=np.bool_)
+    self.origin_label = np.empty(edge_len, dtype=np.int64)
+    self.target_label = np.empty(edge_len, dtype=np.int64)
+    self.uf = ArrayUnionFind(size)
+    self.labels = np.empty(size, dtype=np.int64)
+    self.prev_labels = np.empty(size, dtype=np.int64)
+    self.has_prev = False
+
+  '''
+  Sort edges of the current frame.
+  @return numpy.ndarray : edge order
+  '''
+  def sort_edges(self):
+    if not (self.warm_start and self.has_prev):
+      return uag.sort_edges(self.weight)
+    # Edges across segments of the previous frame go later
+    np.take(self.prev_labels, self.origin, out=self.origin_label)
+    np.take(self.prev_labels, self.target, out=self.target_label)
+    np.not_equal(self.origin_label, self.target_label, out=self.cross)
+    np.multiply(self.cross, self.temporal_bias, out=self.key)
+    self.key += self.weight
+    return np.lexsort((self.cross, self.key))
+
+  '''
+  Segment a frame.
+  @note Returned labels are a reused buffer overwritten by the next frame.
+  @param frame : numpy array of the frame with the shape given at initialization
+  @return numpy.ndarray : root node id of each pixel (row, col)
+  '''
+  def segment_frame(self, frame):
+    if frame.shape != self.shape:
+      raise InvalidParameterException()
+    uag.calc_luminance_plane(frame, out=self.plane)
+    uag.calc_edge_weights(self.plane, self.origin, self.target, out=self.weight, work=self.work)
+    # Biased order is not by weight, so a lighter edge merged later must not lower Int(C)
+    keep_max = self.warm_start and self.has_prev and self.temporal_bias > 0
+    order = self.sort_edges()
+    self.uf.reset()
+    train_sorted_edges(self.uf, self.origin, self.target, self.weight, order, self.tau_k, backend=self.backend,
+      keep_max=keep_max)
+    self.uf.get_labels(out=self.labels)
+    if self.warm_start:
+      np.copyto(self.prev_labels, self.labels)
+      self.has_prev = True
+    return self.labels.reshape(self.shape[:2])
+
+  '''
+  Segment frames one by one.
+  @param frames : iterable of frames
+  @param copy   : yield copies of labels instead of the reused buffer
+  @return generator(numpy.ndarray) : labels of each frame
+  '''
+  def segment_stream(self, frames, copy=False):
+    for frame in frames:
+      labels = self.segment_frame(frame)
+      yield labels.copy() if copy else labels
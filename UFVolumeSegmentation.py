@@ -0,0 +1,147 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from ParameterExceptions import InvalidParameterException
+from UFArrayUnionFind import ArrayUnionFind
+from UFArraySegment import train_sorted_edges
+import UFArrayGraph as uag
+
+'''
+Create search directions (ddepth, drow, dcol) for the connectivity.
+Only the forward half is searched, so each edge is issued once.
+@param connectivity : 6 (faces), 18 (faces and edges) or 26 (faces, edges and corners)
+@return list((int, int, int)) : search directions
+'''
+def create_volume_search(connectivity):
+  max_axes = {6: 1, 18: 2, 26: 3}.get(connectivity)
+  if max_axes is None:
+    raise InvalidParameterException()
+  search = list()
+  for ddepth in (0, 1):
+    for drow in (-1, 0, 1):
+      for dcol in (-1, 0, 1):
+        dif = (ddepth, drow, dcol)
+        if dif <= (0, 0, 0):
+          continue
+        if sum(1 for d in dif if d != 0) > max_axes:
+          continue
+        search.append(dif)
+  return search
+
+
+'''
+Segmentation of volumes (depth, row, col[, rgb(a)]), e.g. CT stacks or video clips.
+Voxel ids are flat int64 indices (depth*img_row*img_col + row*img_col + col), so volumes
+over 2**31 voxels need no other id scheme.
+segment holds all edges in memory and merges them in sorted order.
+segment_slabs holds luminance and edges of only a slab of slices and the last slice of
+the previous slab, while union find and labels still cover the whole volume
+(about 33 bytes per voxel for ArrayUnionFind and 8 bytes for labels).
+Edges are sorted and merged slab by slab, so merges of a slab come after all merges
+of the previous slabs. The result equals segment when a slab covers the volume.
+'''
+class UFVolumeSegmentation:
+
+  '''
+  Initialize with the volume shape.
+  @param shape        : volume shape (depth, row, col[, rgb(a)])
+  @param tau_k        : merging super parameter
+  @param connectivity : 6, 18 or 26
+  @param backend      : merge loop backend (python, numba or auto)
+  '''
+  def __init__(self, shape, tau_k=4.5, connectivity=6, backend='auto'):
+    self.shape = tuple(int(length) for length in shape[:3])
+    self.tau_k = float(tau_k)
+    self.backend = backend
+    self.search = create_volume_search(connectivity)
+    self.slab_index = dict()
+
+  '''
+  Get number of voxels.
+  @return int : number of voxels
+  '''
+  def get_size(self):
+    return self.shape[0]*self.shape[1]*self.shape[2]
+
+  '''
+  Segment a whole volume in memory.
+  @param volume : numpy array (depth, row, col[, rgb(a)]), memmap can be used
+  @param out    : int64 array of the number of voxels to write labels into (None to allocate)
+  @return numpy.ndarray : root voxel id of each voxel (depth, row, col)
+  '''
+  def segment(self, volume, out=None):
+    origin, target = uag.create_neighbor_index(self.shape, self.search)
+    values = uag.calc_luminance_values(volume, 3)
+    weight = uag.calc_edge_weights(values, origin, target)
+    order = uag.sort_edges(weight)
+    uf = ArrayUnionFind(self.get_size())
+    train_sorted_edges(uf, origin, target, weight, order, self.tau_k, backend=self.backend)
+    return uf.get_labels(out).reshape(self.shape)
+
+  '''
+  Segment a volume given slice by slice.
+  @param slices    : iterable of slices (row, col[, rgb(a)]) from depth 0
+  @param slab_size : number of slices merged at once
+  @param out       : int64 array of the number of voxels to write labels into (None to allocate)
+  @return numpy.ndarray : root voxel id of each voxel (depth, row, col)
+  '''
+  def segment_slabs(self, slices, slab_size=16, out=None):
+    if slab_size < 1:
+      raise InvalidParameterException()
+    uf = ArrayUnionFind(self.get_size())
+    boundary = None
+    slab = list()
+    depth_begin = 0
+    for source in slices:
+      slab.append(uag.calc_luminance_values(source, 2))
+      if len(slab) == slab_size:
+        self.merge_slab(uf, boundary, slab, depth_begin)
+        depth_begin += len(slab)
+        boundary = slab[-1]
+        slab = list()
+    if slab:
+      self.merge_slab(uf, boundary, slab, depth_begin)
+      depth_begin += len(slab)
+    if depth_begin != self.shape[0]:
+      raise InvalidParameterException()
+    return uf.get_labels(out).reshape(self.shape)
+
+  '''
+  Merge edges of a slab and edges between the slab and the previous one.
+  @param uf          : ArrayUnionFind of the whole volume
+  @param boundary    : luminance of the last slice of the previous slab (None for the first slab)
+  @param slab        : luminance of slices in the slab
+  @param depth_begin : depth of the first slice in the slab
+  '''
+  def merge_slab(self, uf, boundary, slab, depth_begin):
+    slice_size = self.shape[1]*self.shape[2]
+    if boundary is None:
+      window = np.stack(slab)
+      offset = depth_begin*slice_size
+    else:
+      window = np.stack([boundary] + slab)
+      offset = (depth_begin - 1)*slice_size
+    origin, target = self.get_slab_index(window.shape[0], boundary is not None)
+    weight = uag.calc_edge_weights(window, origin, target)
+    order = uag.sort_edges(weight)
+    train_sorted_edges(uf, origin + offset, target + offset, weight, order, self.tau_k, backend=self.backend)
+
+  '''
+  Get edges of a window of slices.
+  Edges inside the boundary slice were merged with the previous slab and are dropped.
+  @param depth        : number of slices in the window
+  @param has_boundary : True if the first slice is the boundary of the previous slab
+  @return (numpy.ndarray, numpy.ndarray) : origin and target indices in the window
+  '''
+  def get_slab_index(self, depth, has_boundary):
+    key = (depth, has_boundary)
+    if key not in self.slab_index:
+      origin, target = uag.create_neighbor_index((depth,) + self.shape[1:], self.search)
+      if has_boundary:
+        # Search is forward, so target of an edge is never before its origin
+        valid = target >= self.shape[1]*self.shape[2]
+        origin = origin[valid]
+        target = target[valid]
+      self.slab_index[key] = (origin, target)
+    return self.slab_index[key]
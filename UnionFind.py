@@ -1,7 +1,5 @@
 # -*- coding:utf-8 -*-
 
-from UFGraphBasedSegment import *
-
 '''
 Implemnetation of Union Find Tree
 Value of table:
@@ -51,9 +49,11 @@ class UnionFind:
   @param id1 : component id to merge
   @param id2 : component id to merge
   @param edge_value : interested edge value
+  @param keep_max   : keep the largest internal difference of the two trees if larger than edge_value,
+                      for edges merged out of sorted order
   @return bool : True if merge occurred, else False
   '''
-  def union(self, id1, id2, edge_value):
+  def union(self, id1, id2, edge_value, keep_max=False):
     # Find root nodes of the specified component
     s1 = self.find(id1)
     s2 = self.find(id2)
@@ -62,6 +62,8 @@ class UnionFind:
       s2_id = - self.table[s2]
       r1 = self.root_dict[s1_id]
       r2 = self.root_dict[s2_id]
+      if keep_max:
+        edge_value = max(edge_value, r1.get_min_dif(), r2.get_min_dif())
       r1_rank = r1.get_rank()
       r2_rank = r2.get_rank()
       # Merge samller component to another one.
@@ -73,11 +75,21 @@ class UnionFind:
         r1.update(dif_rank=0, new_min_dif=edge_value, dif_size=r2.get_size())
         self.table[s2] = s1
       else:
-        r1.update(dif_rank=0, new_min_dif=edge_value, dif_size=r1.get_size())
+        r2.update(dif_rank=0, new_min_dif=edge_value, dif_size=r1.get_size())
         self.table[s1] = s2
       return True
     return False
 
+  '''
+  Detach a node from its tree and make it a new single node tree.
+  @note All nodes of the tree must be reset together, or the tree is broken.
+  @param id   : node id to reset
+  @param root : new root node of the single node tree
+  '''
+  def reset(self, id, root):
+    self.table[id] = -id
+    self.root_dict[id] = root
+
   '''
   Get root id and rank.
   @return (int, int) : root node id and size of the tree
@@ -87,6 +99,9 @@ class UnionFind:
     for i in range(len(self.table)):
       if self.table[i] < 0:
         root_id = -self.table[i]
+        # Excluded (masked) pixels have no root node
+        if root_id not in self.root_dict:
+          continue
         root = self.root_dict[root_id]
         ret.append((i, root.get_size()))
     return ret
@@ -97,3 +112,10 @@ class UnionFind:
   '''
   def get_all_union(self):
     return self.table
+
+  '''
+  Set union find table.
+  @param table : union find table (index 0 is empty)
+  '''
+  def set_all_union(self, table):
+    self.table = table
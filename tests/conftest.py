@@ -0,0 +1,10 @@
+# -*- coding:utf-8 -*-
+
+'''
+Modules of the repository are imported from its root
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
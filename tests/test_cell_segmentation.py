@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+
+'''
+Cells are connected and the cell segmentation keeps the quality of the exact engine
+'''
+
+import numpy as np
+import pytest
+
+import UFArrayGraph as uag
+import UFArraySegment as uas
+from UFArrayUnionFind import ArrayUnionFind
+import UFCellSegmentation as ucs
+import SegmentationEvaluation as se
+from UFBenchmark import create_synthetic_image
+
+'''
+Get if every cell is 4 connected.
+@param cells : cell id of each pixel (row, col)
+@return bool : True if connected
+'''
+def is_connected(cells):
+  pieces, piece_len = uag.label_flat_runs(cells, [(0, 1), (1, 0)])
+  return piece_len == len(np.unique(cells))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_seed_cells_are_connected(seed):
+  img = (np.random.default_rng(seed).random((37, 45, 3))*255).astype(np.uint8)
+  plane = uag.calc_luminance_plane(img)
+  cells, block_shape = ucs.create_seed_cells(plane, 4)
+  # Noise splits seeds of SLIC assignment
+  assert not is_connected(cells)
+  connected = ucs.connect_cells(cells)
+  assert is_connected(connected)
+  radius = ucs.calc_cell_radius(connected, block_shape, uag.GRID_GRAPH_SEARCH)
+  origin, target, weight = ucs.create_cell_edges(plane, connected, block_shape, uag.GRID_GRAPH_SEARCH, radius)
+  # Every adjacent pair of cells has an edge
+  pairs = set(zip(np.minimum(origin, target).tolist(), np.maximum(origin, target).tolist()))
+  right = connected[:, :-1] != connected[:, 1:]
+  for low, high in zip(connected[:, :-1][right].tolist(), connected[:, 1:][right].tolist()):
+    assert (min(low, high), max(low, high)) in pairs
+
+@pytest.mark.parametrize('backend', ['python', 'numba'])
+def test_merge_keeps_largest_internal_difference(backend):
+  if backend == 'numba':
+    pytest.importorskip('numba')
+  uf = ArrayUnionFind(3)
+  parent, rank, size, min_dif = uf.get_arrays()
+  min_dif[:] = [6.0, 2.0, 0.0]
+  origin = np.array([0, 1])
+  target = np.array([1, 2])
+  weight = np.array([1.0, 3.0])
+  order = np.arange(2)
+  uas.train_sorted_edges(uf, origin, target, weight, order, 100.0, backend=backend, keep_max=True)
+  assert min_dif[uf.find(0)] == 6.0
+  # Pixel kernel takes the edge as in sorted order
+  uf = ArrayUnionFind(3)
+  uf.get_arrays()[3][:] = [6.0, 2.0, 0.0]
+  uas.train_sorted_edges(uf, origin, target, weight, order, 100.0, backend=backend)
+  assert uf.get_arrays()[3][uf.find(0)] == 3.0
+
+def test_segments_follow_cells():
+  img = (np.random.default_rng(0).random((32, 32, 3))*255).astype(np.uint8)
+  segmentation = ucs.UFCellSegmentation(4.5, 4, 'seed')
+  labels = segmentation.segment(img)
+  cells, block_shape = segmentation.create_cells(uag.calc_luminance_plane(img))
+  # Pixels of a cell are in one segment
+  for cell in np.unique(cells).tolist():
+    assert len(np.unique(labels[cells == cell])) == 1
+
+@pytest.mark.parametrize('mode', ucs.CELL_MODES)
+def test_quality_against_exact_engine(mode):
+  img = create_synthetic_image(256, 256)
+  truth = se.create_synthetic_ground_truth(256, 256)
+  truth_len = len(np.unique(truth))
+  previous = None
+  for tau_k in (4.5, 50, 125, 300):
+    exact = se.evaluate(uas.segment_image(img, tau_k).get_labels().reshape(img.shape[:2]), truth)
+    cell = se.evaluate(ucs.segment_cells(img, tau_k, 4, mode), truth)
+    assert cell['asa'] >= exact['asa'] - 0.01
+    assert cell['undersegmentation_error'] <= exact['undersegmentation_error'] + 0.02
+    # Cells do not oversegment noise like pixels, and do not merge blocks away
+    assert truth_len <= cell['segments'] <= exact['segments']
+    # tau_k still controls the scale
+    if previous is not None:
+      assert cell['segments'] < previous
+    previous = cell['segments']
@@ -0,0 +1,46 @@
+# -*- coding:utf-8 -*-
+
+'''
+Checkpoint of another image content must not be resumed
+'''
+
+import numpy as np
+import pytest
+
+from ParameterExceptions import InvalidParameterException
+from TrainControl import CancelToken
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+
+'''
+Train cancelled at once, which leaves the sorted graph in the checkpoint.
+@param img        : source image
+@param checkpoint : checkpoint directory
+@param mask       : bool mask of pixels to segment
+'''
+def train_stopped(img, checkpoint, mask=None):
+  token = CancelToken()
+  token.cancel()
+  ggs = GridGraphSegmentation(img, None, 10, 125, mask=mask)
+  ggs.train(cancel_token=token, backend='python', checkpoint=checkpoint, checkpoint_interval=16)
+
+def test_resume_with_another_image_fails(tmp_path):
+  img = create_synthetic_image(16, 16, block=4)
+  train_stopped(img, str(tmp_path))
+  edited = img.copy()
+  edited[3, 5] ^= 1
+  with pytest.raises(InvalidParameterException):
+    GridGraphSegmentation(edited, None, 10, 125).resume(str(tmp_path), backend='python')
+  # The same content resumes
+  result = GridGraphSegmentation(img.copy(), None, 10, 125).resume(str(tmp_path), backend='python')
+  assert result.is_completed()
+
+def test_resume_with_another_mask_fails(tmp_path):
+  img = create_synthetic_image(16, 16, block=4)
+  mask = np.ones((16, 16), dtype=np.bool_)
+  mask[0, 0] = False
+  train_stopped(img, str(tmp_path), mask)
+  moved = np.ones((16, 16), dtype=np.bool_)
+  moved[0, 1] = False
+  with pytest.raises(InvalidParameterException):
+    GridGraphSegmentation(img, None, 10, 125, mask=moved).resume(str(tmp_path), backend='python')
@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+
+'''
+Compact mode keeps the same edges as MergedEdgeList after merges
+'''
+
+import numpy as np
+
+from Edge import CompactMergedEdgeList
+from SegmentationProcess import GridGraphSegmentation
+import GraphBasedSegment as gbs
+from UFBenchmark import create_synthetic_image
+
+def test_merge_moves_only_edges_of_the_component():
+  mel = CompactMergedEdgeList(6)
+  mel.add_difference(0, 1, 3.0)
+  mel.add_difference(1, 2, 5.0)
+  mel.add_difference(0, 2, 4.0)
+  mel.add_difference(3, 4, 1.0)
+  mel.merge(1, 0)
+  edges = dict(((id_set.get_id1(), id_set.get_id2()), value) for id_set, value in mel.get_edge_dict().items())
+  # Edge 0-1 is deleted, 1-2 joins 0-2 with the smaller difference
+  assert edges == {(0, 2): 4.0, (3, 4): 1.0}
+  # Lists of components have only their remaining edges
+  keys = dict((id, sorted(divmod(mel.keys[slot], 6) for slot in mel.get_slots(id))) for id in range(6))
+  assert keys == {0: [(0, 2)], 1: [], 2: [(0, 2)], 3: [(3, 4)], 4: [(3, 4)], 5: []}
+
+def test_rehash_keeps_lists_of_components():
+  mel = CompactMergedEdgeList(40)
+  # Table grows from the smallest capacity and deleted slots are dropped
+  for id in range(1, 40):
+    mel.add_difference(0, id, float(id))
+    mel.add_difference(id - 1, id, 0.5)
+  for id in range(1, 39, 2):
+    mel.merge(id, id + 1)
+  # Each live edge is in the lists of both its ids
+  listed = list()
+  for id in range(40):
+    for slot in mel.get_slots(id):
+      assert id in divmod(mel.keys[slot], 40)
+      listed.append(slot)
+  assert len(listed) == 2 * len(set(listed)) == 2 * len(mel.get_edge_dict())
+
+def test_compact_mode_segments_the_same():
+  img = create_synthetic_image(24, 24, block=6)
+  labels = list()
+  for compact in (False, True):
+    ggs = GridGraphSegmentation(img, None, 10, gbs.GBSConfig(tau_k=125), compact=compact)
+    ggs.set_result_format('npy')
+    ggs.train()
+    labels.append(ggs.get_result_image())
+  assert np.array_equal(labels[0], labels[1])
@@ -0,0 +1,61 @@
+# -*- coding:utf-8 -*-
+
+'''
+Concurrent graph based segmentations with different parameters.
+Segmentations run in a thread pool while the module default is changed,
+and each label map must be the same as the one segmented alone.
+'''
+
+# Import required packages
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+from SegmentationProcess import GridGraphSegmentation
+import GraphBasedSegment as gbs
+from UFBenchmark import create_synthetic_image
+
+# Specify tau_k parameters segmented at once.
+tau_k_list = [0.5, 1.4, 4.5, 20, 125]
+# Specify number of threads and rounds.
+threads = 8
+rounds = 4
+
+'''
+Restore the module default changed by the segmentations.
+'''
+@pytest.fixture
+def default_tau_k():
+  tau_k = gbs.tau_k
+  try:
+    yield tau_k
+  finally:
+    gbs.tau_k = tau_k
+
+'''
+Segment the image with a config.
+@param img   : source image
+@param tau_k : tau_k of the run
+@return numpy.ndarray : label map
+'''
+def segment(img, tau_k):
+  ggs = GridGraphSegmentation(img, None, 10, gbs.GBSConfig(tau_k=tau_k))
+  ggs.set_result_format('npy')
+  # Module default must not affect runs with their own config
+  gbs.tau_k = -tau_k
+  ggs.train()
+  return ggs.get_result_image()
+
+def test_concurrent_segmentations_are_the_same_as_alone(default_tau_k):
+  # Small image, segmentation without Union Find is slow.
+  img = create_synthetic_image(16, 16, block=4)
+  # Label maps segmented alone
+  expected = dict((tau_k, segment(img, tau_k)) for tau_k in tau_k_list)
+
+  # Segment all parameters at once
+  jobs = tau_k_list * rounds
+  with ThreadPoolExecutor(max_workers=threads) as executor:
+    results = list(executor.map(lambda tau_k: segment(img, tau_k), jobs))
+
+  for tau_k, labels in zip(jobs, results):
+    assert np.array_equal(labels, expected[tau_k]), "tau_k {0} differs from the segmentation alone".format(tau_k)
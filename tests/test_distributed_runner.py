@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+'''
+Worker processes segment all jobs of a work queue, taking over expired leases
+'''
+
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+import DistributedRunner as dr
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+
+'''
+Number of worker processes
+'''
+WORKERS = 3
+
+'''
+Create a process of workers.
+@param img : source image
+@return GridGraphSegmentation : process
+'''
+def create_process(img):
+  return GridGraphSegmentation(img, None, 10, 125)
+
+'''
+Write source images and jobs.
+@param path : directory
+@param size : number of jobs
+@return list((str, str)) : source path and destination path
+'''
+def write_jobs(path, size=6):
+  jobs = list()
+  for number in range(size):
+    src = os.path.join(str(path), 'src{0}.png'.format(number))
+    Image.fromarray(create_synthetic_image(16, 16, block=4, seed=number)).save(src)
+    jobs.append((src, os.path.join(str(path), 'dst{0}.npy'.format(number))))
+  return jobs
+
+'''
+Check results of all jobs against segmentation in this process.
+@param jobs : source path and destination path
+'''
+def check_results(jobs):
+  for number, (src, dst) in enumerate(jobs):
+    process = create_process(create_synthetic_image(16, 16, block=4, seed=number))
+    process.set_result_format('npy')
+    process.train(backend='python')
+    assert np.array_equal(np.load(dst), process.get_result_image())
+  # Temporary results are renamed
+  assert [name for name in os.listdir(os.path.dirname(jobs[0][1])) if '.part-' in name] == list()
+
+def test_file_queue_workers_take_over_expired_lease(tmp_path):
+  jobs = write_jobs(tmp_path)
+  queue_path = str(tmp_path / 'queue')
+  work_queue = dr.create_file_queue(queue_path, jobs, lease_seconds=2.0)
+  # A crashed worker left the lease of job 0
+  lease = work_queue.get_lease_file(0)
+  with open(lease, 'w') as f:
+    f.write('crashed')
+  expired = time.time() - 100
+  os.utime(lease, (expired, expired))
+
+  codes = dr.run_local_workers(queue_path, create_process, WORKERS, lease_seconds=2.0,
+    train_options={'backend': 'python'}, result_format='npy', poll=0.1)
+  assert codes == [0]*WORKERS
+  assert work_queue.get_progress() == (len(jobs), len(jobs))
+  assert work_queue.get_errors() == list()
+  assert work_queue.get_owner(0) is None
+  with open(work_queue.get_done_file(0)) as f:
+    assert 'crashed' not in f.read()
+  check_results(jobs)
+
+def test_server_workers_take_over_expired_lease(tmp_path):
+  jobs = write_jobs(tmp_path)
+  server = dr.WorkQueueServer(jobs, lease_seconds=1.0).start()
+  try:
+    # A crashed worker claimed a job and never renews it
+    crashed = dr.TCPWorkQueue(server.get_address())
+    number, spec = crashed.claim('crashed')
+    crashed.close()
+
+    codes = dr.run_local_workers(server.get_address(), create_process, WORKERS,
+      train_options={'backend': 'python'}, result_format='npy', poll=0.1)
+    assert codes == [0]*WORKERS
+    assert server.get_progress() == (len(jobs), len(jobs))
+    assert server.get_errors() == list()
+    assert server.done[number][0] != 'crashed'
+  finally:
+    server.shutdown()
+  check_results(jobs)
+
+def test_run_worker_at_returns_stats(tmp_path, capsys):
+  jobs = write_jobs(tmp_path, 2)
+  queue_path = str(tmp_path / 'queue')
+  dr.create_file_queue(queue_path, jobs)
+  stats = dr.run_worker_at(queue_path, create_process, worker='single',
+    train_options={'backend': 'python'}, result_format='npy')
+  assert stats.get_name() == 'single'
+  assert stats.get_items() == len(jobs)
+  assert 'busy' not in capsys.readouterr().out
+  check_results(jobs)
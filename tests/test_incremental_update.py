@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+
+'''
+Incremental update must give the same partition as a full train of the edited image
+'''
+
+import numpy as np
+import pytest
+
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+
+'''
+Get if two label maps are the same partition.
+@param labels1 : label map
+@param labels2 : label map
+@return bool : True for the same partition
+'''
+def is_same_partition(labels1, labels2):
+  pairs = set(zip(labels1.ravel().tolist(), labels2.ravel().tolist()))
+  return len(pairs) == len(np.unique(labels1)) == len(np.unique(labels2))
+
+'''
+Train a process on an image.
+@param img   : source image
+@param tau_k : tau_k of the run
+@return GridGraphSegmentation : trained process
+'''
+def train(img, tau_k):
+  ggs = GridGraphSegmentation(img, None, 10, tau_k)
+  ggs.set_result_format('npy')
+  ggs.train()
+  return ggs
+
+@pytest.mark.parametrize('seed', range(12))
+def test_update_matches_full_train(seed):
+  rng = np.random.default_rng(seed)
+  if seed % 2:
+    img = create_synthetic_image(24, 24, block=6).copy()
+  else:
+    img = (rng.random((20, 20, 3))*255).astype(np.uint8)
+  tau_k = [4.5, 125, 300][seed % 3]
+  ggs = train(img, tau_k)
+
+  edited = img.copy()
+  top, left = rng.integers(2, 12, 2)
+  edited[top:top + 4, left:left + 4] = rng.integers(0, 255, 3)
+  ggs.update(edited, (top, left, top + 4, left + 4))
+
+  expected = train(edited, tau_k).get_result_image()
+  labels = ggs.get_result_image()
+  assert is_same_partition(labels, expected)
+  window = (slice(max(0, top - 2), top + 6), slice(max(0, left - 2), left + 6))
+  assert is_same_partition(labels[window], expected[window])
+
+def test_update_accepts_buffer_input():
+  img = create_synthetic_image(16, 16, block=4).copy()
+  ggs = train(img, 125)
+  edited = img.copy()
+  edited[4:8, 4:8] = 0
+  ggs.update(memoryview(edited), (4, 4, 8, 8))
+  assert is_same_partition(ggs.get_result_image(), train(edited, 125).get_result_image())
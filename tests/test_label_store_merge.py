@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+
+'''
+merge_shards run again after a crash gives each record once
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+import LabelStore as ls
+
+'''
+Crash of the merging process
+'''
+class Crash(Exception):
+  pass
+
+'''
+Write shards of label maps with keys.
+@param path : store directory
+@return dict(int, numpy.ndarray) : label map of each key
+'''
+def write_shards(path):
+  rng = np.random.default_rng(0)
+  expected = dict()
+  for shard in range(3):
+    # Small chunks to merge several chunks of a shard
+    with ls.LabelStoreWriter(path, shard=shard, chunk_size=256) as writer:
+      for number in range(4):
+        key = shard*10 + number
+        expected[key] = rng.integers(0, 5, (6, 7))
+        writer.append(expected[key], key=key)
+  return expected
+
+'''
+Check records of the store.
+@param path     : store directory
+@param expected : label map of each key
+'''
+def check_store(path, expected):
+  with ls.LabelStoreReader(path) as reader:
+    assert len(reader) == len(expected)
+    assert sorted(reader.get_key(number) for number in range(len(reader))) == sorted(expected.keys())
+    for key, labels in expected.items():
+      compact, sizes = ls.compact_labels(labels)
+      number = reader.find(key)
+      assert np.array_equal(reader.get_labels(number), compact)
+      assert np.array_equal(reader.get_sizes(number), sizes)
+  assert ls.get_shards(path) == list()
+  assert [name for name in os.listdir(path) if name.startswith(ls.MERGED_PREFIX)] == list()
+
+'''
+Let os.replace crash at a call.
+@param monkeypatch : pytest monkeypatch
+@param crash_at    : function of (source, destination) telling when to crash
+'''
+def crash_replace(monkeypatch, crash_at):
+  replace = os.replace
+  def crashing_replace(source, destination):
+    if crash_at(source, destination):
+      raise Crash()
+    replace(source, destination)
+  monkeypatch.setattr(ls.os, 'replace', crashing_replace)
+
+def test_rerun_after_crash_between_append_and_remove(tmp_path, monkeypatch):
+  path = str(tmp_path)
+  expected = write_shards(path)
+  # The index of shard 1 is appended, then the shard is not removed
+  crash_replace(monkeypatch, lambda source, destination:
+    os.path.basename(destination) == ls.MERGED_PREFIX + '1')
+  with pytest.raises(Crash):
+    ls.merge_shards(path)
+  monkeypatch.undo()
+  assert ls.merge_shards(path) == len(expected)
+  check_store(path, expected)
+
+def test_rerun_after_crash_in_remove(tmp_path, monkeypatch):
+  path = str(tmp_path)
+  expected = write_shards(path)
+  rmtree = ls.shutil.rmtree
+  def crashing_rmtree(target):
+    # Removal is cut after the shard index
+    os.remove(os.path.join(target, 'index.bin'))
+    raise Crash()
+  monkeypatch.setattr(ls.shutil, 'rmtree', crashing_rmtree)
+  with pytest.raises(Crash):
+    ls.merge_shards(path)
+  monkeypatch.setattr(ls.shutil, 'rmtree', rmtree)
+  assert ls.merge_shards(path) == len(expected)
+  check_store(path, expected)
+
+def test_rerun_after_crash_in_chunk_renames(tmp_path, monkeypatch):
+  path = str(tmp_path)
+  expected = write_shards(path)
+  # Second chunk of shard 2 is not renamed
+  crash_replace(monkeypatch, lambda source, destination:
+    source == os.path.join(path, ls.SHARD_PREFIX + '2', ls.get_chunk_name(1)))
+  with pytest.raises(Crash):
+    ls.merge_shards(path)
+  monkeypatch.undo()
+  assert ls.merge_shards(path) == len(expected)
+  check_store(path, expected)
@@ -0,0 +1,25 @@
+# -*- coding:utf-8 -*-
+
+'''
+Masked pixels are -1 in npy results as in segment_masked_image
+'''
+
+import numpy as np
+import pytest
+
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+import UFArraySegment as uas
+
+@pytest.mark.parametrize('backend', ['dict', 'python'])
+def test_npy_result_marks_masked_pixels(backend):
+  img = create_synthetic_image(16, 16, block=4)
+  mask = np.ones((16, 16), dtype=np.bool_)
+  mask[2:6, 3:9] = False
+  ggs = GridGraphSegmentation(img, None, 10, 125, mask=mask)
+  ggs.set_result_format('npy')
+  ggs.train(backend=backend)
+  labels = ggs.get_result_image()
+  expected = uas.segment_masked_image(img, mask, 125, backend='python')
+  assert np.array_equal(labels == -1, expected == -1)
+  assert (labels[mask] > 0).all()
@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+
+'''
+Runners in several processes append to one label store without sharing shards
+'''
+
+import multiprocessing
+import os
+
+import numpy as np
+from PIL import Image
+
+import LabelStore as ls
+from PipelineRunner import PipelineRunner
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+
+'''
+Create a process of runners.
+@param img : source image
+@return GridGraphSegmentation : process
+'''
+def create_process(img):
+  return GridGraphSegmentation(img, None, 10, 125)
+
+'''
+Write source images of keys.
+@param path : directory
+@param keys : keys of the images
+@return list((str, int)) : source path and key
+'''
+def write_jobs(path, keys):
+  jobs = list()
+  for key in keys:
+    src = os.path.join(str(path), 'src{0}.png'.format(key))
+    Image.fromarray(create_synthetic_image(16, 16, block=4, seed=key)).save(src)
+    jobs.append((src, key))
+  return jobs
+
+'''
+Run jobs into a label store.
+@param store : label store directory
+@param jobs  : source path and key
+'''
+def run_jobs(store, jobs):
+  runner = PipelineRunner(create_process, readers=1, workers=1, writers=2, label_store=store,
+    train_options={'backend': 'python'})
+  runner.run(jobs)
+  assert runner.get_errors() == list()
+
+'''
+Run jobs in other processes at once.
+@param store    : label store directory
+@param job_sets : jobs of each process
+'''
+def run_processes(store, job_sets):
+  context = multiprocessing.get_context('fork')
+  processes = [context.Process(target=run_jobs, args=(store, jobs)) for jobs in job_sets]
+  for process in processes:
+    process.start()
+  for process in processes:
+    process.join()
+    assert process.exitcode == 0
+
+'''
+Check labels of keys in the store.
+@param store : label store directory
+@param keys  : keys expected once each
+'''
+def check_store(store, keys):
+  with ls.LabelStoreReader(store) as reader:
+    assert sorted(reader.get_key(number) for number in range(len(reader))) == sorted(keys)
+    for key in keys:
+      process = create_process(create_synthetic_image(16, 16, block=4, seed=key))
+      process.set_result_format('npy')
+      process.train(backend='python')
+      expected, sizes = ls.compact_labels(process.get_result_image())
+      assert np.array_equal(reader.get_labels(reader.find(key)), expected)
+
+def test_runner_processes_append_to_own_shards(tmp_path):
+  store = str(tmp_path / 'store')
+  run_processes(store, [write_jobs(tmp_path, range(0, 4)), write_jobs(tmp_path, range(4, 8))])
+  # Runners leave shards to the caller, nothing is merged yet
+  assert len(ls.get_shards(store)) >= 2
+  assert len(ls.read_index(store)) == 0
+  assert ls.merge_shards(store) == 8
+  check_store(store, range(8))
+
+  # Another run appends with keys of the caller
+  run_processes(store, [write_jobs(tmp_path, range(100, 103))])
+  assert ls.merge_shards(store) == 11
+  check_store(store, list(range(8)) + list(range(100, 103)))
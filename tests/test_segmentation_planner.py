@@ -0,0 +1,17 @@
+# -*- coding:utf-8 -*-
+
+'''
+Memory estimates of the planner are not below measured peaks
+'''
+
+import pytest
+
+import SegmentationPlanner as splan
+from UFBenchmark import create_synthetic_image, measure_peak_memory
+
+@pytest.mark.parametrize('engine', splan.get_available_engines())
+@pytest.mark.parametrize('graph', ['grid', 'nn'])
+def test_estimate_is_not_below_measured_peak(engine, graph):
+  img = create_synthetic_image(20, 20, block=8)
+  plan = splan.estimate(img.shape[:2], engine, graph, 3)
+  assert plan.get_memory() >= measure_peak_memory(plan, img)
@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+
+'''
+Counters of train are recorded by the tracer, not printed
+'''
+
+from TraceProfiler import TraceRecorder
+from TrainControl import CancelToken
+from UFSegmentationProcess import GridGraphSegmentation
+from UFBenchmark import create_synthetic_image
+import UFArraySegment as uas
+
+'''
+Get args of recorded spans by name.
+@param tracer : TraceRecorder
+@return dict : args by span name
+'''
+def get_span_args(tracer):
+  return dict((event['name'], event['args']) for event in tracer.get_events())
+
+def test_pruned_train_records_counters_silently(capsys):
+  img = create_synthetic_image(16, 16, block=4)
+  tracer = TraceRecorder()
+  ggs = GridGraphSegmentation(img, None, 10, 125)
+  ggs.set_result_format('npy')
+  ggs.set_tracer(tracer)
+  ggs.train(backend='python', prune=True)
+  args = get_span_args(tracer)
+  assert args['merge_pruned']['sorted'] + args['merge_pruned']['pruned'] == args['merge_pruned']['edges']
+  out = capsys.readouterr().out
+  assert 'pruned' not in out and 'edge len' not in out
+
+def test_segment_image_records_counters_silently(capsys):
+  img = create_synthetic_image(16, 16, block=4)
+  tracer = TraceRecorder()
+  uas.segment_image(img, 125, backend='python', prune=True, tracer=tracer)
+  args = tracer.get_events()[0]['args']
+  assert args['sorted'] + args['pruned'] == args['edges']
+  assert capsys.readouterr().out == ''
+
+def test_premerged_train_records_runs_silently(capsys):
+  img = create_synthetic_image(16, 16, block=4)
+  for backend in ('dict', 'python'):
+    tracer = TraceRecorder()
+    ggs = GridGraphSegmentation(img, None, 10, 125)
+    ggs.set_result_format('npy')
+    ggs.set_tracer(tracer)
+    ggs.train(backend=backend, premerge=True)
+    assert get_span_args(tracer)['create_run_graph']['runs'] > 0
+  out = capsys.readouterr().out
+  assert 'runs' not in out and 'phase' not in out
+
+def test_stopped_train_is_silent(capsys):
+  img = create_synthetic_image(16, 16, block=4)
+  ggs = GridGraphSegmentation(img, None, 10, 125)
+  ggs.set_result_format('npy')
+  token = CancelToken()
+  token.cancel()
+  result = ggs.train(cancel_token=token, check_interval=1)
+  assert not result.is_completed()
+  out = capsys.readouterr().out
+  assert 'phase' not in out and 'edge len' not in out
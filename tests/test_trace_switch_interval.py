@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+
+'''
+Sampled spans restore the process wide switch interval only after the last span
+'''
+
+import sys
+import threading
+
+from TraceProfiler import TraceRecorder
+
+def test_overlapping_spans_restore_switch_interval():
+  original = sys.getswitchinterval()
+  recorder = TraceRecorder(sample=True, sample_interval=0.0005)
+  entered = threading.Event()
+  release = threading.Event()
+
+  def run_span():
+    with recorder.sample('worker'):
+      entered.set()
+      release.wait()
+
+  worker = threading.Thread(target=run_span)
+  span = recorder.sample('main')
+  span.__enter__()
+  worker.start()
+  entered.wait()
+  # The first span exits while the other one is sampling
+  span.__exit__(None, None, None)
+  assert sys.getswitchinterval() == 0.0005
+  release.set()
+  worker.join()
+  assert sys.getswitchinterval() == original
+
+def test_nested_spans_restore_switch_interval():
+  original = sys.getswitchinterval()
+  recorder = TraceRecorder(sample=True, sample_interval=0.0005)
+  with recorder.sample('outer'):
+    with recorder.sample('inner'):
+      pass
+    assert sys.getswitchinterval() == 0.0005
+  assert sys.getswitchinterval() == original
@@ -0,0 +1,31 @@
+# -*- coding:utf-8 -*-
+
+'''
+Frame stream segmentation with a biased warm start keeps internal differences
+'''
+
+import numpy as np
+
+from UFVideoSegmentation import UFVideoSegmentation
+
+'''
+Get internal difference of the component of a pixel.
+@param video : UFVideoSegmentation
+@param pixel : pixel id
+@return float : internal difference
+'''
+def get_internal_difference(video, pixel):
+  parent, rank, size, min_dif = video.uf.get_arrays()
+  return min_dif[video.labels[pixel]]
+
+def test_biased_warm_start_keeps_largest_merged_weight():
+  video = UFVideoSegmentation((1, 3), tau_k=1, warm_start=True, temporal_bias=100, backend='python')
+  # Pixels 0 and 1 are one segment, pixel 2 is another
+  labels = video.segment_frame(np.array([[0, 0, 100]], dtype=np.uint8))
+  assert labels[0, 0] == labels[0, 1] != labels[0, 2]
+
+  # Edge 0-1 (10) is merged first, the lighter edge 1-2 (2) crosses segments and is merged later
+  video.tau_k = 20.0
+  labels = video.segment_frame(np.array([[0, 10, 12]], dtype=np.uint8))
+  assert labels[0, 0] == labels[0, 1] == labels[0, 2]
+  assert get_internal_difference(video, 0) == 10
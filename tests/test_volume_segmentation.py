@@ -0,0 +1,37 @@
+# -*- coding:utf-8 -*-
+
+'''
+Voxel ids of volumes are int64 flat indices, also over 2**31 voxels
+'''
+
+import numpy as np
+
+from UFVolumeSegmentation import UFVolumeSegmentation
+import UFArrayGraph as uag
+
+def test_slab_index_of_volume_over_int32():
+  # 2.4 * 10**9 voxels, only edges of the last two slices are created
+  shape = (40000, 300, 200)
+  vs = UFVolumeSegmentation(shape, connectivity=26)
+  slice_size = shape[1]*shape[2]
+  assert vs.get_size() > 2**31
+
+  # Last slab of one slice after the boundary slice, offset as merge_slab
+  origin, target = vs.get_slab_index(2, True)
+  offset = (shape[0] - 2)*slice_size
+  origin = origin + offset
+  target = target + offset
+  assert origin.dtype == np.int64 and target.dtype == np.int64
+
+  expected_origin, expected_target = uag.create_neighbor_index(shape, vs.search, shape[0] - 2, shape[0])
+  valid = expected_target >= (shape[0] - 1)*slice_size
+  assert np.array_equal(origin, expected_origin[valid])
+  assert np.array_equal(target, expected_target[valid])
+  assert target.max() == vs.get_size() - 1
+  assert origin.min() == (shape[0] - 2)*slice_size
+
+def test_slabs_covering_the_volume_are_the_same_as_segment():
+  rng = np.random.RandomState(5)
+  volume = rng.randint(0, 256, (6, 7, 5)).astype(np.uint8)
+  vs = UFVolumeSegmentation(volume.shape, 20, connectivity=18, backend='python')
+  assert np.array_equal(vs.segment(volume), vs.segment_slabs(iter(volume), slab_size=6))